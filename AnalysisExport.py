@@ -0,0 +1,281 @@
+import os
+import json
+import struct
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from DetectionCache import DetectionCache
+from Spectrum import Spectrum, load_spectrum
+
+'''
+Access to the toolkit's loaded data for analysis notebooks, so they do not re-parse the capture CSVs
+and the _peaks.csv / _combined.csv outputs:
+- Spectra: spectrum_arrays() gives read-only NumPy views of a loaded Spectrum (counts in their
+  compact dtype, x-axis, bin edges); spectrum_table() an Arrow table in the capture's CSV layout
+  (x_values, then one column per channel) whose columns wrap the same memory.
+- Detected peaks: peaks_arrays() / peaks_table() of (channel, position) lists as the GUI and the
+  detection cache hold them; cached_peaks_table() has every result of a folder's detection cache.
+- Calibrations: calibration_arrays() / calibration_table() of per-file, per-channel peak positions and
+  gains, from a FolderPipeline (its artifacts, not its exported CSV) or a GainDriftTracker.
+- Shared memory: share_spectrum() copies a spectrum, its peaks and gains once into a named block, and
+  attach_spectrum() in another process (e.g. a notebook next to the running GammaToolsWindow, whose
+  "Share With Notebook" action shares the selected file) maps it without copying.
+Arrow tables need pyarrow; NumPy arrays are used as-is (numeric columns are not copied).
+
+Example (notebook):
+    from AnalysisExport import load_arrays, attach_spectrum
+    arrays = load_arrays("data/capture_1.csv")
+    with attach_spectrum("gamma_tools_1234_0") as shared:
+        counts = shared.spectrum.counts
+'''
+
+SHARED_MAGIC = b"GSPECSHM"
+# Magic and JSON header length at the start of a shared block
+_SHARED_PREFIX = struct.Struct("<8sQ")
+# Arrays in a shared block start on cache-line boundaries
+SHARED_ALIGNMENT = 64
+
+# Blocks created by this process, which its resource tracker must keep tracking
+_owned_blocks = set()
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Arrow tables need the 'pyarrow' package.")
+
+
+def _read_only(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+###### SPECTRA ######
+
+def spectrum_arrays(spectrum):
+    """
+    Read-only views of a Spectrum's arrays; no data is copied.
+
+    Returns:
+        dict: "x_values" and "edges" (float64), "counts" shaped (num_channels, num_bins) in the
+            spectrum's compact dtype, and "channels", the channel names.
+    """
+    return {"x_values": _read_only(spectrum.x_values), "edges": _read_only(spectrum.edges),
+            "counts": _read_only(spectrum.counts), "channels": spectrum.channel_names()}
+
+
+def load_arrays(file_path, calibrated=True, engine=None):
+    """spectrum_arrays() of a capture file, loaded (or shared from the cache) like the GUI loads it."""
+    return spectrum_arrays(load_spectrum(file_path, calibrated, engine=engine))
+
+
+def spectrum_table(spectrum):
+    """
+    Arrow table of a Spectrum in its CSV layout: an "x_values" column, then one column per channel.
+    Every column wraps a row of the spectrum's arrays without copying.
+
+    Returns:
+        pa.Table: With the file name and calibration flag in the schema metadata.
+    """
+    _require_pyarrow()
+    columns = {"x_values": pa.array(spectrum.x_values)}
+    for name, counts in zip(spectrum.channel_names(), spectrum.counts):
+        columns[name] = pa.array(counts)
+    return pa.table(columns, metadata={"file": spectrum.name or "", "calibrated": str(bool(spectrum.calibrated))})
+
+
+###### PEAKS AND CALIBRATIONS ######
+
+def peaks_arrays(peaks):
+    """
+    Detected peaks as columns.
+
+    Parameters:
+        peaks (list): (channel name, peak position) pairs, as listed in the GUI and the detection cache.
+
+    Returns:
+        dict: "channel" (names), "channel_index" (-1 for names that are not Channel_<n>) and "position".
+    """
+    channels = np.array([channel for channel, _ in peaks], dtype=object)
+    indices = [0 if channel == "Single_Channel" else int(channel.split('_')[1])
+               if channel.startswith("Channel_") and channel.split('_')[1].isdigit() else -1 for channel in channels]
+    return {"channel": channels, "channel_index": np.array(indices, dtype=np.int64),
+            "position": np.array([position for _, position in peaks], dtype=np.float64)}
+
+
+def peaks_table(peaks, file_name=None):
+    """Arrow version of peaks_arrays(), with a "file" column when a file name is given."""
+    _require_pyarrow()
+    arrays = peaks_arrays(peaks)
+    columns = {} if file_name is None else {"file": pa.array([file_name] * len(peaks), type=pa.string())}
+    columns.update(channel=pa.array(list(arrays["channel"]), type=pa.string()),
+                   channel_index=pa.array(arrays["channel_index"]), position=pa.array(arrays["position"]))
+    return pa.table(columns)
+
+
+def cached_peaks_table(folder_path):
+    """
+    Every detection result stored in a folder's detection cache, manual fixes applied, one row per peak.
+
+    Returns:
+        pa.Table: Columns file, selection, calibrated, created, channel, channel_index, position.
+    """
+    _require_pyarrow()
+    rows = {"file": [], "selection": [], "calibrated": [], "created": [], "channel": [], "channel_index": [], "position": []}
+    for result in DetectionCache(folder_path).results():
+        arrays = peaks_arrays(result["peaks"])
+        for key in ("file", "selection", "calibrated", "created"):
+            rows[key].extend([result[key]] * len(result["peaks"]))
+        rows["channel"].extend(arrays["channel"])
+        rows["channel_index"].extend(arrays["channel_index"])
+        rows["position"].extend(arrays["position"])
+    return pa.table({
+        "file": pa.array(rows["file"], type=pa.string()), "selection": pa.array(rows["selection"], type=pa.string()),
+        "calibrated": pa.array(rows["calibrated"], type=pa.bool_()), "created": pa.array(rows["created"], type=pa.float64()),
+        "channel": pa.array(rows["channel"], type=pa.string()),
+        "channel_index": pa.array(rows["channel_index"], type=pa.int64()), "position": pa.array(rows["position"], type=pa.float64()),
+    })
+
+
+def calibration_arrays(source):
+    """
+    Peak position and gain of every file and channel.
+
+    Parameters:
+        source: A FolderPipeline (read from its stage artifacts) or a GainDriftTracker after track().
+
+    Returns:
+        dict: Equal-length arrays "file", "channel_index", "peak" and "gain", one element per file
+            and channel. Tracker positions are flattened views of its positions array.
+    """
+    if hasattr(source, "calibrations"):
+        return source.calibrations()
+    num_files, num_channels = source.positions.shape
+    return {"file": np.repeat(np.array(source.file_names, dtype=object), num_channels),
+            "channel_index": np.tile(np.arange(num_channels), num_files),
+            "peak": source.positions.reshape(-1), "gain": source.gains().reshape(-1)}
+
+
+def calibration_table(source):
+    """Arrow version of calibration_arrays()."""
+    _require_pyarrow()
+    arrays = calibration_arrays(source)
+    return pa.table({"file": pa.array(list(arrays["file"]), type=pa.string()),
+                     "channel_index": pa.array(arrays["channel_index"]),
+                     "peak": pa.array(arrays["peak"]), "gain": pa.array(arrays["gain"])})
+
+
+###### SHARED MEMORY ######
+
+def _align(offset):
+    return -(-offset // SHARED_ALIGNMENT) * SHARED_ALIGNMENT
+
+
+class SharedSpectrum:
+    """
+    A Spectrum, its detected peaks and channel gains in a named shared-memory block.
+
+    The process that shares it (share_spectrum) owns the block and removes it with close(); other
+    processes map it with attach_spectrum() and see the same memory, read-only.
+
+    Attributes:
+        name (str): Shared-memory block name, passed to attach_spectrum() in the other process.
+        spectrum (Spectrum): Spectrum whose counts and x-axis live in the block.
+        peaks (list): (channel name, peak position) pairs.
+        gains (np.ndarray): Gain per channel, or None.
+    """
+
+    def __init__(self, block, owner):
+        self._block = block
+        self._owner = owner
+        magic, header_size = _SHARED_PREFIX.unpack_from(block.buf, 0)
+        if magic != SHARED_MAGIC:
+            raise ValueError(f"Shared memory block {block.name} does not hold a spectrum.")
+        header = json.loads(bytes(block.buf[_SHARED_PREFIX.size:_SHARED_PREFIX.size + header_size]))
+        x_values = np.ndarray((header["num_bins"],), np.float64, block.buf, header["x_offset"])
+        counts = np.ndarray(tuple(header["shape"]), np.dtype(header["dtype"]), block.buf, header["counts_offset"])
+        if not owner:
+            x_values.flags.writeable = False
+            counts.flags.writeable = False
+        self.name = block.name
+        self.spectrum = Spectrum(counts, x_values, header["calibrated"], header["file"], header["single_channel"])
+        self.peaks = [tuple(peak) for peak in header["peaks"]]
+        self.gains = None if header["gains"] is None else np.array(header["gains"], dtype=np.float64)
+
+    def close(self):
+        """Unmap the block (removing it when this process shared it); the spectrum is unusable afterwards."""
+        self.spectrum = None
+        try:
+            self._block.close()
+        except BufferError:
+            # Arrays taken from the spectrum still point into the block; it is unmapped when they go
+            print(f"Shared spectrum {self.name} is still referenced and stays mapped.")
+        if self._owner:
+            self._block.unlink()
+            _owned_blocks.discard(self.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def share_spectrum(spectrum, peaks=None, gains=None, name=None):
+    """
+    Copy a Spectrum (with its detected peaks and channel gains) into a new shared-memory block.
+
+    Parameters:
+        spectrum (Spectrum): Spectrum to share; its counts keep their compact dtype.
+        peaks (list): (channel name, peak position) pairs.
+        gains (array-like): Gain per channel.
+        name (str): Block name; a unique one is generated when None.
+
+    Returns:
+        SharedSpectrum: The owner's handle; keep it until the other processes are done, then close() it.
+    """
+    header = {"file": spectrum.name, "calibrated": bool(spectrum.calibrated), "single_channel": spectrum.single_channel,
+              "dtype": spectrum.counts.dtype.str, "shape": list(spectrum.counts.shape), "num_bins": spectrum.x_values.size,
+              "peaks": [[channel, float(position)] for channel, position in peaks or []],
+              "gains": None if gains is None else np.asarray(gains, dtype=np.float64).tolist()}
+    # Offsets depend on the header length, which depends on the offsets' digits: size it with room to spare
+    header["x_offset"] = header["counts_offset"] = 0
+    header_size = len(json.dumps(header)) + 64
+    header["x_offset"] = _align(_SHARED_PREFIX.size + header_size)
+    header["counts_offset"] = _align(header["x_offset"] + spectrum.x_values.nbytes)
+    encoded = json.dumps(header).encode()
+    block = shared_memory.SharedMemory(name=name, create=True, size=max(header["counts_offset"] + spectrum.counts.nbytes, 1))
+    _SHARED_PREFIX.pack_into(block.buf, 0, SHARED_MAGIC, len(encoded))
+    block.buf[_SHARED_PREFIX.size:_SHARED_PREFIX.size + len(encoded)] = encoded
+    np.ndarray(spectrum.x_values.shape, np.float64, block.buf, header["x_offset"])[:] = spectrum.x_values
+    np.ndarray(spectrum.counts.shape, spectrum.counts.dtype, block.buf, header["counts_offset"])[:] = spectrum.counts
+    _owned_blocks.add(block.name)
+    return SharedSpectrum(block, owner=True)
+
+
+def attach_spectrum(name):
+    """
+    Map a spectrum shared by another process, without copying it.
+
+    Returns:
+        SharedSpectrum: Read-only handle; close() it when done (the sharing process keeps the block).
+
+    Raises:
+        FileNotFoundError: If no block has this name.
+        ValueError: If the block does not hold a shared spectrum.
+    """
+    block = shared_memory.SharedMemory(name=name)
+    # Attaching registers the block with this process's resource tracker, which would remove it at exit
+    if os.name == "posix" and block.name not in _owned_blocks:
+        resource_tracker.unregister(block._name, "shared_memory")
+    try:
+        return SharedSpectrum(block, owner=False)
+    except Exception:
+        block.close()
+        raise
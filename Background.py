@@ -0,0 +1,142 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from Instrumentation import span
+from NuclideID import fwhm
+
+'''
+Continuum (background) estimation with the SNIP algorithm (Sensitive Nonlinear Iterative Peak clipping):
+- Counts are compressed with the LLS operator log(log(sqrt(y + 1) + 1) + 1), then every bin is
+  repeatedly clipped to the mean of its neighbours p bins away, for p from the widest window down
+  to 1. Peaks narrower than the window are removed, while Compton edges and the low-energy continuum
+  are followed closely.
+- All channels of a capture are clipped together as one 2-D array, one numpy pass per window size.
+- On energy axes the clipping window follows the detector resolution (wider peaks at higher
+  energy get wider windows); on raw ADC axes a fixed window is used.
+- Results are cached by spectrum content and settings, so detection, plotting and net-area
+  computation on the same capture share one estimate.
+'''
+
+# Clipping window in FWHMs of the peak at each energy (energy axes)
+WINDOW_FWHM = 1.0
+# Clipping window as a fraction of the number of bins (raw ADC axes)
+RAW_WINDOW_FRACTION = 1 / 32
+MIN_WINDOW = 4
+MAX_CACHED_SPECTRA = 32
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def clipping_windows(x_values, calibrated, num_bins):
+    """
+    Clipping window half-width in bins for every bin of the x-axis.
+
+    Parameters:
+        x_values (np.ndarray): Bin positions (keV when calibrated).
+        calibrated (bool): Whether x_values is an energy axis.
+        num_bins (int): Number of bins.
+
+    Returns:
+        np.ndarray: Integer half-widths, at least MIN_WINDOW.
+    """
+    fixed = max(MIN_WINDOW, int(num_bins * RAW_WINDOW_FRACTION))
+    x_values = np.asarray(x_values, dtype=np.float64)
+    if not calibrated or x_values.size != num_bins or num_bins < 2 or not np.all(np.isfinite(x_values)):
+        return np.full(num_bins, fixed, dtype=np.int64)
+    bin_width = np.abs(np.gradient(x_values))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        windows = np.ceil(WINDOW_FWHM * fwhm(x_values) / bin_width)
+    windows = np.where(np.isfinite(windows), windows, fixed)
+    return np.clip(windows, MIN_WINDOW, max(MIN_WINDOW, num_bins // 4)).astype(np.int64)
+
+
+def snip(counts, windows):
+    """
+    SNIP continuum of one or more spectra.
+
+    Parameters:
+        counts (np.ndarray): Counts shaped (num_spectra, num_bins) or (num_bins,).
+        windows (np.ndarray or int): Clipping half-width in bins, per bin or for all bins.
+
+    Returns:
+        np.ndarray: Continuum with the same shape as counts, never above the counts.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    squeeze = counts.ndim == 1
+    counts = np.atleast_2d(counts)
+    num_bins = counts.shape[1]
+    windows = np.broadcast_to(np.asarray(windows, dtype=np.int64), (num_bins,))
+
+    values = np.log(np.log(np.sqrt(np.maximum(counts, 0.0) + 1.0) + 1.0) + 1.0)
+    max_window = min(int(windows.max(initial=0)), (num_bins - 1) // 2)
+    for p in range(max_window, 0, -1):
+        centre = values[:, p:-p]
+        clipped = np.minimum(centre, 0.5 * (values[:, :-2 * p] + values[:, 2 * p:]))
+        active = windows[p:-p] >= p
+        values[:, p:-p] = np.where(active, clipped, centre)
+
+    background = (np.exp(np.exp(values) - 1.0) - 1.0) ** 2 - 1.0
+    background = np.minimum(np.maximum(background, 0.0), np.maximum(counts, 0.0))
+    return background[0] if squeeze else background
+
+
+def estimate_background(x_values, counts, calibrated=True):
+    """
+    Cached SNIP continuum for a capture.
+
+    Parameters:
+        x_values (array-like): X-axis of the spectra.
+        counts (array-like): Counts shaped (num_spectra, num_bins) or (num_bins,).
+        calibrated (bool): Whether x_values is an energy axis in keV.
+
+    Returns:
+        np.ndarray: Read-only continuum with the same shape as counts.
+    """
+    counts = np.ascontiguousarray(counts, dtype=np.float64)
+    x_values = np.ascontiguousarray(x_values, dtype=np.float64)
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (counts.tobytes(), str(counts.shape).encode(), x_values.tobytes(),
+                 repr((bool(calibrated), WINDOW_FWHM, RAW_WINDOW_FRACTION, MIN_WINDOW)).encode()):
+        digest.update(part)
+    key = digest.hexdigest()
+
+    with _cache_lock:
+        background = _cache.get(key)
+        if background is not None:
+            _cache.move_to_end(key)
+            return background
+
+    with span("background.snip"):
+        background = snip(counts, clipping_windows(x_values, calibrated, counts.shape[-1]))
+    background.flags.writeable = False
+    with _cache_lock:
+        _cache[key] = background
+        while len(_cache) > MAX_CACHED_SPECTRA:
+            _cache.popitem(last=False)
+    return background
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def peak_window(x_values, peak_position, calibrated=True):
+    """
+    Integration window around a photopeak: +/- one FWHM on energy axes, or +/- the SNIP clipping
+    window on raw axes.
+
+    Returns:
+        tuple: (low, high) on the x-axis.
+    """
+    if calibrated:
+        half_width = float(fwhm(peak_position))
+    else:
+        x_values = np.asarray(x_values, dtype=np.float64)
+        step = float(np.nanmedian(np.abs(np.diff(x_values)))) if x_values.size > 1 else 1.0
+        half_width = max(MIN_WINDOW, int(x_values.size * RAW_WINDOW_FRACTION)) * step
+    return peak_position - half_width, peak_position + half_width
@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+import pandas as pd
+
+from SyntheticSpectra import write_dataset
+
+'''
+Reproducible performance benchmarks for the toolkit's hot paths.
+
+Synthetic datasets are generated per size tier, then each operation is timed through the same code
+the GUI runs: CSV load (pandas and every WideCSV engine), per-channel photopeak detection, batched detection with every detection
+backend, quick calibration, channel summing, normalisation, benchmark/simulated comparison and
+headless plot rendering (Qt offscreen platform).
+Results are written as JSON and can be compared against a previous run:
+
+    python BenchmarkSuite.py --tiers small,medium --output bench.json --compare bench_old.json
+'''
+
+TIERS = {
+    "small": {"num_channels": 16, "num_bins": 1024, "num_files": 2},
+    "medium": {"num_channels": 64, "num_bins": 4096, "num_files": 2},
+    "large": {"num_channels": 256, "num_bins": 8192, "num_files": 2},
+}
+DETECTION_ISOTOPE = "137Cs"
+KNOWN_ENERGY = 661.66
+
+
+def time_operation(func, repeats):
+    """
+    Time func over several runs after one warm-up call.
+
+    Returns:
+        dict: Median, minimum and maximum seconds, and the number of runs.
+    """
+    func()
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return {"median_s": statistics.median(durations), "min_s": min(durations),
+            "max_s": max(durations), "runs": repeats}
+
+
+def benchmark_tier(window, folder_path, repeats):
+    """
+    Run every benchmarked operation on the first files of a generated dataset.
+
+    Parameters:
+        window (GammaToolsWindow): Offscreen window providing detection and plotting state.
+        folder_path (str): Folder holding the synthetic captures.
+        repeats (int): Timed runs per operation.
+
+    Returns:
+        dict: Operation name -> timing dict.
+    """
+    from PhotopeakTools import PhotopeakDetector
+    from PeakFinders import backend_names
+    from QuickCalibrate import quick_calibrate
+    from SimSpecTools import load_and_normalize_data
+    from Spectrum import Spectrum
+    from WideCSV import csv_engine_names
+
+    file_names = sorted(name for name in os.listdir(folder_path) if name.endswith(".csv"))
+    file_path = os.path.join(folder_path, file_names[0])
+    other_path = os.path.join(folder_path, file_names[-1])
+    df = pd.read_csv(file_path)
+    spectrum = Spectrum.from_dataframe(df, name=file_names[0])
+    x_values = spectrum.x_values
+
+    window.file_path_label.setText(folder_path)
+    window.selected_file = file_names[0]
+    window.selected_channel = "Channel_0"
+    window.calibrated_radio.setChecked(True)
+    window.isotope_combo.setCurrentText(DETECTION_ISOTOPE)
+
+    def detect():
+        window.detected_peak_list.clear()
+        peaks = []
+        for channel_name in spectrum.channel_names():
+            mask = PhotopeakDetector.get_initial_mask(window, DETECTION_ISOTOPE, x_values)
+            found, energy = PhotopeakDetector.detect_peaks(window, channel_name, x_values,
+                                                           spectrum.channel(channel_name, np.float64), mask)
+            if found:
+                peaks.append(energy)
+        return peaks
+
+    def detect_batch(backend):
+        mask = PhotopeakDetector.get_initial_mask(window, DETECTION_ISOTOPE, x_values)
+        return PhotopeakDetector.detect_peaks_batch(window, x_values, spectrum.counts.astype(np.float64), mask, backend)
+
+    detected = detect()
+    detected_peak = float(np.median(detected)) if detected else KNOWN_ENERGY
+
+    results = {
+        "load": time_operation(lambda: Spectrum.from_dataframe(pd.read_csv(file_path)), repeats),
+        "detect": time_operation(detect, repeats),
+        "calibrate": time_operation(lambda: quick_calibrate(spectrum, detected_peak, KNOWN_ENERGY), repeats),
+        "sum": time_operation(spectrum.summed, repeats),
+        "normalize": time_operation(lambda: spectrum.counts / spectrum.counts.sum(axis=0, keepdims=True, dtype=np.float64), repeats),
+        "compare": time_operation(lambda: (load_and_normalize_data(file_path),
+                                           load_and_normalize_data(other_path)), repeats),
+        "render_all_channels": time_operation(lambda: window.plot_all_channels(spectrum), repeats),
+        "render_single_channel": time_operation(window.plot_single_channel, repeats),
+        "render_summed": time_operation(window.sum_and_plot_all_channels, repeats),
+    }
+    # Memory held per loaded capture: the float64 DataFrame against the compact Spectrum counts
+    results["load"].update(dataframe_bytes=int(df.astype(np.float64).memory_usage(deep=True).sum()),
+                           spectrum_bytes=spectrum.nbytes, counts_dtype=str(spectrum.counts.dtype))
+    # Spectrum loading with every CSV engine, with the parse throughput
+    file_size = os.path.getsize(file_path)
+    for engine in csv_engine_names():
+        results[f"load_{engine}"] = time_operation(lambda: Spectrum.from_csv(file_path, engine=engine), repeats)
+        results[f"load_{engine}"]["mb_per_s"] = file_size / results[f"load_{engine}"]["median_s"] / 1e6
+    # Batched detection with every backend, for side-by-side comparison
+    for backend in backend_names():
+        results[f"detect_batch_{backend}"] = time_operation(lambda: detect_batch(backend), repeats)
+        peaks = [energy for found, energy in detect_batch(backend) if found]
+        results[f"detect_batch_{backend}"].update(
+            found=len(peaks), median_peak=float(np.median(peaks)) if peaks else None)
+    return results
+
+
+def run_benchmarks(tiers, repeats=5, work_folder=None, seed=0):
+    """
+    Generate the datasets for each tier and benchmark them.
+
+    Returns:
+        dict: Run description and per-tier results, ready to be written as JSON.
+    """
+    from PyQt6.QtWidgets import QApplication
+    from GammaSpecTools import GammaToolsWindow
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    window = GammaToolsWindow()
+    own_folder = work_folder is None
+    work_folder = work_folder or tempfile.mkdtemp(prefix="gamma_bench_")
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "seed": seed,
+        "tiers": {},
+    }
+    try:
+        for tier in tiers:
+            params = dict(TIERS[tier])
+            folder_path = os.path.join(work_folder, tier)
+            if not os.path.isdir(folder_path):
+                write_dataset(folder_path, num_files=params.pop("num_files"), seed=seed, **params)
+            else:
+                params.pop("num_files")
+            print(f"Benchmarking tier '{tier}' ({params['num_channels']} channels x {params['num_bins']} bins)")
+            report["tiers"][tier] = {"params": params, "results": benchmark_tier(window, folder_path, repeats)}
+            app.processEvents()
+    finally:
+        window.close()
+        if own_folder:
+            shutil.rmtree(work_folder, ignore_errors=True)
+    return report
+
+
+def compare_reports(current, previous):
+    """
+    Print median-time ratios between two benchmark reports (ratio > 1 means slower now).
+    """
+    print(f"{'tier':<8} {'operation':<24} {'previous':>10} {'current':>10} {'ratio':>7}")
+    for tier, tier_report in current["tiers"].items():
+        previous_results = previous.get("tiers", {}).get(tier, {}).get("results", {})
+        for operation, timing in tier_report["results"].items():
+            before = previous_results.get(operation)
+            if before is None:
+                continue
+            ratio = timing["median_s"] / before["median_s"] if before["median_s"] else float("inf")
+            flag = "  <-- slower" if ratio > 1.1 else ""
+            print(f"{tier:<8} {operation:<24} {before['median_s'] * 1000:9.2f}ms {timing['median_s'] * 1000:9.2f}ms "
+                  f"{ratio:7.2f}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the gamma spectra toolkit on synthetic data.")
+    parser.add_argument("--tiers", default="small,medium", help=f"comma-separated, from {', '.join(TIERS)}")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-folder", help="keep generated datasets here and reuse them between runs")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    tiers = [tier.strip() for tier in args.tiers.split(",") if tier.strip()]
+    unknown = [tier for tier in tiers if tier not in TIERS]
+    if unknown:
+        parser.error(f"unknown tiers: {', '.join(unknown)}")
+
+    report = run_benchmarks(tiers, repeats=args.repeats, work_folder=args.work_folder, seed=args.seed)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    for tier, tier_report in report["tiers"].items():
+        for operation, timing in tier_report["results"].items():
+            print(f"{tier:<8} {operation:<24} {timing['median_s'] * 1000:9.2f} ms")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare_reports(report, json.load(f))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+import os
+import re
+import csv
+import operator
+from datetime import datetime
+
+import numpy as np
+
+'''
+Capture-log parsing and joining with the spectrum files of a dataset folder:
+- Streams a delimited capture log (CSV, TSV or semicolon separated, '#' comment lines allowed) into
+  per-column arrays, recognising common spellings of timestamp, sequence, file, source position,
+  live time, real time, HV and temperature columns. Separate "Date" and "Time" columns are joined
+  into one timestamp.
+- Builds sequence, file-name and sorted timestamp indexes, so each spectrum file is matched to its
+  log entry by file name, by the number in its file name, or by the nearest timestamp to its mtime.
+- Filters file lists by log conditions (e.g. "hv >= 800, temperature < 30") without opening any CSV,
+  and converts counts into live-time-corrected count rates.
+- Live and real times may be logged once per capture or per channel, in columns such as
+  "Live Time 3" or "LT_ch3" numbered like the Channel_<n> names.
+'''
+
+COLUMN_ALIASES = {
+    "timestamp": ["timestamp", "time", "datetime", "date", "starttime", "start"],
+    "sequence": ["sequence", "seq", "index", "capture", "captureno", "capturenumber", "frame", "fileindex", "run"],
+    "file": ["file", "filename", "spectrum", "spectrumfile", "path"],
+    "position": ["sourceposition", "position", "pos", "sourcepos"],
+    "live_time": ["livetime", "live", "lt", "livetimes"],
+    "real_time": ["realtime", "real", "rt", "realtimes"],
+    "hv": ["hv", "highvoltage", "voltage", "bias", "biasvoltage"],
+    "temperature": ["temperature", "temp", "tempc", "temperaturec"],
+}
+_ALIAS_LOOKUP = {alias: name for name, aliases in COLUMN_ALIASES.items() for alias in aliases}
+_STRING_COLUMNS = {"file"}
+TIMESTAMP_FORMATS = ["%d/%m/%Y %H:%M:%S", "%d-%m-%Y %H:%M:%S", "%Y/%m/%d %H:%M:%S", "%d/%m/%Y %H:%M:%S.%f"]
+TIMESTAMP_TOLERANCE = 60.0
+
+_OPERATORS = {"<=": operator.le, ">=": operator.ge, "==": operator.eq, "=": operator.eq,
+              "!=": operator.ne, "<": operator.lt, ">": operator.gt}
+_CONDITION = re.compile(r"^\s*([\w ]+?)\s*(<=|>=|==|!=|=|<|>)\s*(.+?)\s*$")
+# Columns logged per channel: an alias followed by the channel number, e.g. 'livetime3' or 'ltch3'
+CHANNEL_COLUMNS = ("live_time", "real_time")
+_CHANNEL_COLUMN = {name: re.compile(rf"^(?:{'|'.join(COLUMN_ALIASES[name])})(?:ch|channel)?(\d+)$")
+                   for name in CHANNEL_COLUMNS}
+
+
+def _column_key(name):
+    return re.sub(r"\(.*?\)|\[.*?\]|[^a-z0-9]", "", name.lower())
+
+
+def normalize_column(name):
+    """Map a log header to its canonical column name (e.g. 'Live Time (s)' -> 'live_time')."""
+    key = _column_key(name)
+    return _ALIAS_LOOKUP.get(key, key)
+
+
+def parse_timestamp(text):
+    """
+    Convert a timestamp in ISO, day-first or epoch-seconds form to epoch seconds.
+
+    Returns:
+        float: Seconds since the epoch, or NaN if the text is not a timestamp.
+    """
+    text = text.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        pass
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            continue
+    return np.nan
+
+
+def _to_float(text):
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+class CaptureLog:
+    """
+    Parsed capture log with time and sequence indexes.
+
+    Attributes:
+        path (str): Log file path.
+        columns (dict): Canonical column name -> np.ndarray (float, or object for text columns).
+        num_entries (int): Number of log entries.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = {}
+        self.num_entries = 0
+        self._parse()
+        self._build_indexes()
+
+    def _parse(self):
+        """
+        Stream the log once, appending each field to its column list.
+        """
+        with open(self.path, "r", newline="", errors="replace") as f:
+            lines = (line for line in f if line.strip() and not line.lstrip().startswith("#"))
+            first = next(lines, None)
+            if first is None:
+                raise ValueError(f"Capture log {self.path} is empty.")
+            try:
+                dialect = csv.Sniffer().sniff(first, delimiters=",;\t|")
+            except csv.Error:
+                dialect = csv.excel
+            header = []
+            keys = []
+            for name in next(csv.reader([first], dialect)):
+                keys.append(_column_key(name))
+                column = normalize_column(name)
+                if column in header:
+                    column = re.sub(r"[^a-z0-9]", "", name.lower())
+                if column in header:
+                    raise ValueError(f"Capture log {self.path} has duplicate column '{name}'.")
+                header.append(column)
+
+            raw = {name: [] for name in header}
+            for fields in csv.reader(lines, dialect):
+                for name, value in zip(header, fields):
+                    raw[name].append(value.strip())
+                for name in header[len(fields):]:
+                    raw[name].append("")
+                self.num_entries += 1
+
+        # Both map to the timestamp, so the second of a separate date and time column kept its own name
+        split = {key: column for key, column in zip(keys, header) if key in ("date", "time")}
+        if len(split) == 2:
+            dates, times = raw.pop(split["date"]), raw.pop(split["time"])
+            raw["timestamp"] = [f"{date} {time}".strip() for date, time in zip(dates, times)]
+
+        for name, values in raw.items():
+            if name == "timestamp":
+                self.columns[name] = np.array([parse_timestamp(v) for v in values], dtype=np.float64)
+                continue
+            numeric = np.array([_to_float(v) for v in values], dtype=np.float64)
+            filled = np.array([bool(v) for v in values])
+            if name in _STRING_COLUMNS or np.isnan(numeric[filled]).any():
+                self.columns[name] = np.array(values, dtype=object)
+            else:
+                self.columns[name] = numeric
+
+    def _build_indexes(self):
+        self._channel_columns = {name: {} for name in CHANNEL_COLUMNS}
+        for column, values in self.columns.items():
+            for name, pattern in _CHANNEL_COLUMN.items():
+                match = pattern.match(column)
+                if match and values.dtype != object:
+                    self._channel_columns[name][int(match.group(1))] = column
+        self._by_file = {}
+        if "file" in self.columns:
+            for row, name in enumerate(self.columns["file"]):
+                if name:
+                    self._by_file[os.path.basename(name.replace("\\", "/"))] = row
+        self._by_sequence = {}
+        if "sequence" in self.columns and self.columns["sequence"].dtype != object:
+            for row, value in enumerate(self.columns["sequence"]):
+                if not np.isnan(value):
+                    self._by_sequence[int(value)] = row
+        self._time_order = None
+        if "timestamp" in self.columns:
+            times = self.columns["timestamp"]
+            order = np.argsort(times, kind="stable")
+            order = order[~np.isnan(times[order])]
+            self._time_order = order
+            self._sorted_times = times[order]
+
+    ###### LOOKUPS ######
+
+    def row_at_time(self, timestamp, tolerance=TIMESTAMP_TOLERANCE):
+        """
+        Find the log entry nearest to a timestamp with a binary search over the sorted times.
+
+        Returns:
+            int: Row index, or None when no entry lies within the tolerance.
+        """
+        if self._time_order is None or not self._time_order.size:
+            return None
+        i = int(np.searchsorted(self._sorted_times, timestamp))
+        best = None
+        for j in (i - 1, i):
+            if 0 <= j < self._sorted_times.size:
+                delta = abs(self._sorted_times[j] - timestamp)
+                if delta <= tolerance and (best is None or delta < best[0]):
+                    best = (delta, j)
+        return None if best is None else int(self._time_order[best[1]])
+
+    def join_files(self, folder_path, file_names):
+        """
+        Match spectrum files to log entries by file name, then by the last number in the
+        file name, then by the file's modification time.
+
+        Parameters:
+            folder_path (str): Folder holding the spectrum files.
+            file_names (list): File names as listed in GammaToolsWindow.
+
+        Returns:
+            dict: File name -> log row index, for matched files only.
+        """
+        joined = {}
+        for name in file_names:
+            row = self._by_file.get(name)
+            if row is None and self._by_sequence:
+                # The capture number is the last number in the name (e.g. 5 in "137Cs_run_5.csv")
+                match = re.search(r"(\d+)(?=\D*$)", os.path.splitext(name)[0])
+                if match:
+                    row = self._by_sequence.get(int(match.group(1)))
+            if row is None and self._time_order is not None:
+                path = os.path.join(folder_path, name)
+                if os.path.isfile(path):
+                    row = self.row_at_time(os.path.getmtime(path))
+            if row is not None:
+                joined[name] = row
+        return joined
+
+    def entry(self, row):
+        """Return a log entry as a dict of canonical column name -> value."""
+        return {name: values[row] for name, values in self.columns.items()}
+
+    def value(self, row, column, default=None):
+        values = self.columns.get(column)
+        if values is None:
+            return default
+        value = values[row]
+        if values.dtype != object and np.isnan(value):
+            return default
+        return value
+
+    def numeric_value(self, row, column):
+        """
+        Value of a column as a number. Text columns (a column with any non-numeric entry is kept as
+        text) are coerced entry by entry.
+
+        Returns:
+            float: The value, or None when it is missing or not a number.
+        """
+        value = self.value(row, column)
+        if isinstance(value, str):
+            value = _to_float(value)
+        return None if value is None or np.isnan(value) else float(value)
+
+    def channel_times(self, row, column, num_channels):
+        """
+        Per-channel values of a time column ("live_time" or "real_time") for an entry: the entry's
+        single value for every channel, overridden by per-channel columns where the log has them.
+
+        Returns:
+            np.ndarray: Shaped (num_channels,), NaN where unknown.
+        """
+        times = np.full(num_channels, np.nan)
+        value = self.numeric_value(row, column)
+        if value is not None:
+            times[:] = value
+        for channel, name in self._channel_columns.get(column, {}).items():
+            if channel < num_channels and not np.isnan(self.columns[name][row]):
+                times[channel] = self.columns[name][row]
+        return times
+
+    ###### FILTERING ######
+
+    def mask(self, expression):
+        """
+        Evaluate comma or 'and' separated conditions over all log entries at once.
+
+        Parameters:
+            expression (str): e.g. "hv >= 800, temperature < 30, position == 3".
+
+        Returns:
+            np.ndarray: Boolean mask over log rows.
+        """
+        result = np.ones(self.num_entries, dtype=bool)
+        for condition in re.split(r",|\band\b", expression):
+            if not condition.strip():
+                continue
+            match = _CONDITION.match(condition)
+            if not match:
+                raise ValueError(f"Cannot parse capture-log condition '{condition.strip()}'")
+            column, op, value = normalize_column(match.group(1)), _OPERATORS[match.group(2)], match.group(3)
+            if column not in self.columns:
+                raise ValueError(f"Capture log has no column '{match.group(1).strip()}'. "
+                                 f"Available: {', '.join(self.columns)}")
+            values = self.columns[column]
+            if values.dtype == object:
+                result &= np.array([op(v, value.strip("'\"")) for v in values], dtype=bool)
+            else:
+                target = parse_timestamp(value) if column == "timestamp" else _to_float(value)
+                with np.errstate(invalid="ignore"):
+                    result &= op(values, target)
+        return result
+
+    def filter_files(self, joined, expression):
+        """
+        Keep the files whose joined log entry satisfies an expression.
+
+        Parameters:
+            joined (dict): Result of join_files.
+            expression (str): Conditions as accepted by mask().
+
+        Returns:
+            list: Matching file names, in the order of joined.
+        """
+        keep = self.mask(expression)
+        return [name for name, row in joined.items() if keep[row]]
+
+    ###### COUNT RATES ######
+
+    def live_time(self, row):
+        """Live time for an entry, falling back to real time when no live time is logged."""
+        live_time = self.numeric_value(row, "live_time")
+        return live_time if live_time is not None else self.numeric_value(row, "real_time")
+
+    def count_rate(self, counts, row):
+        """
+        Convert counts (any shape) for a log entry into live-time-corrected counts per second.
+
+        Raises:
+            ValueError: If the entry has no usable live or real time.
+        """
+        live_time = self.live_time(row)
+        if not live_time or live_time <= 0:
+            raise ValueError(f"Capture-log entry {row} has no live time.")
+        return np.asarray(counts, dtype=np.float64) / live_time
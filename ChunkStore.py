@@ -0,0 +1,330 @@
+import os
+import json
+import hashlib
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+'''
+Content-addressed, deduplicating chunk store backing DataStore uploads:
+- Files are split into content-defined chunks with a vectorised gear rolling hash, so an edit
+  only changes the chunks around it and derived files (_combined, _calibrated) share chunks.
+- Chunks are written once under chunks/<hash[:2]>/<hash>; each upload writes a dataset recipe
+  (metadata + per-file chunk lists) under datasets/<dataset_id>.json.
+- A local manifest records which chunks the store already holds and the size/mtime of every
+  file already chunked, so unchanged files are skipped without being read again.
+'''
+
+CHUNK_MIN_SIZE = 64 * 1024
+CHUNK_MAX_SIZE = 1024 * 1024
+CHUNK_AVG_BITS = 18  # average chunk size of ~256 KiB beyond the minimum
+READ_BLOCK_SIZE = 16 * 1024 * 1024
+GEAR_WINDOW = 32
+
+MANIFEST_PATH = os.path.join(os.path.expanduser("~"), ".gamma_tools_chunk_manifest.json")
+
+# Deterministic gear table; derived from sha256 so chunk boundaries never change between installs.
+_GEAR = np.array([int.from_bytes(hashlib.sha256(bytes([i])).digest()[:4], "little") for i in range(256)],
+                 dtype=np.uint32)
+_CUT_THRESHOLD = np.uint32(1 << (32 - CHUNK_AVG_BITS))
+
+
+def _gear_hash(buf):
+    """
+    Compute the 32-byte-window gear hash at every position of a buffer.
+
+    The window hash h[i] = sum(G[b[i-k]] << k, k < 32) is built by doubling the window
+    five times, which keeps the whole computation to a handful of vectorised passes.
+
+    Args:
+        buf (bytes): Input bytes.
+
+    Returns:
+        np.ndarray: uint32 hash per byte position.
+    """
+    h = _GEAR[np.frombuffer(buf, dtype=np.uint8)]
+    width = 1
+    while width < GEAR_WINDOW:
+        shifted = np.zeros_like(h)
+        shifted[width:] = h[:-width] << np.uint32(width)
+        h = h + shifted
+        width *= 2
+    return h
+
+
+def _find_cut_points(buf, offset):
+    """
+    Find chunk boundaries in buf[offset:], using buf[:offset] only as rolling-hash context.
+
+    Args:
+        buf (bytes): Context bytes followed by the data to cut.
+        offset (int): Number of leading context bytes.
+
+    Returns:
+        list: Cut positions relative to buf[offset:], each ending a chunk.
+    """
+    length = len(buf) - offset
+    if length <= CHUNK_MIN_SIZE:
+        return []
+    h = _gear_hash(buf)[offset:]
+    candidates = np.flatnonzero(h < _CUT_THRESHOLD) + 1
+
+    cuts = []
+    last = 0
+    for cut in candidates:
+        while cut - last > CHUNK_MAX_SIZE:
+            last += CHUNK_MAX_SIZE
+            cuts.append(last)
+        if cut - last >= CHUNK_MIN_SIZE:
+            cuts.append(int(cut))
+            last = int(cut)
+    while length - last > CHUNK_MAX_SIZE:
+        last += CHUNK_MAX_SIZE
+        cuts.append(last)
+    return [cut for cut in cuts if cut < length]
+
+
+def iter_chunks(path):
+    """
+    Yield the content-defined chunks of a file. Boundaries depend only on file content,
+    never on how the file is read, so identical regions always produce identical chunks.
+
+    Args:
+        path (str): File to split.
+
+    Yields:
+        bytes: Consecutive chunks covering the whole file.
+    """
+    context = b""
+    pending = b""
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(READ_BLOCK_SIZE)
+            data = pending + block
+            if not data:
+                return
+            if not block:
+                yield data
+                return
+            start = 0
+            for cut in _find_cut_points(context + data, len(context)):
+                yield data[start:cut]
+                start = cut
+            context = (context + data[max(0, start - GEAR_WINDOW + 1):start])[-(GEAR_WINDOW - 1):]
+            pending = data[start:]
+
+
+class ChunkStore:
+    """
+    Deduplicating dataset store rooted at a (possibly network-mounted) folder.
+
+    Attributes:
+        store_root (str): Root folder of the store.
+        manifest_path (str): Local manifest caching known chunks and file signatures.
+    """
+
+    def __init__(self, store_root, manifest_path=MANIFEST_PATH):
+        self.store_root = os.path.abspath(store_root)
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()
+        self._load_manifest()
+
+    ###### MANIFEST ######
+
+    def _load_manifest(self):
+        manifest = {}
+        if os.path.isfile(self.manifest_path):
+            try:
+                with open(self.manifest_path, "r") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable chunk manifest {self.manifest_path}: {e}")
+        self._manifest = manifest
+        entry = manifest.setdefault(self.store_root, {"chunks": [], "files": {}})
+        self.known_chunks = set(entry["chunks"])
+        self.known_files = entry["files"]
+
+    def save_manifest(self):
+        """
+        Write the manifest back to disk, replacing the previous one atomically.
+        """
+        with self._lock:
+            self._manifest[self.store_root] = {"chunks": sorted(self.known_chunks), "files": self.known_files}
+            tmp_path = f"{self.manifest_path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._manifest, f)
+            os.replace(tmp_path, self.manifest_path)
+
+    ###### CHUNK STORAGE ######
+
+    def chunk_path(self, chunk_hash):
+        return os.path.join(self.store_root, "chunks", chunk_hash[:2], chunk_hash)
+
+    def recipe_path(self, dataset_id):
+        return os.path.join(self.store_root, "datasets", f"{dataset_id}.json")
+
+    @staticmethod
+    def _atomic_write(path, data, mode="wb"):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, mode) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _put_chunk(self, chunk):
+        """
+        Store a chunk unless the manifest says the store already holds it.
+
+        Returns:
+            tuple: (chunk hash, number of bytes written).
+        """
+        chunk_hash = hashlib.sha256(chunk).hexdigest()
+        with self._lock:
+            if chunk_hash in self.known_chunks:
+                return chunk_hash, 0
+        self._atomic_write(self.chunk_path(chunk_hash), chunk)
+        with self._lock:
+            self.known_chunks.add(chunk_hash)
+        return chunk_hash, len(chunk)
+
+    def put_file(self, path, track=True):
+        """
+        Chunk a file into the store. Files whose size and mtime match the manifest are not read.
+
+        Args:
+            path (str): File to store.
+            track (bool): Look the file up in, and record it to, the manifest's known files. Off for
+                temporary files, whose paths mean nothing to a later upload.
+
+        Returns:
+            tuple: (file entry dict with size, sha256 and chunk list, stats dict).
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            cached = self.known_files.get(path) if track else None
+        if (cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns
+                and all(chunk in self.known_chunks for chunk in cached["chunks"])):
+            return cached, {"skipped": 1, "bytes_hashed": 0, "chunks": len(cached["chunks"]),
+                            "chunks_written": 0, "bytes_written": 0}
+
+        file_hash = hashlib.sha256()
+        chunks = []
+        written = 0
+        bytes_written = 0
+        for chunk in iter_chunks(path):
+            file_hash.update(chunk)
+            chunk_hash, nbytes = self._put_chunk(chunk)
+            chunks.append(chunk_hash)
+            written += bool(nbytes)
+            bytes_written += nbytes
+
+        entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                 "sha256": file_hash.hexdigest(), "chunks": chunks}
+        if track:
+            with self._lock:
+                self.known_files[path] = entry
+        return entry, {"skipped": 0, "bytes_hashed": stat.st_size, "chunks": len(chunks),
+                       "chunks_written": written, "bytes_written": bytes_written}
+
+    def put_folder(self, folder_path, metadata=None, max_workers=None, track=True):
+        """
+        Store every file below a folder and write a dataset recipe for it.
+
+        Args:
+            folder_path (str): Dataset folder.
+            metadata (dict): Capture metadata saved with the recipe.
+            max_workers (int): Number of hashing threads; defaults to the CPU count.
+            track (bool): Passed to put_file; False for a temporary staging folder.
+
+        Returns:
+            tuple: (dataset_id, stats dict summarising the upload).
+        """
+        folder_path = os.path.abspath(folder_path)
+        paths = []
+        for root, _, files in os.walk(folder_path):
+            paths.extend(os.path.join(root, name) for name in files)
+        paths.sort()
+
+        stats = {"files": len(paths), "skipped": 0, "bytes_hashed": 0, "chunks": 0,
+                 "chunks_written": 0, "bytes_written": 0}
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+            results = list(pool.map(lambda path: self.put_file(path, track), paths))
+
+        files = {}
+        for path, (entry, file_stats) in zip(paths, results):
+            files[os.path.relpath(path, folder_path).replace(os.sep, "/")] = entry
+            for key, value in file_stats.items():
+                stats[key] += value
+
+        dataset_id = self.write_recipe(files, metadata)
+        self.save_manifest()
+        return dataset_id, stats
+
+    def write_recipe(self, files, metadata=None):
+        """
+        Write the recipe of a dataset whose files are already stored.
+
+        Args:
+            files (dict): Relative path ("/"-separated) -> file entry from put_file.
+            metadata (dict): Capture metadata saved with the recipe.
+
+        Returns:
+            str: The content-addressed dataset ID.
+        """
+        files = {rel_path: {"size": entry["size"], "sha256": entry["sha256"], "chunks": entry["chunks"]}
+                 for rel_path, entry in files.items()}
+        recipe = {"metadata": metadata or {}, "files": files}
+        encoded = json.dumps(recipe, sort_keys=True)
+        dataset_id = hashlib.sha256(encoded.encode()).hexdigest()
+        if not os.path.isfile(self.recipe_path(dataset_id)):
+            self._atomic_write(self.recipe_path(dataset_id), encoded, mode="w")
+        return dataset_id
+
+    ###### RETRIEVAL ######
+
+    def list_datasets(self):
+        datasets_dir = os.path.join(self.store_root, "datasets")
+        if not os.path.isdir(datasets_dir):
+            return []
+        return sorted(name[:-5] for name in os.listdir(datasets_dir) if name.endswith(".json"))
+
+    def load_recipe(self, dataset_id):
+        with open(self.recipe_path(dataset_id), "r") as f:
+            return json.load(f)
+
+    def get_file(self, file_entry, dest_path):
+        """
+        Reassemble a stored file from its chunks and verify its sha256.
+
+        Args:
+            file_entry (dict): Entry from a dataset recipe.
+            dest_path (str): Output path.
+        """
+        file_hash = hashlib.sha256()
+        os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+        tmp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as out:
+            for chunk_hash in file_entry["chunks"]:
+                with open(self.chunk_path(chunk_hash), "rb") as f:
+                    chunk = f.read()
+                file_hash.update(chunk)
+                out.write(chunk)
+        if file_hash.hexdigest() != file_entry["sha256"]:
+            os.remove(tmp_path)
+            raise ValueError(f"Checksum mismatch while restoring {dest_path}")
+        os.replace(tmp_path, dest_path)
+
+    def restore_dataset(self, dataset_id, dest_folder):
+        """
+        Restore every file of a stored dataset into dest_folder.
+
+        Returns:
+            dict: The dataset recipe.
+        """
+        recipe = self.load_recipe(dataset_id)
+        for rel_path, file_entry in recipe["files"].items():
+            self.get_file(file_entry, os.path.join(dest_folder, *rel_path.split("/")))
+        return recipe
@@ -0,0 +1,177 @@
+from PyQt6.QtWidgets import (
+    QDialog, QPushButton, QFormLayout, QApplication, QLineEdit, QComboBox, QDateEdit,
+    QVBoxLayout, QHBoxLayout, QCheckBox, QTableWidget, QTableWidgetItem, QMessageBox,
+    QAbstractItemView, QHeaderView
+)
+from PyQt6.QtCore import QDate, Qt
+
+import sys
+import sqlite3
+
+from DataStoreUpload import DATASTORE_ROOT, LOCATIONS, PERSONNEL, PURPOSES
+from MetadataCatalog import MetadataCatalog, retrieve_datasets
+
+ANY_ITEM = "Any"
+
+
+class RetrievalDialog(QDialog):
+    """
+    A dialog for querying the local metadata catalog and retrieving matching datasets from the DataStore.
+
+    Attributes:
+        retrieved_folders (list): Local folders of the datasets retrieved by the last retrieval.
+    """
+
+    RESULT_COLUMNS = ["Date", "Location", "Personnel", "Purpose", "Camera ID", "Files", "Notes"]
+
+    def __init__(self, store_root=DATASTORE_ROOT):
+        super().__init__()
+        self.setWindowTitle("DataStore Retrieval")
+        self.store_root = store_root
+        self.catalog = MetadataCatalog()
+        self.rows = []
+        self.retrieved_folders = []
+        self.setup_ui()
+        self.setMinimumSize(900, 600)
+        self.sync_catalog()
+
+    def setup_ui(self):
+        """
+        Sets up the filter form, result table and action buttons.
+        """
+        layout = QVBoxLayout()
+        form = QFormLayout()
+
+        date_layout = QHBoxLayout()
+        self.date_filter_checkbox = QCheckBox("Filter by date")
+        self.date_from_input = QDateEdit()
+        self.date_from_input.setCalendarPopup(True)
+        self.date_from_input.setDisplayFormat("dd-MM-yyyy")
+        self.date_from_input.setDate(QDate.currentDate().addMonths(-1))
+        self.date_to_input = QDateEdit()
+        self.date_to_input.setCalendarPopup(True)
+        self.date_to_input.setDisplayFormat("dd-MM-yyyy")
+        self.date_to_input.setDate(QDate.currentDate())
+        date_layout.addWidget(self.date_filter_checkbox)
+        date_layout.addWidget(self.date_from_input)
+        date_layout.addWidget(self.date_to_input)
+        form.addRow("Date of acquisition:", date_layout)
+
+        self.location_input = QComboBox()
+        self.location_input.addItems([ANY_ITEM] + LOCATIONS)
+        form.addRow("Location:", self.location_input)
+
+        self.personnel_input = QComboBox()
+        self.personnel_input.addItems([ANY_ITEM] + PERSONNEL)
+        form.addRow("Personnel:", self.personnel_input)
+
+        self.purpose_input = QComboBox()
+        self.purpose_input.addItems([ANY_ITEM] + PURPOSES)
+        form.addRow("Purpose:", self.purpose_input)
+
+        self.camera_id_input = QLineEdit()
+        form.addRow("Camera ID:", self.camera_id_input)
+
+        self.text_input = QLineEdit()
+        self.text_input.setPlaceholderText("Search notes and file names, e.g. 137Cs")
+        self.text_input.returnPressed.connect(self.run_query)
+        form.addRow("Text:", self.text_input)
+        layout.addLayout(form)
+
+        search_button = QPushButton("Search")
+        search_button.clicked.connect(self.run_query)
+        layout.addWidget(search_button)
+
+        self.results_table = QTableWidget(0, len(self.RESULT_COLUMNS))
+        self.results_table.setHorizontalHeaderLabels(self.RESULT_COLUMNS)
+        self.results_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.results_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.results_table.horizontalHeader().setSectionResizeMode(
+            len(self.RESULT_COLUMNS) - 1, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.results_table)
+
+        button_layout = QHBoxLayout()
+        retrieve_button = QPushButton("Retrieve Selected")
+        retrieve_button.clicked.connect(self.retrieve_selected)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.reject)
+        button_layout.addWidget(retrieve_button)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+
+        self.setLayout(layout)
+
+    def sync_catalog(self):
+        """
+        Pick up datasets uploaded from other machines before the first query.
+        """
+        try:
+            added = self.catalog.sync_from_store(self.store_root)
+            if added:
+                print(f"Indexed {added} new datasets from {self.store_root}")
+        except OSError as e:
+            print(f"Could not synchronise catalog with {self.store_root}: {str(e)}")
+
+    @staticmethod
+    def _combo_value(combo):
+        text = combo.currentText()
+        return None if text == ANY_ITEM else text
+
+    def run_query(self):
+        """
+        Query the catalog with the current filters and fill the result table.
+        """
+        date_from = date_to = None
+        if self.date_filter_checkbox.isChecked():
+            date_from = self.date_from_input.date().toString("yyyy-MM-dd")
+            date_to = self.date_to_input.date().toString("yyyy-MM-dd")
+        try:
+            self.rows = self.catalog.query(
+                date_from=date_from, date_to=date_to,
+                location=self._combo_value(self.location_input),
+                personnel=self._combo_value(self.personnel_input),
+                purpose=self._combo_value(self.purpose_input),
+                camera_id=self.camera_id_input.text().strip() or None,
+                text=self.text_input.text().strip() or None)
+        except sqlite3.Error as e:
+            QMessageBox.warning(self, "Warning", f"Could not search the catalog: {str(e)}")
+            print(f"Error in catalog query: {str(e)}")
+            return
+
+        self.results_table.setRowCount(len(self.rows))
+        for i, row in enumerate(self.rows):
+            values = [row["date_acquired"], row["location"], row["personnel"], row["purpose"],
+                      row["camera_id"], str(row["num_files"]), (row["notes"] or "").replace("\n", " ")]
+            for j, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setData(Qt.ItemDataRole.UserRole, row["dataset_id"])
+                self.results_table.setItem(i, j, item)
+
+    def retrieve_selected(self):
+        """
+        Retrieve every selected dataset and accept the dialog once they are available locally.
+        """
+        selected_rows = sorted({index.row() for index in self.results_table.selectionModel().selectedRows()})
+        if not selected_rows:
+            QMessageBox.warning(self, "Warning", "Please select at least one dataset.")
+            return
+        try:
+            self.retrieved_folders = retrieve_datasets([self.rows[i] for i in selected_rows])
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", f"Failed to retrieve datasets: {str(e)}")
+            print(f"Error in dataset retrieval: {str(e)}")
+            return
+        QMessageBox.information(self, "Retrieval Complete",
+                                f"{len(self.retrieved_folders)} dataset(s) retrieved.")
+        self.accept()
+
+    def done(self, result):
+        self.catalog.close()
+        super().done(result)
+
+
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    main_window = RetrievalDialog()
+    main_window.show()
+    sys.exit(app.exec())
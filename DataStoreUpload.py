@@ -1,11 +1,66 @@
 from PyQt6.QtWidgets import (
     QDialog, QPushButton, QFormLayout, QApplication, QLabel,
-    QLineEdit, QTextEdit, QComboBox, QDateEdit, QVBoxLayout
+    QLineEdit, QTextEdit, QComboBox, QDateEdit, QVBoxLayout, QMessageBox,
+    QCheckBox
 )
 from PyQt6.QtCore import QDate, QEvent, Qt, QSize
 from Utils import drag_enter_event, drop_event, browse_path
+from ChunkStore import ChunkStore
+from MetadataCatalog import MetadataCatalog
 
+import os
 import sys
+import tempfile
+
+DATASTORE_ROOT = os.environ.get("DATASTORE_ROOT", os.path.join(os.path.expanduser("~"), "DataStore"))
+
+LOCATIONS = ["DSTL", "Inhouse", "NPL", "Nuvia", "Offshore", "Other (Please specify)"]
+PERSONNEL = ["Adam Tyas", "Andrew Morrow", "Daniel Grosvenor", "Dr. David Prendergast",
+             "Halina Harvey", "Karl G. Plapp", "Michael MacLeod", "Muhammed Najeeb Ul Haq",
+             "Peter Kittermaster", "Sam Teale", "Shaun August", "Sripad Sahu", "Victoria Anderson",
+             "Other (Please specify)"]
+PURPOSES = ["Calibration", "Hardware Testing", "Demonstration", "Client Data", "Other (Please specify)"]
+
+
+def upload_dataset(metadata, store_root=DATASTORE_ROOT):
+    """
+    Upload the dataset folder named in the metadata into the deduplicating DataStore.
+    Only chunks the store does not already hold are transferred. When "Compressed Archive"
+    is set, the folder is first transcoded into a single compressed spectrum archive.
+    The uploaded dataset is then indexed in the local metadata catalog.
+
+    Parameters:
+        metadata (dict): Metadata returned by MetadataDialog.save_metadata().
+        store_root (str): Root folder of the DataStore.
+
+    Returns:
+        tuple: (dataset_id, stats dict) from ChunkStore.put_folder.
+    """
+    dataset_path = metadata.get("Dataset Path", "")
+    if not os.path.isdir(dataset_path):
+        raise ValueError(f"The dataset path '{dataset_path}' is not a valid directory.")
+    store = ChunkStore(store_root)
+    if not metadata.get("Compressed Archive"):
+        dataset_id, stats = store.put_folder(dataset_path, metadata)
+    else:
+        from SpectrumArchive import write_archive, ARCHIVE_EXTENSION
+        with tempfile.TemporaryDirectory() as staging_folder:
+            archive_name = os.path.basename(os.path.normpath(dataset_path)) + ARCHIVE_EXTENSION
+            write_archive(dataset_path, os.path.join(staging_folder, archive_name), metadata)
+            # The staged archive is rewritten on every upload, so its temporary path is not tracked
+            dataset_id, stats = store.put_folder(staging_folder, metadata, track=False)
+    catalog_dataset(store, dataset_id)
+    return dataset_id, stats
+
+
+def catalog_dataset(store, dataset_id):
+    """Index an uploaded dataset in the local metadata catalog."""
+    catalog = MetadataCatalog()
+    try:
+        catalog.add_dataset(dataset_id, store.load_recipe(dataset_id), store.store_root)
+    finally:
+        catalog.close()
+
 
 class MetadataDialog(QDialog):
     """
@@ -20,6 +75,8 @@ class MetadataDialog(QDialog):
         notes_input (QTextEdit): Text area for any additional notes about the data acquisition.
         Dataset Path: Folder path for dataset upload to DataStore.
         Capture-Log Path: File path for Companion Capture-Log for the corresponding Dataset.
+        compress_archive_checkbox (QCheckBox): Transcode the dataset into a compressed archive on upload.
+        background_job_checkbox (QCheckBox): Queue the upload as a resumable background job.
     """
 
     def __init__(self, initial_folder_path=""):
@@ -71,21 +128,15 @@ class MetadataDialog(QDialog):
         layout.addRow("Date of acquisition:", self.date_acquired_input)
 
         self.location_input = QComboBox()
-        locations = ["DSTL", "Inhouse", "NPL", "Nuvia", "Offshore", "Other (Please specify)"]
-        self.location_input.addItems(locations)
+        self.location_input.addItems(LOCATIONS)
         layout.addRow("Location:", self.location_input)
 
         self.personnel_involved_input = QComboBox()
-        personnel = ["Adam Tyas", "Andrew Morrow", "Daniel Grosvenor", "Dr. David Prendergast",
-                     "Halina Harvey", "Karl G. Plapp", "Michael MacLeod", "Muhammed Najeeb Ul Haq",
-                     "Peter Kittermaster", "Sam Teale", "Shaun August", "Sripad Sahu", "Victoria Anderson",
-                     "Other (Please specify)"]
-        self.personnel_involved_input.addItems(personnel)
+        self.personnel_involved_input.addItems(PERSONNEL)
         layout.addRow("Personnel:", self.personnel_involved_input)
 
         self.purpose_of_capture_input = QComboBox()
-        purposes = ["Calibration", "Hardware Testing", "Demonstration", "Client Data", "Other (Please specify)"]
-        self.purpose_of_capture_input.addItems(purposes)
+        self.purpose_of_capture_input.addItems(PURPOSES)
         layout.addRow("Purpose:", self.purpose_of_capture_input)
 
         self.camera_id_input = QLineEdit()
@@ -127,6 +178,11 @@ class MetadataDialog(QDialog):
         # Add layouts to the main form layout
         layout.addRow(dataset_layout)
         layout.addRow(caplog_layout)
+
+        self.compress_archive_checkbox = QCheckBox("Compress dataset into a spectrum archive before upload")
+        layout.addRow(self.compress_archive_checkbox)
+        self.background_job_checkbox = QCheckBox("Upload as a background job (resumes after a restart)")
+        layout.addRow(self.background_job_checkbox)
         
         save_button = QPushButton("Save")
         save_button.clicked.connect(self.save_metadata)
@@ -158,11 +214,45 @@ class MetadataDialog(QDialog):
             "Camera ID": self.camera_id_input.text(),
             "Additional notes": self.notes_input.toPlainText(),
             "Dataset Path": self.Dataset_input.text(),
-            "Capture-Log Path": self.CapLog_input.text()
+            "Capture-Log Path": self.CapLog_input.text(),
+            "Compressed Archive": self.compress_archive_checkbox.isChecked()
         }
         self.accept()
         return metadata
 
+    def upload_to_datastore(self, metadata):
+        """
+        Upload the dataset described by the metadata to the DataStore and report the outcome.
+
+        Parameters:
+            metadata (dict): Metadata returned by save_metadata().
+
+        Returns:
+            str: The content-addressed dataset ID, or None if the upload failed or was queued.
+        """
+        if self.background_job_checkbox.isChecked():
+            from JobQueue import submit_job
+            try:
+                job_id = submit_job("upload", {"metadata": metadata, "store_root": DATASTORE_ROOT})
+            except (OSError, ValueError) as e:
+                QMessageBox.critical(self, "Error", f"Failed to queue the upload: {str(e)}")
+                print(f"Error queueing dataset upload: {str(e)}")
+                return None
+            QMessageBox.information(self, "Upload Queued", f"Upload queued as job {job_id}; follow it in the Job Monitor.")
+            return None
+        try:
+            dataset_id, stats = upload_dataset(metadata)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", f"Failed to upload dataset: {str(e)}")
+            print(f"Error in dataset upload: {str(e)}")
+            return None
+        QMessageBox.information(
+            self, "Upload Complete",
+            f"Dataset {dataset_id[:12]} uploaded: {stats['files']} files "
+            f"({stats['skipped']} unchanged), {stats['chunks_written']} of {stats['chunks']} chunks new, "
+            f"{stats['bytes_written'] / 1e6:.1f} MB written.")
+        return dataset_id
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     app.setStyleSheet("QWidget { font-size: 15pt; }")
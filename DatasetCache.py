@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+Local read-through cache for datasets retrieved from the DataStore:
+- Files are cached once per content hash (sha256) as blobs, independent of which dataset they came from.
+- Dataset recipes are cached too, so a dataset that is fully cached opens without the store being reachable.
+- Retrieved dataset folders get their own copy of each blob (a copy-on-write clone where the file system
+  supports it), so they can be opened and edited with GammaToolsWindow without touching the cache.
+  Each placed copy is recorded with its mtime: reopening a dataset skips copies still in place without
+  reading them, and never overwrites a file the user changed.
+- Total blob size is capped; least recently used blobs are evicted. Eviction only removes cached blobs,
+  never files in retrieved folders.
+- Blobs are checked against their hash on every read; corrupt blobs are dropped and fetched again.
+'''
+
+CACHE_ROOT = os.path.join(os.path.expanduser("~"), ".gamma_tools_cache")
+CACHE_MAX_BYTES = int(os.environ.get("GAMMA_TOOLS_CACHE_MB", 20 * 1024)) * 1024 * 1024
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
+# ioctl request that clones a file's extents (btrfs, XFS and other copy-on-write file systems)
+FICLONE = 0x40049409
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_blobs_last_access ON blobs (last_access);
+CREATE TABLE IF NOT EXISTS links (
+    sha256 TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime_ns INTEGER,
+    PRIMARY KEY (sha256, path)
+);
+"""
+
+
+def file_sha256(path):
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def clone_file(src, dst):
+    """
+    Copy src to dst, as a copy-on-write clone where the file system supports it.
+    dst is written through a temporary file, so readers never see a partial copy.
+    """
+    tmp_path = f"{dst}.{uuid.uuid4().hex}.tmp"
+    try:
+        cloned = False
+        if sys.platform.startswith("linux"):
+            import fcntl
+            with open(src, "rb") as s, open(tmp_path, "wb") as d:
+                try:
+                    fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+                    cloned = True
+                except OSError:
+                    pass
+        if not cloned:
+            shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class DatasetCache:
+    """
+    Content-addressed LRU cache of retrieved dataset files.
+
+    Attributes:
+        cache_root (str): Folder holding blobs, cached recipes and the cache index.
+        max_bytes (int): Size cap for cached blobs.
+        verify (bool): Re-hash blobs on every read; when False only the size is checked.
+    """
+
+    def __init__(self, cache_root=CACHE_ROOT, max_bytes=CACHE_MAX_BYTES, verify=True):
+        self.cache_root = cache_root
+        self.max_bytes = max_bytes
+        self.verify = verify
+        os.makedirs(cache_root, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(cache_root, "cache.sqlite"), check_same_thread=False)
+        self.conn.executescript(_SCHEMA)
+        if "mtime_ns" not in [row[1] for row in self.conn.execute("PRAGMA table_info(links)")]:
+            # Caches from before copies were tracked
+            self.conn.execute("ALTER TABLE links ADD COLUMN mtime_ns INTEGER")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def blob_path(self, sha256):
+        return os.path.join(self.cache_root, "blobs", sha256[:2], sha256)
+
+    ###### BLOBS ######
+
+    def lookup(self, sha256):
+        """
+        Return the path of a valid cached blob and mark it as recently used.
+
+        Returns:
+            str: Blob path, or None on a miss or when the cached copy failed validation.
+        """
+        with self._lock:
+            row = self.conn.execute("SELECT size FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        if row is None:
+            return None
+        path = self.blob_path(sha256)
+        valid = os.path.isfile(path) and os.path.getsize(path) == row[0]
+        if valid and self.verify:
+            valid = file_sha256(path) == sha256
+        if not valid:
+            print(f"Dropping corrupt cache entry {sha256[:12]}")
+            self._remove_blob(sha256)
+            return None
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE blobs SET last_access = ? WHERE sha256 = ?", (time.time(), sha256))
+        return path
+
+    def fetch(self, store, file_entry):
+        """
+        Return a cached blob for a recipe file entry, fetching it from the store on a miss.
+
+        Parameters:
+            store (ChunkStore): Store holding the file's chunks.
+            file_entry (dict): Entry from a dataset recipe.
+
+        Returns:
+            str: Blob path.
+        """
+        sha256 = file_entry["sha256"]
+        path = self.lookup(sha256)
+        if path is not None:
+            return path
+        path = self.blob_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        store.get_file(file_entry, path)
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO blobs (sha256, size, last_access) VALUES (?, ?, ?)",
+                              (sha256, file_entry["size"], time.time()))
+        return path
+
+    def placed(self, sha256, size, dest_path):
+        """
+        Whether dest_path already holds a file's content. A copy recorded by link() whose size and
+        mtime are unchanged is trusted without reading it; any other file of the right size is hashed.
+
+        Returns:
+            bool: True if it does, False if dest_path holds a different file, None if there is none.
+        """
+        dest_path = os.path.abspath(dest_path)
+        try:
+            stat = os.stat(dest_path)
+        except FileNotFoundError:
+            return None
+        if stat.st_size != size:
+            return False
+        with self._lock:
+            row = self.conn.execute("SELECT mtime_ns FROM links WHERE sha256 = ? AND path = ?",
+                                    (sha256, dest_path)).fetchone()
+        if row is not None and row[0] == stat.st_mtime_ns:
+            return True
+        if file_sha256(dest_path) != sha256:
+            return False
+        self._record_link(sha256, dest_path)
+        return True
+
+    def _record_link(self, sha256, dest_path):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO links (sha256, path, mtime_ns) VALUES (?, ?, ?)",
+                              (sha256, dest_path, os.stat(dest_path).st_mtime_ns))
+
+    def link(self, sha256, dest_path):
+        """
+        Place a copy of a cached blob at dest_path (see clone_file), unless it is already there.
+        The copy is independent of the cache: editing it cannot corrupt the blob, and evicting the
+        blob leaves it in place. A different file at dest_path (e.g. one the user edited) is kept.
+
+        Returns:
+            bool: True if dest_path holds the blob's content, False if a different file was kept.
+        """
+        blob = self.blob_path(sha256)
+        dest_path = os.path.abspath(dest_path)
+        # Hard links left by older versions of the cache share the blob, so they are replaced by copies
+        if not (os.path.isfile(dest_path) and os.path.samefile(blob, dest_path)):
+            state = self.placed(sha256, os.path.getsize(blob), dest_path)
+            if state is not None:
+                return state
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        clone_file(blob, dest_path)
+        self._record_link(sha256, dest_path)
+        return True
+
+    def _remove_blob(self, sha256):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM links WHERE sha256 = ?", (sha256,))
+            self.conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+        # Only the blob goes; copies in retrieved folders belong to the user
+        path = self.blob_path(sha256)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def total_bytes(self):
+        with self._lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def evict(self, keep=()):
+        """
+        Evict least recently used blobs until the cache fits within max_bytes.
+
+        Parameters:
+            keep (iterable): Hashes that must not be evicted (e.g. the dataset being opened).
+
+        Returns:
+            int: Number of bytes freed.
+        """
+        keep = set(keep)
+        excess = self.total_bytes() - self.max_bytes
+        freed = 0
+        if excess <= 0:
+            return 0
+        with self._lock:
+            candidates = self.conn.execute("SELECT sha256, size FROM blobs ORDER BY last_access").fetchall()
+        for sha256, size in candidates:
+            if freed >= excess:
+                break
+            if sha256 in keep:
+                continue
+            self._remove_blob(sha256)
+            freed += size
+        return freed
+
+    ###### DATASETS ######
+
+    def load_recipe(self, store, dataset_id):
+        """
+        Load a dataset recipe, preferring the cached copy so cached datasets open offline.
+        """
+        recipe_path = os.path.join(self.cache_root, "recipes", f"{dataset_id}.json")
+        if os.path.isfile(recipe_path):
+            with open(recipe_path, "r") as f:
+                return json.load(f)
+        recipe = store.load_recipe(dataset_id)
+        os.makedirs(os.path.dirname(recipe_path), exist_ok=True)
+        tmp_path = f"{recipe_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(recipe, f)
+        os.replace(tmp_path, recipe_path)
+        return recipe
+
+    def materialize_dataset(self, store, dataset_id, dest_folder, max_workers=8):
+        """
+        Make every file of a dataset available under dest_folder, fetching only cache misses.
+        Files already in place are skipped without fetching; files that differ from the dataset are
+        kept as they are, and listed.
+
+        Parameters:
+            store (ChunkStore): Store holding the dataset.
+            dataset_id (str): Content-addressed dataset ID.
+            dest_folder (str): Folder to populate.
+            max_workers (int): Number of concurrent fetches.
+
+        Returns:
+            dict: The dataset recipe.
+        """
+        recipe = self.load_recipe(store, dataset_id)
+        files = recipe["files"]
+
+        def fetch_and_link(item):
+            name, entry = item
+            dest_path = os.path.join(dest_folder, *name.split("/"))
+            state = self.placed(entry["sha256"], entry["size"], dest_path)
+            if state is None:
+                self.fetch(store, entry)
+                state = self.link(entry["sha256"], dest_path)
+            return None if state else name
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            modified = [name for name in pool.map(fetch_and_link, files.items()) if name is not None]
+        if modified:
+            print(f"Kept {len(modified)} files in {dest_folder} that differ from dataset {dataset_id[:12]}: "
+                  + ", ".join(sorted(modified)))
+        self.evict(keep=(entry["sha256"] for entry in files.values()))
+        return recipe
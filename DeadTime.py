@@ -0,0 +1,175 @@
+import numpy as np
+from scipy.special import lambertw
+
+from CaptureLog import normalize_column
+
+'''
+Dead-time and live-time correction of capture counts into count rates (counts per second) that can
+be compared between captures taken at different source activities:
+- "live-time": counts divided by each channel's live time (the acquisition's own dead-time
+  correction), or by the real time when no live time is known.
+- "non-paralyzable": the measured rate m = N / real time of each channel is corrected to the true
+  rate n = m / (1 - m tau), for a detector that is dead for tau after every counted event.
+- "paralyzable": m = n exp(-n tau), for a detector whose dead time is extended by every event,
+  inverted on the low-rate branch with the Lambert W function, n = -W0(-m tau) / tau.
+Both dead-time models scale every bin of a channel by that channel's n / m, so the spectrum shape is
+kept and only its rate changes.
+Times are per channel, taken from capture-log columns (one time for the capture, or per-channel
+columns such as "Live Time 3") or a metadata dict. Counts shaped (num_files, num_channels, num_bins)
+with times shaped (num_files, num_channels) are corrected in one pass, and Spectrum.count_rates()
+keeps the corrected rates with the loaded spectrum.
+'''
+
+LIVE_TIME = "live-time"
+NON_PARALYZABLE = "non-paralyzable"
+PARALYZABLE = "paralyzable"
+DEAD_TIME_MODELS = (LIVE_TIME, NON_PARALYZABLE, PARALYZABLE)
+
+
+def true_rates(measured, model, tau):
+    """
+    True event rates from measured rates under a dead-time model.
+
+    Parameters:
+        measured (np.ndarray): Measured rates (counts per second), any shape.
+        model (str): NON_PARALYZABLE or PARALYZABLE.
+        tau (float or np.ndarray): Dead time per event in seconds, broadcastable to measured.
+
+    Raises:
+        ValueError: If a measured rate is beyond what the model allows (1/tau non-paralyzable,
+            1/(e tau) paralyzable), i.e. the dead time is too long for the data.
+    """
+    loss = np.asarray(measured, dtype=np.float64) * tau
+    if model == NON_PARALYZABLE:
+        if np.any(loss >= 1.0):
+            raise ValueError("A measured rate reaches 1/tau, the non-paralyzable limit; the dead time is too long.")
+        return measured / (1.0 - loss)
+    if model == PARALYZABLE:
+        if np.any(loss > np.exp(-1.0)):
+            raise ValueError("A measured rate exceeds 1/(e tau), the paralyzable maximum; the dead time is too long.")
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(loss > 0, -lambertw(-loss, 0).real / tau, measured)
+    raise ValueError(f"Unknown dead-time model '{model}'. Available: {', '.join(DEAD_TIME_MODELS)}")
+
+
+def count_rates(counts, live_time=None, real_time=None, model=LIVE_TIME, tau=None):
+    """
+    Dead-time corrected count rates of every bin.
+
+    Parameters:
+        counts (np.ndarray): Shaped (..., num_channels, num_bins), e.g. one file or a stack of files.
+        live_time, real_time (array-like): Seconds, broadcastable to counts.shape[:-1]; NaN where unknown.
+        model (str): One of DEAD_TIME_MODELS.
+        tau (float or array-like): Dead time per event in seconds, for the dead-time models.
+
+    Returns:
+        np.ndarray: float64 counts per second, shaped like counts.
+
+    Raises:
+        ValueError: If a channel has no usable time for the model, or the model does not apply.
+    """
+    counts = np.asarray(counts)
+    shape = counts.shape[:-1]
+    real = np.broadcast_to(np.asarray(np.nan if real_time is None else real_time, dtype=np.float64), shape)
+    if model == LIVE_TIME:
+        live = np.broadcast_to(np.asarray(np.nan if live_time is None else live_time, dtype=np.float64), shape)
+        time = np.where(np.isfinite(live) & (live > 0), live, real)
+        if not np.all(np.isfinite(time) & (time > 0)):
+            raise ValueError("Every channel needs a live or real time for the live-time correction.")
+        return counts / time[..., np.newaxis]
+
+    if tau is None or not np.all(np.asarray(tau) > 0):
+        raise ValueError(f"The {model} model needs a positive dead time per event.")
+    if not np.all(np.isfinite(real) & (real > 0)):
+        raise ValueError(f"Every channel needs a real time for the {model} correction.")
+    measured = counts.sum(axis=-1, dtype=np.float64) / real
+    true = true_rates(measured, model, tau)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = np.where(measured > 0, true / measured, 1.0)
+    return counts * (factor / real)[..., np.newaxis]
+
+
+class AcquisitionTimes:
+    """
+    Per-channel live and real times of one capture, with the dead-time model applied to them.
+
+    Attributes:
+        live_time (np.ndarray): Seconds per channel, NaN where unknown.
+        real_time (np.ndarray): Seconds per channel, NaN where unknown.
+        model (str): One of DEAD_TIME_MODELS.
+        tau (float): Dead time per event in seconds (dead-time models only).
+    """
+
+    def __init__(self, live_time=None, real_time=None, model=LIVE_TIME, tau=None):
+        if model not in DEAD_TIME_MODELS:
+            raise ValueError(f"Unknown dead-time model '{model}'. Available: {', '.join(DEAD_TIME_MODELS)}")
+        self.live_time = np.atleast_1d(np.asarray(np.nan if live_time is None else live_time, dtype=np.float64))
+        self.real_time = np.atleast_1d(np.asarray(np.nan if real_time is None else real_time, dtype=np.float64))
+        self.model = model
+        self.tau = None if tau is None else float(tau)
+
+    def known(self):
+        """Whether any channel has the time the model needs."""
+        times = [self.real_time] if self.model != LIVE_TIME else [self.live_time, self.real_time]
+        return any(np.any(np.isfinite(time) & (time > 0)) for time in times)
+
+    def key(self):
+        """Hashable identity of the times and model, for caching corrected rates."""
+        return (self.model, self.tau, self.live_time.tobytes(), self.real_time.tobytes())
+
+    def correct(self, counts):
+        """count_rates() of counts shaped (num_channels, num_bins) with these times."""
+        return count_rates(counts, self.live_time, self.real_time, self.model, self.tau)
+
+    def describe(self):
+        return "live-time corrected" if self.model == LIVE_TIME else f"{self.model} dead-time corrected"
+
+
+def times_from_log(capture_log, row, num_channels, model=LIVE_TIME, tau=None):
+    """AcquisitionTimes of a capture-log entry (see CaptureLog.channel_times)."""
+    return AcquisitionTimes(capture_log.channel_times(row, "live_time", num_channels),
+                            capture_log.channel_times(row, "real_time", num_channels), model, tau)
+
+
+def times_from_metadata(metadata, num_channels, model=LIVE_TIME, tau=None):
+    """
+    AcquisitionTimes from a metadata dict whose keys are any capture-log spelling of live or real time
+    ("Live Time (s)", "RealTime", ...), each a single time or a sequence with one time per channel.
+    """
+    times = {"live_time": None, "real_time": None}
+    for key, value in metadata.items():
+        column = normalize_column(str(key))
+        if column in times and value not in (None, ""):
+            values = np.asarray(value, dtype=np.float64)
+            if values.ndim and values.size != num_channels:
+                raise ValueError(f"Metadata '{key}' has {values.size} times for {num_channels} channels.")
+            times[column] = np.broadcast_to(values, (num_channels,))
+    return AcquisitionTimes(times["live_time"], times["real_time"], model, tau)
+
+
+def count_rates_of_files(spectra, times):
+    """
+    Corrected rates of several loaded spectra, stacking spectra of the same shape so each group is
+    corrected in one vectorised pass.
+
+    Parameters:
+        spectra (list): Spectrum objects.
+        times (list): AcquisitionTimes per spectrum, all with the same model and dead time.
+
+    Returns:
+        list: Rates per spectrum, shaped like its counts.
+    """
+    if len({(t.model, t.tau) for t in times}) > 1:
+        raise ValueError("All files must be corrected with the same dead-time model and dead time.")
+    groups = {}
+    for position, spectrum in enumerate(spectra):
+        groups.setdefault(spectrum.counts.shape, []).append(position)
+    rates = [None] * len(spectra)
+    for shape, positions in groups.items():
+        stacked = count_rates(np.stack([spectra[p].counts for p in positions]),
+                              np.stack([np.broadcast_to(times[p].live_time, shape[:1]) for p in positions]),
+                              np.stack([np.broadcast_to(times[p].real_time, shape[:1]) for p in positions]),
+                              times[positions[0]].model, times[positions[0]].tau)
+        for p, file_rates in zip(positions, stacked):
+            rates[p] = file_rates
+    return rates
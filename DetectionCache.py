@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from DatasetCache import file_sha256
+
+'''
+Persistent photopeak detection results, stored next to the data in the folder's
+.gamma_tools_detections.json:
+- Results are keyed by the file's content hash (sha256), the isotope selection, the calibration flag
+  and the detection parameters (backend and its settings, continuum subtraction, library ROIs), so a
+  renamed or copied file still hits, and any change to the algorithm or library misses.
+- File hashes are remembered with the file's size and modification time, so reopening a folder does
+  not re-hash unchanged files. Hashes of files that left the folder are dropped when it is opened.
+- Every change is saved at once, except inside batch(), which saves once at its end.
+- Manual fixes from peak fine-tuning are stored separately, keyed without the detection parameters,
+  and layered on top of whatever detection result is restored or freshly computed.
+'''
+
+CACHE_FILE_NAME = ".gamma_tools_detections.json"
+MAX_ENTRIES = 2000
+# Tolerance when matching a fine-tuned peak to the detected peak it replaces (list text has 2 decimals)
+OVERRIDE_TOLERANCE = 0.01
+
+
+def parameters_key(params):
+    """Stable digest of a JSON-serialisable parameter dict."""
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class DetectionCache:
+    """
+    Detection results and manual overrides for the files of one folder.
+
+    Attributes:
+        folder_path (str): Data folder; the cache file lives inside it.
+        path (str): Cache file path.
+    """
+
+    def __init__(self, folder_path):
+        self.folder_path = folder_path
+        self.path = os.path.join(folder_path, CACHE_FILE_NAME)
+        self._lock = threading.Lock()
+        self._data = {"hashes": {}, "entries": {}, "overrides": {}}
+        self._batch_depth = 0
+        self._dirty = False
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    self._data.update(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable detection cache {self.path}: {e}")
+            if self.prune():
+                self.save()
+
+    def save(self):
+        """Write the cache atomically; a read-only folder only costs the persistence."""
+        with self._lock:
+            text = json.dumps(self._data, indent=1)
+            self._dirty = False
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile("w", dir=self.folder_path, prefix=CACHE_FILE_NAME, suffix=".tmp",
+                                             delete=False) as f:
+                tmp_path = f.name
+                f.write(text)
+            # Temporary files are private; the cache keeps the permissions of a normally written file
+            os.chmod(tmp_path, os.stat(self.path).st_mode & 0o777 if os.path.isfile(self.path) else 0o644)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not save the detection cache to {self.path}: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _changed(self):
+        with self._lock:
+            self._dirty = True
+            deferred = self._batch_depth > 0
+        if not deferred:
+            self.save()
+
+    @contextmanager
+    def batch(self):
+        """Defer saving until the block ends, e.g. while looking up and storing the files of a folder."""
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                flush = self._batch_depth == 0 and self._dirty
+            if flush:
+                self.save()
+
+    def prune(self):
+        """
+        Drop the remembered hashes of files that are no longer in the folder.
+
+        Returns:
+            int: Number of hashes dropped.
+        """
+        with self._lock:
+            gone = [name for name in self._data["hashes"] if not os.path.isfile(os.path.join(self.folder_path, name))]
+            for name in gone:
+                del self._data["hashes"][name]
+        return len(gone)
+
+    def file_hash(self, file_name):
+        """Content hash of a file in the folder, re-computed only when its size or mtime changed."""
+        stat = os.stat(os.path.join(self.folder_path, file_name))
+        with self._lock:
+            known = self._data["hashes"].get(file_name)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["sha256"]
+        sha256 = file_sha256(os.path.join(self.folder_path, file_name))
+        with self._lock:
+            self._data["hashes"][file_name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+        self._changed()
+        return sha256
+
+    @staticmethod
+    def _selection_key(sha256, selection, calibrated):
+        return f"{sha256}|{selection}|{'calibrated' if calibrated else 'raw'}"
+
+    ###### DETECTION RESULTS ######
+
+    def lookup(self, file_name, selection, calibrated, params):
+        """
+        Cached peaks of a file for a detection setup, with manual overrides applied.
+
+        Returns:
+            list: (channel name, peak position) in detection order, or None on a miss.
+        """
+        selection_key = self._selection_key(self.file_hash(file_name), selection, calibrated)
+        with self._lock:
+            entry = self._data["entries"].get(f"{selection_key}|{parameters_key(params)}")
+        if entry is None:
+            return None
+        return self.apply_overrides(file_name, selection, calibrated, entry["peaks"])
+
+    def apply_overrides(self, file_name, selection, calibrated, peaks):
+        """
+        Layer the manual fixes recorded for a file and isotope selection on top of detected peaks.
+
+        Returns:
+            list: (channel name, peak position) with fixed peaks replaced.
+        """
+        selection_key = self._selection_key(self.file_hash(file_name), selection, calibrated)
+        with self._lock:
+            overrides = [list(override) for override in self._data["overrides"].get(selection_key, [])]
+        return self._layer_overrides(peaks, overrides)
+
+    @staticmethod
+    def _layer_overrides(peaks, overrides):
+        peaks = [(channel, float(position)) for channel, position in peaks]
+        for channel, original, position in overrides:
+            candidates = [index for index, (peak_channel, _) in enumerate(peaks) if peak_channel == channel]
+            if not candidates:
+                continue
+            index = min(candidates, key=lambda index: abs(peaks[index][1] - original))
+            # With one peak per channel the fix applies whatever the detector found; with several
+            # (multi-isotope runs) only to the peak it was made on
+            if len(candidates) == 1 or abs(peaks[index][1] - original) <= OVERRIDE_TOLERANCE:
+                peaks[index] = (channel, float(position))
+        return peaks
+
+    def results(self):
+        """
+        Every stored detection result with manual overrides applied, oldest first.
+
+        Returns:
+            list: dicts with the file name, isotope selection, calibration flag, detection parameters,
+                creation time and peaks as (channel name, peak position) pairs.
+        """
+        with self._lock:
+            entries = sorted(self._data["entries"].items(), key=lambda item: item[1]["created"])
+            overrides = {key: [list(override) for override in fixes] for key, fixes in self._data["overrides"].items()}
+        results = []
+        for key, entry in entries:
+            selection_key = key.rsplit("|", 1)[0]
+            results.append(dict(entry, peaks=self._layer_overrides(entry["peaks"], overrides.get(selection_key, []))))
+        return results
+
+    def store(self, file_name, selection, calibrated, params, peaks):
+        """Remember the peaks detected in a file, replacing any earlier result for the same setup."""
+        selection_key = self._selection_key(self.file_hash(file_name), selection, calibrated)
+        with self._lock:
+            entries = self._data["entries"]
+            entries[f"{selection_key}|{parameters_key(params)}"] = {
+                "file": file_name, "selection": selection, "calibrated": bool(calibrated), "params": params,
+                "created": time.time(), "peaks": [[channel, float(position)] for channel, position in peaks]}
+            if len(entries) > MAX_ENTRIES:
+                for key in sorted(entries, key=lambda key: entries[key]["created"])[:len(entries) - MAX_ENTRIES]:
+                    del entries[key]
+        self._changed()
+
+    ###### MANUAL OVERRIDES ######
+
+    def set_override(self, file_name, selection, calibrated, channel, original_position, new_position):
+        """Record a manual fix of one detected peak, replacing earlier fixes of the same peak."""
+        selection_key = self._selection_key(self.file_hash(file_name), selection, calibrated)
+        with self._lock:
+            overrides = self._data["overrides"].setdefault(selection_key, [])
+            for override in overrides:
+                if override[0] == channel and abs(override[2] - original_position) <= OVERRIDE_TOLERANCE:
+                    # Fine-tuning an already fixed peak: keep pointing at the detected position
+                    override[2] = float(new_position)
+                    break
+            else:
+                overrides.append([channel, float(original_position), float(new_position)])
+        self._changed()
+
+    def clear_overrides(self, file_name, selection, calibrated):
+        selection_key = self._selection_key(self.file_hash(file_name), selection, calibrated)
+        with self._lock:
+            self._data["overrides"].pop(selection_key, None)
+        self._changed()
@@ -0,0 +1,441 @@
+import os
+import io
+import sys
+import json
+import time
+import base64
+import socket
+import ipaddress
+import argparse
+import threading
+import subprocess
+import socketserver
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from FolderPipeline import FolderPipeline, analyse_file, store_analysis
+import PeakFinders
+
+'''
+Distributed folder processing across several workstations, as a coordinator/worker protocol over TCP:
+- The coordinator runs FolderPipeline on the folder; instead of a local process pool, the stale
+  files are handed out to connected workers. Their results (peak positions, gains and aligned
+  sums) come back over the socket and are stored as the pipeline's artifacts, so the usual sum and
+  export stages aggregate every worker's results into one peaks table and one summed spectrum.
+- Workers pull batches of files and keep about two per local process queued. When the shared queue
+  is empty, an idle worker steals the most recently queued (not yet started) files of the worker
+  with the longest backlog; the victim is told to drop them. If a stolen file was already running,
+  the first result wins.
+- Inputs are read from the shared filesystem when the worker sees the same folder path, and
+  streamed over the connection otherwise.
+- A disconnected worker's files go back to the queue.
+
+Messages are newline-delimited JSON (arrays as base64 float64), one reply per worker message:
+    worker:      {"type": "hello", "version": 1, "worker": name, "slots": n, "token": t}
+    coordinator: {"type": "welcome", "job": {folder, isotope, calibrated, backend, target}}
+    worker:      {"type": "request", "want": k, "stream": bool, "results": [{id, status, ...}]}
+    coordinator: {"type": "tasks", "tasks": [{id, file[, data]}], "revoked": [ids], "done": bool}
+Nothing received is executed, but streamed files are readable by anyone on the network: use it on a
+trusted lab network, with a shared token. The coordinator listens on the loopback interface by
+default and refuses to listen on any other address without a token.
+'''
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+PROTOCOL_VERSION = 1
+POLL_INTERVAL = 0.2
+# Tasks queued per worker process beyond the one it is running
+PREFETCH_PER_SLOT = 1
+RECONNECT_INTERVAL = 5.0
+# Seconds the coordinator waits for the next result before giving up on a campaign
+RESULT_TIMEOUT = 600.0
+
+
+def encode_array(values):
+    values = np.ascontiguousarray(values, dtype='<f8')
+    return {"shape": list(values.shape), "data": base64.b64encode(values.tobytes()).decode("ascii")}
+
+
+def decode_array(encoded):
+    return np.frombuffer(base64.b64decode(encoded["data"]), dtype='<f8').reshape(encoded["shape"])
+
+
+def send_message(stream, message):
+    stream.write((json.dumps(message) + "\n").encode())
+    stream.flush()
+
+
+def read_message(stream):
+    """Next message from a socket stream, or None when the peer has closed the connection."""
+    line = stream.readline()
+    return json.loads(line) if line else None
+
+
+def is_loopback(host):
+    """Whether a listen address only accepts connections from this machine."""
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback if host else False
+    except (OSError, ValueError):
+        return False
+
+
+###### COORDINATOR ######
+
+class Coordinator:
+    """
+    Hands a pipeline's stale files out to TCP workers; used as FolderPipeline.run(processor=...).
+
+    Attributes:
+        pipeline (FolderPipeline): Pipeline whose files are distributed.
+        address (tuple): (host, port) the coordinator listens on.
+        workers (dict): Per-worker statistics (files processed, stolen, streamed).
+        timeout (float): Seconds to wait for the next result before a campaign fails; None waits forever.
+
+    Raises:
+        ValueError: If asked to listen on a non-loopback address without a token.
+    """
+
+    def __init__(self, pipeline, host=DEFAULT_HOST, port=DEFAULT_PORT, token=None, timeout=RESULT_TIMEOUT):
+        if not token and not is_loopback(host):
+            raise ValueError(f"Listening on {host or 'all interfaces'} needs a token; workers on other machines "
+                             f"could otherwise connect and read the files.")
+        self.pipeline = pipeline
+        self.token = token
+        self.timeout = timeout
+        self.workers = {}
+        self._lock = threading.Condition()
+        self._server = socketserver.ThreadingTCPServer((host, port), self._handler_class(), bind_and_activate=False)
+        self._server.daemon_threads = True
+        self._server.allow_reuse_address = True
+        self._server.server_bind()
+        self._server.server_activate()
+        self.address = self._server.server_address
+        self._tasks = []
+        self._pending = deque()
+        self._assigned = {}
+        self._revoked = {}
+        self._results = {}
+        self._active = False
+        self._closing = False
+
+    def _handler_class(self):
+        coordinator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                coordinator.serve_worker(self.rfile, self.wfile, self.client_address)
+        return Handler
+
+    def job(self):
+        pipeline = self.pipeline
+        return {"folder": os.path.abspath(pipeline.folder_path), "isotope": pipeline.isotope,
+                "calibrated": pipeline.calibrated, "backend": pipeline.backend, "target": pipeline.target}
+
+    def serve_forever(self):
+        """Accept workers in the background; they wait until there is work, or until close()."""
+        threading.Thread(target=self._server.serve_forever, name="Coordinator", daemon=True).start()
+
+    def close(self):
+        """Tell the connected workers there is no more work and stop accepting new ones."""
+        with self._lock:
+            self._closing = True
+            self._lock.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __call__(self, tasks, progress=None):
+        """
+        Process pipeline tasks on the connected workers (the FolderPipeline processor interface).
+        Waits for workers to connect; serve_forever() must have been called.
+
+        Returns:
+            list: _process_file-style result dicts, in task order.
+
+        Raises:
+            TimeoutError: If no result arrives for `timeout` seconds (e.g. no worker connected).
+        """
+        with self._lock:
+            self._tasks = tasks
+            self._pending = deque(range(len(tasks)))
+            self._results = {}
+            self._active = True
+            self._lock.notify_all()
+        reported = -1
+        last_result = time.monotonic()
+        with self._lock:
+            while len(self._results) < len(tasks):
+                self._lock.wait(POLL_INTERVAL)
+                if len(self._results) != reported:
+                    reported = len(self._results)
+                    last_result = time.monotonic()
+                    if progress is not None:
+                        progress("distributed", reported, len(tasks))
+                elif self.timeout is not None and time.monotonic() - last_result > self.timeout:
+                    # Stop handing out this campaign's files; the caller closes the coordinator
+                    self._active = False
+                    self._pending.clear()
+                    raise TimeoutError(f"No result from the workers for {self.timeout:g} s; "
+                                       f"{len(tasks) - reported} of {len(tasks)} files unprocessed.")
+        return [self._results[task_id] for task_id in range(len(tasks))]
+
+    def serve_worker(self, rfile, wfile, client_address):
+        hello = read_message(rfile)
+        if hello is None or hello.get("type") != "hello" or hello.get("version") != PROTOCOL_VERSION:
+            return
+        if self.token is not None and hello.get("token") != self.token:
+            send_message(wfile, {"type": "error", "message": "invalid token"})
+            return
+        name = f"{hello.get('worker', 'worker')}@{client_address[0]}:{client_address[1]}"
+        slots = max(1, int(hello.get("slots", 1)))
+        with self._lock:
+            self._assigned[name] = deque()
+            self._revoked[name] = set()
+            self.workers[name] = {"slots": slots, "processed": 0, "stolen": 0, "streamed": 0}
+        print(f"Worker {name} connected with {slots} processes")
+        send_message(wfile, {"type": "welcome", "job": self.job()})
+        try:
+            while True:
+                message = read_message(rfile)
+                if message is None:
+                    break
+                for result in message.get("results", []):
+                    self._record(name, result)
+                with self._lock:
+                    task_ids = self._take(name, int(message.get("want", 0)))
+                    revoked = sorted(self._revoked[name])
+                    self._revoked[name].clear()
+                    done = self._closing or (self._active and len(self._results) == len(self._tasks) and not self._pending)
+                tasks = [self._task_message(task_id, message.get("stream", False), name) for task_id in task_ids]
+                send_message(wfile, {"type": "tasks", "tasks": tasks, "revoked": revoked, "done": done})
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # Also a malformed message: the worker is dropped and its files go to the others
+            print(f"Worker {name} failed: {e!r}")
+        finally:
+            with self._lock:
+                # Whatever the worker still held goes back to the front of the queue
+                lost = [task_id for task_id in self._assigned.pop(name) if task_id not in self._results]
+                self._pending.extendleft(reversed(lost))
+                self._revoked.pop(name, None)
+                self._lock.notify_all()
+            print(f"Worker {name} disconnected" + (f"; {len(lost)} files requeued" if lost else ""))
+
+    def _take(self, name, want):
+        """Assign up to `want` tasks to a worker, stealing queued tasks from the longest backlog if needed."""
+        task_ids = []
+        while self._pending and len(task_ids) < want:
+            task_ids.append(self._pending.popleft())
+        if want and not task_ids:
+            victims = [(len(queue) - self.workers[other]["slots"], other) for other, queue in self._assigned.items() if other != name]
+            backlog, victim = max(victims, default=(0, None))
+            if backlog > 0:
+                # Take from the tail: the most recently queued files are the least likely to have started
+                for _ in range(min(want, (backlog + 1) // 2)):
+                    task_id = self._assigned[victim].pop()
+                    self._revoked[victim].add(task_id)
+                    task_ids.append(task_id)
+                self.workers[name]["stolen"] += len(task_ids)
+        self._assigned[name].extend(task_ids)
+        return task_ids
+
+    def _task_message(self, task_id, stream, name):
+        file_name, arguments = self._tasks[task_id]
+        message = {"id": task_id, "file": file_name}
+        if stream:
+            with open(arguments[0], "rb") as f:
+                message["data"] = base64.b64encode(f.read()).decode("ascii")
+            with self._lock:
+                self.workers[name]["streamed"] += 1
+        return message
+
+    def _record(self, name, result):
+        """
+        Store a worker's result, unless another worker's result for the same file came first.
+
+        Raises:
+            ValueError: If the result does not name a task of the current campaign.
+        """
+        task_id = result.pop("id", None)
+        with self._lock:
+            if type(task_id) is not int or not 0 <= task_id < len(self._tasks):
+                raise ValueError(f"result for unknown task {task_id!r}")
+            if task_id in self._results:
+                return
+        _, arguments = self._tasks[task_id]
+        for key in ("positions", "gains", "summed", "x_values"):
+            if key in result:
+                result[key] = decode_array(result[key])
+        try:
+            entry = store_analysis(result, arguments[1], arguments[2])
+        except (OSError, ValueError) as e:
+            entry = {"status": "error", "message": f"could not store the result: {e}"}
+        with self._lock:
+            if task_id in self._results:
+                return
+            self._results[task_id] = entry
+            self.workers[name]["processed"] += 1
+            for other, queue in self._assigned.items():
+                if task_id in queue:
+                    queue.remove(task_id)
+                    if other != name:
+                        self._revoked[other].add(task_id)
+            self._lock.notify_all()
+
+
+def run_distributed(folder_path, isotope, calibrated=True, backend=None, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                    token=None, local_workers=0, local_processes=1, progress=None):
+    """
+    Run the folder pipeline with its stale files processed by TCP workers.
+
+    Parameters:
+        local_workers (int): Worker programs to start on this machine (e.g. for testing on localhost).
+        local_processes (int): Processes per local worker.
+
+    Returns:
+        tuple: (pipeline report, per-worker statistics).
+    """
+    pipeline = FolderPipeline(folder_path, isotope, calibrated=calibrated, backend=backend)
+    coordinator = Coordinator(pipeline, host, port, token)
+    coordinator.serve_forever()
+    print(f"Coordinator listening on {coordinator.address[0]}:{coordinator.address[1]}")
+    children = []
+    for number in range(local_workers):
+        command = [sys.executable, os.path.abspath(__file__), "worker", f"127.0.0.1:{coordinator.address[1]}",
+                   "--processes", str(local_processes), "--name", f"local{number}"]
+        if token:
+            command += ["--token", token]
+        children.append(subprocess.Popen(command))
+    try:
+        report = pipeline.run(progress=progress, processor=coordinator)
+    finally:
+        coordinator.close()
+        for child in children:
+            try:
+                child.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                child.kill()
+    return report, coordinator.workers
+
+
+###### WORKER ######
+
+def _analyse_task(task, job, stream):
+    """Analyse one file. Runs in a worker process; errors are results, not exceptions."""
+    result = {"id": task["id"]}
+    try:
+        source = io.BytesIO(base64.b64decode(task["data"])) if stream else os.path.join(job["folder"], task["file"])
+        analysis = analyse_file(source, job["isotope"], job["calibrated"], job["backend"], job["target"])
+        for key, value in analysis.items():
+            result[key] = encode_array(value) if isinstance(value, np.ndarray) else value
+    except Exception as e:
+        result.update(status="error", message=str(e))
+    return result
+
+
+def run_worker(host, port, processes=None, name=None, token=None, stream=None):
+    """
+    Connect to a coordinator and process files until it has no more work.
+
+    Parameters:
+        processes (int): Local worker processes; defaults to the CPU count.
+        stream (bool): Receive file contents over the connection; by default only when the
+            coordinator's folder is not visible at the same path here.
+
+    Returns:
+        int: Number of files processed.
+    """
+    processes = processes or os.cpu_count() or 1
+    processed = 0
+    with socket.create_connection((host, port)) as sock, sock.makefile("rb") as rfile, \
+            sock.makefile("wb") as wfile, ProcessPoolExecutor(max_workers=processes) as pool:
+        send_message(wfile, {"type": "hello", "version": PROTOCOL_VERSION, "worker": name or socket.gethostname(),
+                             "slots": processes, "token": token})
+        welcome = read_message(rfile)
+        if welcome is None or welcome.get("type") != "welcome":
+            raise ConnectionError((welcome or {}).get("message", "coordinator closed the connection"))
+        job = welcome["job"]
+        if stream is None:
+            stream = not os.path.isdir(job["folder"])
+        print(f"Processing {job['folder']} for {host}:{port} with {processes} processes"
+              f"{' (streamed inputs)' if stream else ''}")
+
+        queued = deque()
+        running = {}
+        results = []
+        done = False
+        while True:
+            want = max(0, processes * (1 + PREFETCH_PER_SLOT) - len(queued) - len(running))
+            if results or want or not running:
+                send_message(wfile, {"type": "request", "want": want, "stream": stream, "results": results})
+                reply = read_message(rfile)
+                if reply is None:
+                    raise ConnectionError("coordinator closed the connection")
+                processed += len(results)
+                results = []
+                revoked = set(reply["revoked"])
+                queued = deque(task for task in queued if task["id"] not in revoked)
+                queued.extend(reply["tasks"])
+                done = reply["done"]
+            while queued and len(running) < processes:
+                task = queued.popleft()
+                running[pool.submit(_analyse_task, task, job, stream)] = task["id"]
+            if not running:
+                if done:
+                    break
+                time.sleep(POLL_INTERVAL)
+                continue
+            finished, _ = wait(running, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in finished:
+                running.pop(future)
+                results.append(future.result())
+    print(f"Processed {processed} files")
+    return processed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distributed folder processing over TCP.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    coordinate_parser = subparsers.add_parser("coordinate", help="process a folder with connected workers")
+    coordinate_parser.add_argument("folder")
+    coordinate_parser.add_argument("--isotope", default="137Cs")
+    coordinate_parser.add_argument("--raw", action="store_true", help="files have a raw ADC axis instead of energy")
+    coordinate_parser.add_argument("--backend", default=None, choices=PeakFinders.backend_names())
+    coordinate_parser.add_argument("--host", default=DEFAULT_HOST,
+                                   help="listen address; anything but loopback (e.g. 0.0.0.0) needs --token")
+    coordinate_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    coordinate_parser.add_argument("--token", default=None, help="shared secret workers must present")
+    coordinate_parser.add_argument("--local-workers", type=int, default=0, help="workers to start on this machine")
+    coordinate_parser.add_argument("--local-processes", type=int, default=1, help="processes per local worker")
+    worker_parser = subparsers.add_parser("worker", help="process files for a coordinator")
+    worker_parser.add_argument("coordinator", help="host:port")
+    worker_parser.add_argument("--processes", type=int, default=None)
+    worker_parser.add_argument("--name", default=None)
+    worker_parser.add_argument("--token", default=None)
+    worker_parser.add_argument("--stream", action="store_true", help="always receive file contents over the connection")
+    worker_parser.add_argument("--forever", action="store_true", help="wait for the next campaign after each one")
+    args = parser.parse_args(argv)
+
+    if args.command == "coordinate":
+        report, workers = run_distributed(
+            args.folder, args.isotope, calibrated=not args.raw, backend=args.backend, host=args.host, port=args.port,
+            token=args.token, local_workers=args.local_workers, local_processes=args.local_processes,
+            progress=lambda stage, done, total: print(f"{stage}: {done}/{total} files", end="\r"))
+        print(json.dumps({"report": report, "workers": workers}, indent=1))
+        return
+
+    host, port = args.coordinator.rsplit(":", 1)
+    while True:
+        try:
+            run_worker(host, int(port), args.processes, args.name, args.token, True if args.stream else None)
+        except OSError as e:
+            if not args.forever:
+                raise
+            print(f"Coordinator not reachable ({e}); retrying")
+        if not args.forever:
+            return
+        time.sleep(RECONNECT_INTERVAL)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
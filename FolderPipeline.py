@@ -0,0 +1,506 @@
+import os
+import sys
+import json
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from DatasetCache import file_sha256
+from DetectionCache import parameters_key
+import GainDrift
+from GainDrift import GainDriftTracker, align_spectra
+from Instrumentation import span, timed
+from NuclideLibrary import get_library
+import PeakFinders
+from Spectrum import is_capture_file
+
+'''
+Incremental batch processing of a capture folder (the load_folder_contents layout), as a chain of
+stages whose outputs are stored with the hashes of their inputs in the folder's .gamma_tools_pipeline:
+- load: content hash (sha256) of every capture file, re-hashed only when its size or mtime changed.
+- detect: the reference photopeak of the isotope in every channel (detection backend on the full
+  ROI, refined to a sub-bin position). Keyed by the file hash and every detection parameter.
+- calibrate: gain per channel moving the peak onto the target position (library reference energy,
+  or the raw ROI centre), and the file's channels aligned and summed. Keyed by the detect key and target.
+- sum: all calibrated files on the common axis. Updated in place by subtracting the contributions
+  of removed or changed files and adding the new ones.
+- export: <folder>_pipeline_peaks.csv (peak and gain per file and channel) and
+  <folder>_pipeline_combined.csv (the sum), rewritten only when the set of calibrated files changed.
+
+Artifacts are content addressed, so renaming or copying a file reuses its results; only stale files
+are detected and calibrated, in parallel worker processes.
+'''
+
+PIPELINE_DIR = ".gamma_tools_pipeline"
+MANIFEST_NAME = "manifest.json"
+PIPELINE_VERSION = 1
+PEAKS_SUFFIX = "_pipeline_peaks.csv"
+COMBINED_SUFFIX = "_pipeline_combined.csv"
+# Summed outputs (GUI sums, drift-corrected sums, this pipeline's sum) are not captures
+SUMMED_FILE_SUFFIX = "_combined.csv"
+HASH_WORKERS = 8
+
+
+def _save_npz(path, **arrays):
+    """Write an artifact atomically, so an interrupted run never leaves a truncated one behind."""
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def axis_digest(x_values):
+    return parameters_key(np.round(np.asarray(x_values, dtype=np.float64), 9).tolist())
+
+
+def calibrate_spectra(x_values, spectra, positions, target):
+    """
+    Calibrate stage of one file: gain per channel moving its peak onto the target, and the sum of
+    its aligned channels. Channels without a peak follow the file's median gain.
+
+    Returns:
+        tuple: (gains, summed counts).
+    """
+    gains = target / positions
+    gains = np.where(np.isfinite(gains), gains, np.nanmedian(gains))
+    return gains, align_spectra(x_values, spectra, gains).sum(axis=0)
+
+
+def analyse_file(source, isotope, calibrated, backend, target):
+    """
+    Detect and calibrate one file without touching any artifacts (used by remote workers).
+
+    Parameters:
+        source (str or file-like): File path or an open CSV stream.
+
+    Returns:
+        dict: status ("ok", "no_peak" or "single_channel"), axis digest, and the positions,
+            gains, summed counts and x_values arrays that exist for that status.
+    """
+    df = pd.read_csv(source)
+    if df.shape[1] == 2:
+        return {"status": "single_channel"}
+    x_values, spectra = GainDriftTracker.spectra_from_dataframe(df)
+    positions = GainDriftTracker(isotope, calibrated, backend).initial_positions(x_values, spectra)
+    if not np.isfinite(positions).any():
+        return {"status": "no_peak", "axis": axis_digest(x_values), "positions": positions}
+    gains, summed = calibrate_spectra(x_values, spectra, positions, target)
+    return {"status": "ok", "axis": axis_digest(x_values), "positions": positions, "gains": gains,
+            "summed": summed, "x_values": x_values}
+
+
+def store_analysis(result, detect_path, calibrate_path):
+    """
+    Write the artifacts of an analyse_file() result.
+
+    Returns:
+        dict: The result without its arrays, as recorded in the manifest.
+    """
+    if "positions" in result:
+        _save_npz(detect_path, positions=result["positions"])
+    if result["status"] == "ok":
+        _save_npz(calibrate_path, gains=result["gains"], summed=result["summed"], x_values=result["x_values"])
+    return {key: value for key, value in result.items() if not isinstance(value, np.ndarray)}
+
+
+def _process_file(args):
+    """
+    Detect and calibrate one file, reusing whichever of its artifacts already exist. Runs in a worker process.
+
+    Args:
+        args (tuple): (file path, detect artifact path, calibrate artifact path, isotope, calibrated, backend, target).
+
+    Returns:
+        dict: status ("ok", "no_peak", "single_channel" or "error"), axis digest and message.
+    """
+    path, detect_path, calibrate_path, isotope, calibrated, backend, target = args
+    try:
+        if not os.path.isfile(detect_path):
+            return store_analysis(analyse_file(path, isotope, calibrated, backend, target), detect_path, calibrate_path)
+        df = pd.read_csv(path)
+        x_values, spectra = GainDriftTracker.spectra_from_dataframe(df)
+        positions = np.load(detect_path)["positions"]
+        if not np.isfinite(positions).any():
+            return {"status": "no_peak", "axis": axis_digest(x_values)}
+        if not os.path.isfile(calibrate_path):
+            gains, summed = calibrate_spectra(x_values, spectra, positions, target)
+            _save_npz(calibrate_path, gains=gains, summed=summed, x_values=x_values)
+        return {"status": "ok", "axis": axis_digest(x_values)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+class FolderPipeline:
+    """
+    Dependency-tracked load, detect, calibrate, sum and export of every capture file in a folder.
+
+    Attributes:
+        folder_path (str): Data folder.
+        path (str): Pipeline directory holding the manifest and the artifacts.
+        report (dict): Work done by the last run, per stage.
+    """
+
+    def __init__(self, folder_path, isotope, calibrated=True, backend=None, target=None, max_workers=None):
+        """
+        Parameters:
+            folder_path (str): Data folder.
+            isotope (str): Library nuclide whose reference line is detected and aligned.
+            calibrated (bool): Whether the files have an energy axis (keV).
+            backend (str): Detection backend name (default backend when None).
+            target (float): Position every channel is aligned to; by default the library reference
+                energy on calibrated axes, or the centre of the raw ROI.
+            max_workers (int): Number of worker processes; defaults to the CPU count.
+        """
+        self.folder_path = folder_path
+        self.path = os.path.join(folder_path, PIPELINE_DIR)
+        self.isotope = isotope
+        self.calibrated = calibrated
+        self.backend = PeakFinders.get_peak_finder(backend).name
+        self.max_workers = max_workers
+        library = get_library()
+        self.roi = library.roi(isotope, calibrated)
+        if self.roi is None:
+            raise ValueError(f"No {'calibrated' if calibrated else 'raw'} ROI known for {isotope}.")
+        if target is None:
+            target = library.reference_energy(isotope) if calibrated else 0.5 * (self.roi[0] + self.roi[1])
+        self.target = float(target)
+        self.report = {}
+        self._manifest = {"version": PIPELINE_VERSION, "hashes": {}, "files": {}, "sum": None, "export": None}
+        manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        if os.path.isfile(manifest_path):
+            try:
+                with open(manifest_path, "r") as f:
+                    manifest = json.load(f)
+                if manifest.get("version") == PIPELINE_VERSION:
+                    self._manifest.update(manifest)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable pipeline manifest {manifest_path}: {e}")
+
+    def detection_parameters(self):
+        """Everything apart from the file content that determines the detect stage's output."""
+        finder = PeakFinders.get_peak_finder(self.backend)
+        settings = {name: np.asarray(value).tolist() if isinstance(value, np.ndarray) else value
+                    for name, value in vars(finder).items() if not name.startswith('_')}
+        return {
+            "isotope": self.isotope, "calibrated": bool(self.calibrated), "roi": self.roi,
+            "roi_expansion": get_library().roi_expansion(self.isotope),
+            "backend": self.backend, "backend_settings": settings,
+            "refinement": [GainDrift.WINDOW_FRACTION, GainDrift.MIN_WINDOW_BINS,
+                           GainDrift.SMOOTHING_SIGMA, GainDrift.MIN_SIGNIFICANCE],
+        }
+
+    def artifact_path(self, stage, key):
+        return os.path.join(self.path, stage, f"{key}.npz")
+
+    def save_manifest(self):
+        text = json.dumps(self._manifest, indent=1)
+        manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, manifest_path)
+
+    def output_names(self):
+        base = os.path.basename(os.path.normpath(self.folder_path))
+        return f"{base}{PEAKS_SUFFIX}", f"{base}{COMBINED_SUFFIX}"
+
+    def input_files(self):
+        """Capture files of the folder, in name order, leaving out result tables and summed spectra."""
+        return sorted(file_name for file_name in os.listdir(self.folder_path)
+                      if is_capture_file(file_name) and not file_name.endswith(SUMMED_FILE_SUFFIX)
+                      and os.path.isfile(os.path.join(self.folder_path, file_name)))
+
+    ###### STAGES ######
+
+    def load(self, file_names):
+        """
+        Content hash of every file, hashing in parallel only the files whose size or mtime changed.
+
+        Returns:
+            dict: file name -> sha256.
+        """
+        known = self._manifest["hashes"]
+        stats = {file_name: os.stat(os.path.join(self.folder_path, file_name)) for file_name in file_names}
+        stale = [file_name for file_name, stat in stats.items()
+                 if known.get(file_name, {}).get("size") != stat.st_size
+                 or known.get(file_name, {}).get("mtime_ns") != stat.st_mtime_ns]
+        with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+            for file_name, sha256 in zip(stale, pool.map(file_sha256, [os.path.join(self.folder_path, name) for name in stale])):
+                known[file_name] = {"size": stats[file_name].st_size, "mtime_ns": stats[file_name].st_mtime_ns, "sha256": sha256}
+        for file_name in set(known) - set(file_names):
+            del known[file_name]
+        self.report["load"] = {"files": len(file_names), "hashed": len(stale)}
+        return {file_name: known[file_name]["sha256"] for file_name in file_names}
+
+    def detect_and_calibrate(self, hashes, progress=None, processor=None):
+        """
+        Bring every file's detect and calibrate artifacts up to date, processing stale files in parallel.
+
+        Parameters:
+            hashes (dict): file name -> sha256, from load().
+            progress (callable): Optional progress(stage, done, total) callback.
+            processor (callable): Optional processor(tasks, progress) -> results replacing the local
+                process pool, e.g. a distributed coordinator; tasks are (file name, _process_file
+                arguments) pairs and results the _process_file dicts, in task order.
+
+        Returns:
+            dict: file name -> manifest entry (keys, status, axis digest).
+        """
+        detect_parameters = parameters_key(self.detection_parameters())
+        entries = {}
+        tasks = []
+        for file_name, sha256 in hashes.items():
+            entry, arguments = self.file_task(file_name, sha256, detect_parameters)
+            previous = self._manifest["files"].get(file_name)
+            if previous is not None and previous["calibrate_key"] == entry["calibrate_key"] and self._artifacts_exist(previous):
+                entries[file_name] = previous
+                continue
+            entries[file_name] = entry
+            tasks.append((file_name, arguments))
+
+        if tasks:
+            self._make_artifact_dirs()
+        arguments = [task for _, task in tasks]
+        if processor is not None and tasks:
+            results = processor(tasks, progress)
+        elif len(tasks) > 1 and self.max_workers != 1:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                results = list(self._with_progress(pool.map(_process_file, arguments, chunksize=4), len(tasks), progress))
+        else:
+            results = list(self._with_progress(map(_process_file, arguments), len(tasks), progress))
+        for (file_name, _), result in zip(tasks, results):
+            entries[file_name].update(result)
+            if result["status"] == "error":
+                print(f"Pipeline could not process {file_name}: {result['message']}")
+
+        self._manifest["files"] = entries
+        statuses = Counter(entry["status"] for entry in entries.values())
+        self.report["detect_calibrate"] = {"processed": len(tasks), "reused": len(entries) - len(tasks), **statuses}
+        return entries
+
+    def file_task(self, file_name, sha256, detect_parameters=None):
+        """
+        Artifact keys of a file and the arguments of the worker that brings them up to date.
+
+        Returns:
+            tuple: (manifest entry with the keys, argument tuple for _process_file).
+        """
+        detect_parameters = detect_parameters or parameters_key(self.detection_parameters())
+        detect_key = parameters_key([sha256, detect_parameters])
+        calibrate_key = parameters_key([detect_key, self.target])
+        entry = {"sha256": sha256, "detect_key": detect_key, "calibrate_key": calibrate_key}
+        return entry, (os.path.join(self.folder_path, file_name), self.artifact_path("detect", detect_key),
+                       self.artifact_path("calibrate", calibrate_key), self.isotope, self.calibrated, self.backend, self.target)
+
+    def process_file(self, file_name):
+        """
+        Hash, detect and calibrate one file outside a run, e.g. as one task of a queued job.
+        Pass the returned entries to record() so the next run() reuses them.
+
+        Returns:
+            dict: Manifest entry of the file, with its hash record under "hash".
+        """
+        path = os.path.join(self.folder_path, file_name)
+        stat = os.stat(path)
+        sha256 = file_sha256(path)
+        entry, arguments = self.file_task(file_name, sha256)
+        self._make_artifact_dirs()
+        entry.update(_process_file(arguments))
+        entry["hash"] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+        return entry
+
+    def record(self, entries):
+        """Adopt file entries from process_file() (file name -> entry) into the manifest."""
+        for file_name, entry in entries.items():
+            entry = dict(entry)
+            self._manifest["hashes"][file_name] = entry.pop("hash")
+            self._manifest["files"][file_name] = entry
+
+    def _make_artifact_dirs(self):
+        os.makedirs(os.path.join(self.path, "detect"), exist_ok=True)
+        os.makedirs(os.path.join(self.path, "calibrate"), exist_ok=True)
+
+    def _artifacts_exist(self, entry):
+        if entry["status"] == "ok":
+            return os.path.isfile(self.artifact_path("calibrate", entry["calibrate_key"]))
+        if entry["status"] == "no_peak":
+            return os.path.isfile(self.artifact_path("detect", entry["detect_key"]))
+        # Single-channel files are skipped for good; failed files (e.g. caught mid-write) are retried
+        return entry["status"] == "single_channel"
+
+    @staticmethod
+    def _with_progress(results, total, progress):
+        for done, result in enumerate(results, 1):
+            if progress is not None:
+                progress("detect/calibrate", done, total)
+            yield result
+
+    def sum(self, entries):
+        """
+        Sum the calibrated files sharing the most common x-axis, updating the previous sum incrementally.
+
+        Returns:
+            tuple: (x_values, summed counts), or (None, None) if no file was calibrated.
+        """
+        calibrated = {name: entry for name, entry in entries.items() if entry["status"] == "ok"}
+        if not calibrated:
+            self._manifest["sum"] = None
+            self.report["sum"] = {"members": 0}
+            return None, None
+        axes = Counter(entry["axis"] for entry in calibrated.values())
+        # Ties go to the axis of the first file in name order
+        first_axis = calibrated[min(calibrated)]["axis"]
+        axis = max(axes, key=lambda digest: (axes[digest], digest == first_axis))
+        members = {name: entry["calibrate_key"] for name, entry in calibrated.items() if entry["axis"] == axis}
+        excluded = sorted(set(calibrated) - set(members))
+        if excluded:
+            print(f"Pipeline sum leaves out {len(excluded)} files with a different x-axis: {', '.join(excluded[:5])}")
+
+        previous = self._manifest.get("sum")
+        previous_path = previous and self.artifact_path("sum", previous["key"])
+        old_keys = Counter(previous["members"].values()) if previous else Counter()
+        new_keys = Counter(members.values())
+        removed, added = old_keys - new_keys, new_keys - old_keys
+        incremental = (previous is not None and previous["axis"] == axis and os.path.isfile(previous_path)
+                       and all(os.path.isfile(self.artifact_path("calibrate", key)) for key in removed)
+                       and sum(removed.values()) + sum(added.values()) < len(members))
+        if incremental:
+            with np.load(previous_path) as artifact:
+                x_values, total = artifact["x_values"], artifact["summed"].copy()
+        else:
+            x_values, total = None, None
+            removed, added = Counter(), new_keys
+
+        for keys, sign in ((removed, -1.0), (added, 1.0)):
+            for key, count in keys.items():
+                with np.load(self.artifact_path("calibrate", key)) as artifact:
+                    if total is None:
+                        x_values, total = artifact["x_values"], np.zeros_like(artifact["summed"])
+                    total += sign * count * artifact["summed"]
+
+        key = parameters_key(sorted(members.items()))
+        if previous is None or previous["key"] != key:
+            os.makedirs(os.path.join(self.path, "sum"), exist_ok=True)
+            _save_npz(self.artifact_path("sum", key), x_values=x_values, summed=total)
+        self._manifest["sum"] = {"key": key, "axis": axis, "members": members}
+        self.report["sum"] = {"members": len(members), "excluded": len(excluded), "incremental": bool(incremental),
+                              "added": sum(added.values()), "removed": sum(removed.values())}
+        return x_values, total
+
+    def export(self, entries, x_values, summed):
+        """Write the peak table and the summed spectrum into the folder, unless they are already current."""
+        peaks_name, combined_name = self.output_names()
+        sum_key = self._manifest["sum"]["key"] if self._manifest["sum"] else None
+        key = parameters_key([sorted((name, entry["calibrate_key"]) for name, entry in entries.items()), sum_key])
+        outputs = [os.path.join(self.folder_path, name) for name in (peaks_name, combined_name)]
+        if self._manifest.get("export") == key and all(os.path.isfile(path) for path in outputs[:1 + (summed is not None)]):
+            self.report["export"] = {"written": False}
+            return
+
+        calibrations = self.calibrations(entries)
+        peaks = pd.DataFrame({'File': calibrations["file"],
+                              'Channel': [f'Channel_{i}' for i in calibrations["channel_index"]],
+                              'Peak': calibrations["peak"], 'Gain': calibrations["gain"]})
+        peaks.to_csv(outputs[0], index=False)
+        if summed is not None:
+            pd.DataFrame({'Channel/Energy': x_values, 'Counts': summed}).to_csv(outputs[1], index=False)
+        self._manifest["export"] = key
+        self.report["export"] = {"written": True, "rows": len(peaks)}
+
+    def calibrations(self, entries=None):
+        """
+        Peak position and gain of every channel of the processed files, read from the stage artifacts.
+
+        Parameters:
+            entries (dict): Manifest entries to read; by default those of the last run.
+
+        Returns:
+            dict: Equal-length arrays "file", "channel_index", "peak" and "gain" (NaN where no peak
+                was found), one element per file and channel, in file name order.
+        """
+        files, channels, peaks, gains = [], [], [], []
+        for name, entry in sorted((self._manifest["files"] if entries is None else entries).items()):
+            if entry["status"] not in ("ok", "no_peak"):
+                continue
+            positions = np.load(self.artifact_path("detect", entry["detect_key"]))["positions"]
+            if entry["status"] == "ok":
+                with np.load(self.artifact_path("calibrate", entry["calibrate_key"])) as artifact:
+                    gains.append(artifact["gains"])
+            else:
+                gains.append(np.full(positions.shape, np.nan))
+            files.append(np.full(positions.size, name, dtype=object))
+            channels.append(np.arange(positions.size))
+            peaks.append(positions)
+        if not files:
+            return {"file": np.empty(0, dtype=object), "channel_index": np.empty(0, dtype=np.int64),
+                    "peak": np.empty(0), "gain": np.empty(0)}
+        return {"file": np.concatenate(files), "channel_index": np.concatenate(channels),
+                "peak": np.concatenate(peaks), "gain": np.concatenate(gains)}
+
+    def prune(self):
+        """Remove artifacts no longer referenced by the manifest."""
+        referenced = {("detect", entry["detect_key"]) for entry in self._manifest["files"].values()}
+        referenced |= {("calibrate", entry["calibrate_key"]) for entry in self._manifest["files"].values()}
+        if self._manifest["sum"]:
+            referenced.add(("sum", self._manifest["sum"]["key"]))
+        removed = 0
+        for stage in ("detect", "calibrate", "sum"):
+            stage_path = os.path.join(self.path, stage)
+            if not os.path.isdir(stage_path):
+                continue
+            for artifact_name in os.listdir(stage_path):
+                if (stage, artifact_name[:-len(".npz")]) not in referenced:
+                    os.remove(os.path.join(stage_path, artifact_name))
+                    removed += 1
+        self.report["pruned"] = removed
+
+    @timed("FolderPipeline.run")
+    def run(self, progress=None, processor=None):
+        """
+        Bring every stage up to date for the folder's current files.
+
+        Parameters:
+            progress (callable): Optional progress(stage, done, total) callback.
+            processor (callable): Optional replacement for the local process pool; see detect_and_calibrate().
+
+        Returns:
+            dict: The run report (work done per stage and elapsed seconds).
+        """
+        start = time.perf_counter()
+        self.report = {}
+        os.makedirs(self.path, exist_ok=True)
+        with span("pipeline.load"):
+            hashes = self.load(self.input_files())
+        with span("pipeline.detect_calibrate"):
+            entries = self.detect_and_calibrate(hashes, progress, processor)
+        self.save_manifest()
+        with span("pipeline.sum"):
+            x_values, summed = self.sum(entries)
+        with span("pipeline.export"):
+            self.export(entries, x_values, summed)
+        self.save_manifest()
+        self.prune()
+        self.report["seconds"] = time.perf_counter() - start
+        return self.report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incrementally detect, calibrate, sum and export a capture folder.")
+    parser.add_argument("folder", help="folder of capture CSV files")
+    parser.add_argument("--isotope", default="137Cs", help="library nuclide whose reference line is aligned")
+    parser.add_argument("--raw", action="store_true", help="files have a raw ADC axis instead of energy")
+    parser.add_argument("--backend", default=None, choices=PeakFinders.backend_names())
+    parser.add_argument("--target", type=float, default=None, help="position to align the peak to")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    pipeline = FolderPipeline(args.folder, args.isotope, calibrated=not args.raw, backend=args.backend,
+                              target=args.target, max_workers=args.workers)
+    print(json.dumps(pipeline.run(), indent=1))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
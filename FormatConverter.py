@@ -0,0 +1,330 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+
+from DatasetCache import file_sha256
+from Instrumentation import span, timed
+from Spectrum import is_capture_file, compact_counts
+from SpectrumArchive import ARCHIVE_EXTENSION, SpectrumArchive, write_capture_archive
+from WideCSV import get_csv_engine, capture_arrays
+
+'''
+Bulk conversion of a capture folder (the files update_file_list shows) to a binary format:
+- "archive": one SpectrumArchive file (delta-encoded, compressed blocks) per capture.
+- "parquet" / "arrow": one Parquet or Arrow IPC (Feather) part per capture, together a columnar
+  dataset readable with pyarrow.dataset: one row per channel, with the capture file, channel name
+  and index, single-channel flag and total counts as metadata columns, and the x-axis and counts
+  as list columns. Needs pyarrow.
+Files are parsed with the fast WideCSV engines and converted in worker processes. Every output is
+written to a temporary file, read back and checked against the source (sha256 of the parsed axis
+and counts) before it replaces the final file.
+The output folder's _conversion_manifest.json records, per source file, its size, mtime and sha256
+and the output's sha256, so an interrupted or repeated conversion only redoes files that are new,
+changed, failed or whose output is missing (or, with verify, no longer matches its checksum).
+
+    python FormatConverter.py /data/run_12 --format parquet --workers 8
+'''
+
+MANIFEST_NAME = "_conversion_manifest.json"
+CONVERTER_VERSION = 1
+# Converted files between manifest saves, which bounds the work an interruption loses
+SAVE_INTERVAL = 50
+
+
+def data_checksum(x_values, counts):
+    """sha256 of a capture's axis and counts, whatever dtype they were parsed or stored with."""
+    counts = compact_counts(np.atleast_2d(counts))
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(x_values, dtype='<f8').tobytes())
+    digest.update(f"{counts.dtype.str}{counts.shape}".encode())
+    digest.update(np.ascontiguousarray(counts).tobytes())
+    return digest.hexdigest()
+
+
+###### OUTPUT FORMATS ######
+
+class OutputFormat:
+    """
+    A conversion target for single captures.
+
+    Attributes:
+        name (str): Format name.
+        extension (str): Extension of the converted files.
+        write (callable): write(path, file name, column labels, values) with an engine's output.
+        read (callable): read(path, file name) -> (x_values, counts), for checking the output.
+        available (bool): Whether the packages the format needs are installed.
+    """
+
+    def __init__(self, name, extension, write, read, available=True):
+        self.name = name
+        self.extension = extension
+        self.write = write
+        self.read = read
+        self.available = available
+
+
+_formats = {}
+
+
+def register_output_format(output_format):
+    """Make an OutputFormat selectable by its name."""
+    _formats[output_format.name] = output_format
+
+
+def get_output_format(name):
+    """
+    Raises:
+        ValueError: If no format has this name.
+        ImportError: If the format needs a package that is not installed.
+    """
+    if name not in _formats:
+        raise ValueError(f"Unknown output format '{name}'. Available: {', '.join(_formats)}")
+    if not _formats[name].available:
+        raise ImportError(f"The '{name}' format needs the 'pyarrow' package.")
+    return _formats[name]
+
+
+def output_format_names():
+    """Names of the formats that can be written with the installed packages."""
+    return [name for name, output_format in _formats.items() if output_format.available]
+
+
+def _read_archive(path, file_name):
+    with SpectrumArchive(path) as archive:
+        df = archive.read_dataframe(file_name)
+    return capture_arrays(list(df.columns), df)[:2]
+
+
+def capture_table(file_name, labels, values):
+    """
+    Arrow table of one capture, one row per channel.
+
+    Returns:
+        pa.Table: Columns file, channel, channel_index, single_channel, total_counts, x_values, counts.
+    """
+    x_values, counts, single_channel = capture_arrays(labels, values)
+    # One counts type per kind of data, so parts of a dataset share a schema
+    counts = counts.astype(np.int64 if compact_counts(counts).dtype.kind in "iu" else np.float64)
+    num_channels, num_bins = counts.shape
+    offsets = pa.array(np.arange(num_channels + 1, dtype=np.int32) * num_bins)
+    channels = ["Single_Channel"] if single_channel else [f"Channel_{index}" for index in range(num_channels)]
+    return pa.table({
+        "file": pa.array([file_name] * num_channels, type=pa.string()),
+        "channel": pa.array(channels, type=pa.string()),
+        "channel_index": pa.array(np.arange(num_channels, dtype=np.int32)),
+        "single_channel": pa.array(np.full(num_channels, single_channel)),
+        "total_counts": pa.array(counts.sum(axis=1, dtype=np.float64)),
+        "x_values": pa.ListArray.from_arrays(offsets, pa.array(np.tile(x_values, num_channels))),
+        "counts": pa.ListArray.from_arrays(offsets, pa.array(counts.ravel())),
+    })
+
+
+def table_arrays(table):
+    """Axis and counts of a capture table (see capture_table)."""
+    counts = table.column("counts").combine_chunks().flatten().to_numpy(zero_copy_only=False)
+    counts = counts.reshape(table.num_rows, -1)
+    x_values = table.column("x_values").combine_chunks().flatten().to_numpy(zero_copy_only=False)
+    return x_values[:counts.shape[1]], counts
+
+
+register_output_format(OutputFormat(
+    "archive", ARCHIVE_EXTENSION,
+    lambda path, file_name, labels, values: write_capture_archive(path, file_name, labels, values),
+    _read_archive))
+register_output_format(OutputFormat(
+    "parquet", ".parquet",
+    lambda path, file_name, labels, values: pq.write_table(capture_table(file_name, labels, values), path,
+                                                           compression="zstd"),
+    lambda path, file_name: table_arrays(pq.read_table(path)),
+    available=pa is not None))
+register_output_format(OutputFormat(
+    "arrow", ".arrow",
+    lambda path, file_name, labels, values: feather.write_feather(capture_table(file_name, labels, values), path,
+                                                                  compression="zstd"),
+    lambda path, file_name: table_arrays(feather.read_table(path)),
+    available=pa is not None))
+
+
+###### CONVERSION ######
+
+def _convert_file(args):
+    """
+    Convert one capture and check the output against the source. Runs in a worker process.
+
+    Args:
+        args (tuple): (source path, file name, output path, format name, CSV engine).
+
+    Returns:
+        dict: status ("ok" or "error"), the source's size, mtime and sha256, and the checksums and
+            channel count, or the error message.
+    """
+    path, file_name, output_path, format_name, engine = args
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    stat = os.stat(path)
+    result = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    try:
+        output_format = get_output_format(format_name)
+        result["source_sha256"] = file_sha256(path)
+        labels, values = get_csv_engine(engine)(path)
+        x_values, counts, _ = capture_arrays(labels, values)
+        checksum = data_checksum(x_values, counts)
+        output_format.write(tmp_path, file_name, labels, values)
+        if data_checksum(*output_format.read(tmp_path, file_name)) != checksum:
+            raise ValueError("the converted file does not hold the same data as the source")
+        os.replace(tmp_path, output_path)
+        result.update(status="ok", checksum=checksum, output_sha256=file_sha256(output_path), channels=int(counts.shape[0]))
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        result.update(status="error", message=str(e))
+    return result
+
+
+class FolderConverter:
+    """
+    Restartable conversion of a capture folder to one output file per capture.
+
+    Attributes:
+        folder_path (str): Folder of capture CSV files.
+        output_path (str): Output folder, by default <folder>_<format> next to the capture folder.
+        output_format (str): Registered output format name.
+        engine (str): WideCSV engine used to parse the captures.
+        max_workers (int): Conversion processes; defaults to the CPU count.
+        verify (bool): Re-hash existing outputs before reusing them.
+    """
+
+    def __init__(self, folder_path, output_path=None, output_format="archive", engine=None, max_workers=None, verify=False):
+        self.folder_path = folder_path
+        self.output_format = get_output_format(output_format)
+        self.output_path = output_path or f"{os.path.normpath(folder_path)}_{output_format}"
+        self.engine = engine
+        self.max_workers = max_workers
+        self.verify = verify
+        self.report = {}
+        self._manifest = {"version": CONVERTER_VERSION, "format": output_format, "files": {}}
+        manifest_path = os.path.join(self.output_path, MANIFEST_NAME)
+        if os.path.isfile(manifest_path):
+            try:
+                with open(manifest_path, "r") as f:
+                    manifest = json.load(f)
+                if manifest.get("version") == CONVERTER_VERSION and manifest.get("format") == output_format:
+                    self._manifest = manifest
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable conversion manifest {manifest_path}: {e}")
+
+    def save_manifest(self):
+        manifest_path = os.path.join(self.output_path, MANIFEST_NAME)
+        tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(self._manifest, indent=1))
+        os.replace(tmp_path, manifest_path)
+
+    def input_files(self):
+        """Capture files of the folder, as listed by the GUI, in name order."""
+        return sorted(file_name for file_name in os.listdir(self.folder_path)
+                      if is_capture_file(file_name) and os.path.isfile(os.path.join(self.folder_path, file_name)))
+
+    def output_name(self, file_name):
+        return os.path.splitext(file_name)[0] + self.output_format.extension
+
+    def is_current(self, file_name):
+        """Whether a file's output exists, was checked against the unchanged source, and (with verify) is intact."""
+        entry = self._manifest["files"].get(file_name)
+        if entry is None or entry["status"] != "ok":
+            return False
+        stat = os.stat(os.path.join(self.folder_path, file_name))
+        output_path = os.path.join(self.output_path, entry["output"])
+        if entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns or not os.path.isfile(output_path):
+            return False
+        return not self.verify or file_sha256(output_path) == entry["output_sha256"]
+
+    def _convert(self, tasks, progress=None):
+        """Run the tasks in worker processes, recording results in the manifest as they finish."""
+        arguments = [(os.path.join(self.folder_path, file_name), file_name, os.path.join(self.output_path, output_name),
+                      self.output_format.name, self.engine) for file_name, output_name in tasks]
+        if len(tasks) > 1 and self.max_workers != 1:
+            pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            results = pool.map(_convert_file, arguments, chunksize=4)
+        else:
+            pool, results = None, map(_convert_file, arguments)
+        try:
+            for done, ((file_name, output_name), result) in enumerate(zip(tasks, results), start=1):
+                self._manifest["files"][file_name] = dict(result, output=output_name)
+                if result["status"] == "error":
+                    print(f"Could not convert {file_name}: {result['message']}")
+                if done % SAVE_INTERVAL == 0:
+                    self.save_manifest()
+                if progress is not None:
+                    progress("convert", done, len(tasks))
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            self.save_manifest()
+
+    @timed("FolderConverter.run")
+    def run(self, progress=None):
+        """
+        Convert every capture file whose output is missing or out of date.
+
+        Parameters:
+            progress (callable): Optional progress(stage, done, total) callback.
+
+        Returns:
+            dict: The run report (files converted, reused and failed, and elapsed seconds).
+        """
+        start = time.perf_counter()
+        os.makedirs(self.output_path, exist_ok=True)
+        for file_name in os.listdir(self.output_path):
+            # Left by workers of an interrupted run
+            if file_name.endswith(".tmp"):
+                os.remove(os.path.join(self.output_path, file_name))
+        file_names = self.input_files()
+        with span("convert.check"):
+            tasks = [(file_name, self.output_name(file_name)) for file_name in file_names if not self.is_current(file_name)]
+        with span("convert.files"):
+            self._convert(tasks, progress)
+
+        statuses = Counter(self._manifest["files"][file_name]["status"] for file_name, _ in tasks)
+        self.report = {
+            "output": self.output_path, "format": self.output_format.name, "files": len(file_names),
+            "converted": statuses["ok"], "reused": len(file_names) - len(tasks),
+            "failed": {file_name: self._manifest["files"][file_name]["message"] for file_name, _ in tasks
+                       if self._manifest["files"][file_name]["status"] == "error"},
+            "seconds": time.perf_counter() - start,
+        }
+        return self.report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a capture folder to a binary or columnar format.")
+    parser.add_argument("folder", help="folder of capture CSV files")
+    parser.add_argument("--format", default="archive", choices=list(_formats), help="output format")
+    parser.add_argument("--output", default=None, help="output folder (default: <folder>_<format>)")
+    parser.add_argument("--engine", default=None, help="CSV engine used to parse the captures")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--verify", action="store_true", help="re-hash existing outputs before reusing them")
+    args = parser.parse_args(argv)
+
+    converter = FolderConverter(args.folder, args.output, args.format, args.engine, args.workers, args.verify)
+    report = converter.run(progress=lambda stage, done, total: print(f"\r{stage}: {done}/{total}", end="", flush=True))
+    print()
+    print(json.dumps(report, indent=1))
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
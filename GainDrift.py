@@ -0,0 +1,295 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy.ndimage import gaussian_filter1d
+
+from Instrumentation import span, timed
+from NuclideLibrary import get_library, interval_mask
+import PeakFinders
+from Spectrum import bin_edges
+
+'''
+Gain-drift tracking and alignment across sequential capture files:
+- The reference photopeak is located in every channel of every file. Only the first file is
+  searched over the nuclide's full ROI (with the selected detection backend); every later file
+  starts from the previous file's position in each channel and searches a narrow window around it,
+  located for all channels at once with one gather over a 2-D index array.
+- Peak positions give a gain per file and channel that maps each channel onto a common target
+  position (the library reference energy on calibrated axes, otherwise the first file's median
+  position). A robust per-file drift factor (median over channels relative to the first file)
+  stands in for channels where the peak was not found.
+- Spectra are realigned by count-preserving rebinning onto the original x-axis before summing,
+  so sums across channels and files keep sharp peaks.
+
+Gain here is multiplicative (x_true = gain * x); offsets are not modelled.
+'''
+
+# Half-width of the warm-started search window, as a fraction of the previous peak position
+WINDOW_FRACTION = 0.05
+MIN_WINDOW_BINS = 3
+SMOOTHING_SIGMA = 2.0
+MIN_SIGNIFICANCE = 3.0
+
+
+def locate_peaks(x_values, spectra, centres, half_widths, sigma=SMOOTHING_SIGMA, min_significance=MIN_SIGNIFICANCE):
+    """
+    Locate one peak per channel inside a per-channel window, for all channels in one pass.
+
+    Each window is smoothed, a straight line between its end points is subtracted, and the maximum
+    is refined with parabolic interpolation to a sub-bin position.
+
+    Parameters:
+        x_values (np.ndarray): Sorted x-axis.
+        spectra (np.ndarray): Counts shaped (num_channels, num_bins).
+        centres (np.ndarray): Window centre per channel on the x-axis (NaN skips the channel).
+        half_widths (np.ndarray): Window half-width per channel on the x-axis.
+        sigma (float): Gaussian smoothing width in bins.
+        min_significance (float): Minimum height above the line, in Poisson standard deviations.
+
+    Returns:
+        np.ndarray: Peak position per channel on the x-axis, NaN where none was found.
+    """
+    x_values = np.asarray(x_values, dtype=np.float64)
+    spectra = np.atleast_2d(np.asarray(spectra, dtype=np.float64))
+    num_channels, num_bins = spectra.shape
+    centres = np.broadcast_to(np.asarray(centres, dtype=np.float64), (num_channels,))
+    half_widths = np.broadcast_to(np.asarray(half_widths, dtype=np.float64), (num_channels,))
+    positions = np.full(num_channels, np.nan)
+    valid = np.isfinite(centres) & np.isfinite(half_widths)
+    if not valid.any():
+        return positions
+
+    lo = np.searchsorted(x_values, np.where(valid, centres - half_widths, 0.0), side='left')
+    hi = np.searchsorted(x_values, np.where(valid, centres + half_widths, 0.0), side='right')
+    lo = np.minimum(lo, hi - 1)
+    hi = np.minimum(np.maximum(hi, lo + 2 * MIN_WINDOW_BINS + 1), num_bins)
+    lo = np.clip(np.minimum(lo, hi - 2 * MIN_WINDOW_BINS - 1), 0, num_bins - 1)
+    width = int((hi - lo).max())
+
+    # Gather only the windows (plus room for the smoothing kernel), then smooth the gathered block
+    pad = int(np.ceil(4 * sigma))
+    offsets = np.arange(width)
+    index = np.clip(lo[:, np.newaxis] + np.arange(-pad, width + pad), 0, num_bins - 1)
+    inside = offsets < (hi - lo)[:, np.newaxis]
+    rows = np.arange(num_channels)[:, np.newaxis]
+    window = gaussian_filter1d(spectra[rows, index], sigma, axis=1)[:, pad:pad + width]
+
+    # Straight-line continuum between the window end points
+    last = hi - lo - 1
+    start_values = window[:, 0]
+    end_values = window[np.arange(num_channels), last]
+    slope = (end_values - start_values) / np.maximum(last, 1)
+    line = start_values[:, np.newaxis] + slope[:, np.newaxis] * offsets
+    net = np.where(inside, window - line, -np.inf)
+
+    peak = np.argmax(net, axis=1)
+    height = net[np.arange(num_channels), peak]
+    baseline = line[np.arange(num_channels), peak]
+    interior = (peak > 0) & (peak < last)
+    found = valid & interior & (height >= min_significance * np.sqrt(np.maximum(baseline, 1.0)))
+
+    left = window[np.arange(num_channels), np.maximum(peak - 1, 0)]
+    middle = window[np.arange(num_channels), peak]
+    right = window[np.arange(num_channels), np.minimum(peak + 1, width - 1)]
+    curvature = left - 2 * middle + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.where(curvature < 0, 0.5 * (left - right) / curvature, 0.0)
+    fractional_index = lo + peak + np.clip(shift, -0.5, 0.5)
+    positions[found] = np.interp(fractional_index[found], np.arange(num_bins), x_values)
+    return positions
+
+
+def align_spectra(x_values, spectra, gains):
+    """
+    Rebin every spectrum onto the original x-axis after scaling its axis by its gain.
+
+    Counts are redistributed by linear interpolation of the cumulative counts, so totals inside the
+    axis are preserved.
+
+    Parameters:
+        x_values (np.ndarray): Sorted bin centres.
+        spectra (np.ndarray): Counts shaped (num_channels, num_bins) or (num_bins,).
+        gains (np.ndarray or float): Multiplicative gain per channel (NaN leaves a channel unchanged).
+
+    Returns:
+        np.ndarray: Aligned spectra, same shape as spectra.
+    """
+    spectra = np.asarray(spectra, dtype=np.float64)
+    squeeze = spectra.ndim == 1
+    spectra = np.atleast_2d(spectra)
+    gains = np.broadcast_to(np.asarray(gains, dtype=np.float64), (spectra.shape[0],))
+    edges = bin_edges(x_values)
+
+    aligned = spectra.copy()
+    cumulative = np.zeros(spectra.shape[1] + 1)
+    for channel, gain in enumerate(gains):
+        if not np.isfinite(gain) or gain <= 0 or gain == 1.0:
+            continue
+        np.cumsum(spectra[channel], out=cumulative[1:])
+        aligned[channel] = np.diff(np.interp(edges, edges * gain, cumulative))
+    return aligned[0] if squeeze else aligned
+
+
+class GainDriftTracker:
+    """
+    Tracks a reference photopeak through a sequence of capture files and derives gain corrections.
+
+    Attributes:
+        file_names (list): Tracked files, in order.
+        skipped_files (list): Single-channel files left out of the last track().
+        positions (np.ndarray): Peak position per file and channel, shaped (num_files, num_channels); NaN if not found.
+        target (float): Position every channel is aligned to.
+    """
+
+    def __init__(self, isotope, calibrated=True, backend=None, window_fraction=WINDOW_FRACTION, reader=pd.read_csv):
+        """
+        Parameters:
+            isotope (str): Library nuclide whose reference line is tracked.
+            calibrated (bool): Whether the files have an energy axis (keV).
+            backend (str): Detection backend for the first file's full-ROI search.
+            window_fraction (float): Warm-start window half-width relative to the previous position.
+            reader (callable): Reads a file path into a DataFrame.
+        """
+        self.isotope = isotope
+        self.calibrated = calibrated
+        self.backend = backend
+        self.window_fraction = window_fraction
+        self.reader = reader
+        self.file_names = []
+        self.skipped_files = []
+        self.positions = np.zeros((0, 0))
+        self.target = None
+
+    @staticmethod
+    def spectra_from_dataframe(df):
+        return pd.to_numeric(df.columns, errors='coerce').to_numpy(dtype=np.float64), df.to_numpy(dtype=np.float64)
+
+    def initial_positions(self, x_values, spectra):
+        """Full-ROI search of the first file with the detection backend."""
+        library = get_library()
+        roi = library.roi(self.isotope, self.calibrated)
+        if roi is None:
+            raise ValueError(f"No {'calibrated' if self.calibrated else 'raw'} ROI known for {self.isotope}.")
+        expansion = (roi[1] - roi[0]) * library.roi_expansion(self.isotope)
+        mask = interval_mask(x_values, roi[0] - expansion, roi[1] + expansion)
+        found, indices = PeakFinders.get_peak_finder(self.backend).find_batch(x_values, spectra, mask)
+        # Refine the backend's bin to a sub-bin position in a narrow window
+        centres = np.where(found, x_values[indices], np.nan)
+        return locate_peaks(x_values, spectra, centres, self.half_widths(x_values, centres))
+
+    def half_widths(self, x_values, centres):
+        step = np.median(np.abs(np.diff(x_values))) if x_values.size > 1 else 1.0
+        return np.maximum(self.window_fraction * np.abs(centres), MIN_WINDOW_BINS * step)
+
+    @timed("GainDriftTracker.track")
+    def track(self, folder_path, file_names, progress=None):
+        """
+        Locate the reference peak in every channel of every file, warm-starting from the previous file.
+
+        Parameters:
+            folder_path (str): Folder holding the files.
+            file_names (list): Files in acquisition order.
+            progress (callable): Optional progress(done, total) callback.
+
+        Returns:
+            np.ndarray: Peak positions shaped (num_files, num_channels), for the multi-channel files only;
+                the others are listed in skipped_files.
+        """
+        positions = []
+        tracked = []
+        skipped = []
+        previous = None
+        for number, file_name in enumerate(file_names):
+            with span("drift.load"):
+                df = self.reader(os.path.join(folder_path, file_name))
+            if df.shape[1] == 2:
+                # Single-channel outputs (e.g. *_combined.csv) are not part of the capture sequence
+                skipped.append(file_name)
+                continue
+            x_values, spectra = self.spectra_from_dataframe(df)
+            with span("drift.locate"):
+                if previous is None or previous.size != spectra.shape[0] or not np.isfinite(previous).any():
+                    current = self.initial_positions(x_values, spectra)
+                else:
+                    # Channels lost in the previous file restart from the file-wide median drift
+                    centres = np.where(np.isfinite(previous), previous, np.nanmedian(previous))
+                    current = locate_peaks(x_values, spectra, centres, self.half_widths(x_values, centres))
+            positions.append(current)
+            tracked.append(file_name)
+            if np.isfinite(current).any():
+                previous = current
+            if progress is not None:
+                progress(number + 1, len(file_names))
+
+        num_channels = max((len(p) for p in positions), default=0)
+        self.positions = np.full((len(positions), num_channels), np.nan)
+        for number, current in enumerate(positions):
+            self.positions[number, :len(current)] = current
+        self.file_names = tracked
+        self.skipped_files = skipped
+        if self.calibrated and get_library().reference_energy(self.isotope) is not None:
+            self.target = get_library().reference_energy(self.isotope)
+        else:
+            self.target = float(np.nanmedian(self.positions[0])) if self.positions.size else None
+        return self.positions
+
+    def file_drift(self):
+        """
+        Robust per-file drift factor relative to the first file (median over channels).
+
+        Returns:
+            np.ndarray: Factor per file; positions in file f are about file_drift()[f] times those in file 0.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            ratios = self.positions / self.positions[0]
+            return np.nanmedian(np.where(np.isfinite(ratios), ratios, np.nan), axis=1)
+
+    def gains(self):
+        """
+        Gain per file and channel that moves the tracked peak onto the target position.
+        Channels where the peak was not found use the file's median drift and the channel's first
+        known position, or the file's median gain if the channel was never found.
+
+        Returns:
+            np.ndarray: Shaped (num_files, num_channels).
+        """
+        drift = self.file_drift()
+        with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            first_known = np.nanmean(self.positions / drift[:, np.newaxis], axis=0)
+            estimated = np.where(np.isfinite(self.positions), self.positions, first_known[np.newaxis, :] * drift[:, np.newaxis])
+            gains = self.target / estimated
+            file_median = np.nanmedian(np.where(np.isfinite(gains), gains, np.nan), axis=1, keepdims=True)
+        return np.where(np.isfinite(gains), gains, file_median)
+
+    def align_file(self, file_name, x_values, spectra):
+        """Realign the channels of one tracked file onto the target."""
+        number = self.file_names.index(file_name)
+        return align_spectra(x_values, spectra, self.gains()[number, :spectra.shape[0]])
+
+    @timed("GainDriftTracker.sum_files")
+    def sum_files(self, folder_path, file_names=None):
+        """
+        Sum every channel of every tracked file after alignment.
+
+        Returns:
+            tuple: (x_values, summed counts).
+
+        Raises:
+            ValueError: If the files do not share one x-axis.
+        """
+        total = None
+        reference_axis = None
+        gains = self.gains()
+        for file_name in file_names or self.file_names:
+            x_values, spectra = self.spectra_from_dataframe(self.reader(os.path.join(folder_path, file_name)))
+            if reference_axis is None:
+                reference_axis = x_values
+            elif x_values.shape != reference_axis.shape or not np.allclose(x_values, reference_axis, equal_nan=True):
+                raise ValueError(f"{file_name} has a different x-axis from the first file and cannot be summed with it.")
+            aligned = align_spectra(x_values, spectra, gains[self.file_names.index(file_name), :spectra.shape[0]])
+            total = aligned.sum(axis=0) if total is None else total + aligned.sum(axis=0)
+        return reference_axis, total
@@ -1,9 +1,10 @@
 from PyQt6.QtWidgets import (
     QDialog, QMainWindow, QApplication, QPushButton, QVBoxLayout, QWidget, QLabel,
     QMessageBox, QListWidget, QRadioButton, QButtonGroup,
-    QHBoxLayout, QComboBox, QFileDialog, QCheckBox
+    QHBoxLayout, QComboBox, QFileDialog, QCheckBox, QLineEdit
 )
-from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
@@ -13,6 +14,7 @@ import os
 import sys
 import re
 import json
+import time
 from scipy.ndimage import gaussian_filter1d
 
 '''
@@ -22,6 +24,24 @@ from Utils import createHDivider, drag_enter_event, drop_event, browse_path
 from DataStoreUpload import MetadataDialog
 from PhotopeakTools import PhotopeakDetector, MultiISODetector, PeakTuningDialog
 from QuickCalibrate import quick_calibrate
+from CaptureLog import CaptureLog
+from DeadTime import DEAD_TIME_MODELS, LIVE_TIME, times_from_log
+from NuclideLibrary import get_library
+import NuclideID
+from Background import peak_window
+from Spectrum import Spectrum, load_spectrum, parse_windows, is_capture_file
+from WideCSV import DEFAULT_ENGINE, csv_engine_names, read_dataframe
+from DetectionCache import DetectionCache
+from PeakFinders import backend_names, DEFAULT_BACKEND
+from GainDrift import GainDriftTracker
+from FolderPipeline import FolderPipeline
+from FormatConverter import FolderConverter, output_format_names
+from AnalysisExport import share_spectrum
+from JobQueue import submit_job
+from SpectralImaging import Hypercube, HypercubeDialog
+from LiveAcquisition import LiveAcquisition, IncrementalDetector, open_source, DEFAULT_NUM_CHANNELS, DEFAULT_NUM_BINS, MAX_FPS
+import Instrumentation
+from Instrumentation import timed
 
 
 
@@ -65,6 +85,7 @@ class GammaToolsWindow(QMainWindow):
         self.figure = plt.Figure(figsize=(15,9))
         self.canvas = FigureCanvas(self.figure)
         self.canvas.setMinimumSize(1000, 350)
+        self.canvas.draw = timed("canvas.draw")(self.canvas.draw)
         
         self.toolbar = NavigationToolbar(self.canvas, self)
         
@@ -130,11 +151,7 @@ class GammaToolsWindow(QMainWindow):
 
         self.isotope_combo = QComboBox()
         self.isotope_combo.addItem("Select Isotope:")
-        self.isotope_combo.addItem("241Am")
-        self.isotope_combo.addItem("137Cs")
-        self.isotope_combo.addItem("60Co")
-        self.isotope_combo.addItem("241Am | 137Cs")
-        self.isotope_combo.addItem("241Am | 137Cs | 60Co")
+        self.isotope_combo.addItems(get_library().selection_items())
         path_entry_layout.addWidget(self.isotope_combo)
 
         plots_and_lists_layout.addLayout(path_entry_layout)
@@ -153,13 +170,40 @@ class GammaToolsWindow(QMainWindow):
         '''
         settings_layout.addWidget(QLabel("Photopeak settings:"))
         self.detect_peaks_button = QPushButton("Detect Photopeaks")
-        self.detect_peaks_button.clicked.connect(self.detect_peaks)
+        # Timed slots are connected without the 'checked' argument of clicked
+        self.detect_peaks_button.clicked.connect(lambda: self.detect_peaks())
         settings_layout.addWidget(self.detect_peaks_button)
+        self.subtract_background_checkbox = QCheckBox("Subtract continuum (SNIP)")
+        self.subtract_background_checkbox.setChecked(True)
+        settings_layout.addWidget(self.subtract_background_checkbox)
+        settings_layout.addWidget(QLabel("Detection backend:"))
+        self.detection_backend_combo = QComboBox()
+        self.detection_backend_combo.addItems(backend_names())
+        self.detection_backend_combo.setCurrentText(DEFAULT_BACKEND)
+        settings_layout.addWidget(self.detection_backend_combo)
+        settings_layout.addWidget(QLabel("CSV loader:"))
+        self.csv_engine_combo = QComboBox()
+        self.csv_engine_combo.addItems(csv_engine_names())
+        self.csv_engine_combo.setCurrentText(DEFAULT_ENGINE)
+        settings_layout.addWidget(self.csv_engine_combo)
+        self.use_detection_cache_checkbox = QCheckBox("Reuse cached detections")
+        self.use_detection_cache_checkbox.setChecked(True)
+        settings_layout.addWidget(self.use_detection_cache_checkbox)
         
         self.manual_peak_tuning_button = QPushButton("Fine-tune peak")
         self.manual_peak_tuning_button.clicked.connect(self.manual_peak_tuning)
         settings_layout.addWidget(self.manual_peak_tuning_button)
 
+        '''
+        Buttons for identifying nuclides in unknown captures
+        '''
+        self.identify_nuclides_button = QPushButton("Identify Nuclides")
+        self.identify_nuclides_button.clicked.connect(lambda: self.identify_nuclides())
+        settings_layout.addWidget(self.identify_nuclides_button)
+        self.identify_folder_button = QPushButton("Identify All Files")
+        self.identify_folder_button.clicked.connect(lambda: self.identify_folder_nuclides())
+        settings_layout.addWidget(self.identify_folder_button)
+
         '''
         Button for detecting all Photopeaks in file
         '''
@@ -167,6 +211,9 @@ class GammaToolsWindow(QMainWindow):
         self.save_peaks_to_file_button = QPushButton("Save Photopeaks")
         self.save_peaks_to_file_button.clicked.connect(self.save_peaks_to_file)
         settings_layout.addWidget(self.save_peaks_to_file_button)
+        self.share_button = QPushButton("Share With Notebook")
+        self.share_button.clicked.connect(self.share_with_notebook)
+        settings_layout.addWidget(self.share_button)
 
         '''
         Button for clearing all plots and detected peaks
@@ -180,7 +227,7 @@ class GammaToolsWindow(QMainWindow):
         '''
         settings_layout.addWidget(QLabel("Calibration:"))
         self.quick_calibrate_button = QPushButton("Quick Calibrate")
-        self.quick_calibrate_button.clicked.connect(self.quick_calibrate_channel)
+        self.quick_calibrate_button.clicked.connect(lambda: self.quick_calibrate_channel())
         settings_layout.addWidget(self.quick_calibrate_button)
 
         '''
@@ -201,16 +248,81 @@ class GammaToolsWindow(QMainWindow):
         '''
 
         self.sum_channels_button = QPushButton("Sum All Channels")
-        self.sum_channels_button.clicked.connect(self.sum_and_plot_all_channels)
+        self.sum_channels_button.clicked.connect(lambda: self.sum_and_plot_all_channels())
         self.save_summed_spectrum_button = QPushButton("Save Summed spectra")
-        self.save_summed_spectrum_button.clicked.connect(self.save_summed_spectrum)
+        self.save_summed_spectrum_button.clicked.connect(lambda: self.save_summed_spectrum())
         self.norm_chan_button = QPushButton("Normalize All Channels")
-        self.norm_chan_button.clicked.connect(self.normalize_all_channels)
+        self.norm_chan_button.clicked.connect(lambda: self.normalize_all_channels())
+        self.spectral_image_button = QPushButton("Spectral Image")
+        self.spectral_image_button.clicked.connect(self.show_spectral_image)
         
         settings_layout.addWidget(QLabel("Plotting:"))
         settings_layout.addWidget(self.sum_channels_button)
         settings_layout.addWidget(self.save_summed_spectrum_button)
         settings_layout.addWidget(self.norm_chan_button)
+        settings_layout.addWidget(self.spectral_image_button)
+
+        '''
+        Window integrals over the selected channels for arbitrary energy windows
+        '''
+        settings_layout.addWidget(QLabel("Window Integrals:"))
+        self.integral_windows_input = QLineEdit()
+        self.integral_windows_input.setPlaceholderText("e.g. 640-685, 1150-1190")
+        self.integral_windows_input.returnPressed.connect(self.integrate_windows)
+        settings_layout.addWidget(self.integral_windows_input)
+        self.integrate_windows_button = QPushButton("Integrate Windows")
+        self.integrate_windows_button.clicked.connect(self.integrate_windows)
+        settings_layout.addWidget(self.integrate_windows_button)
+
+        '''
+        Gain-drift tracking across sequential files and drift-corrected summing
+        '''
+        settings_layout.addWidget(QLabel("Gain-Drift:"))
+        self.track_drift_button = QPushButton("Track Gain Drift")
+        self.track_drift_button.clicked.connect(self.track_gain_drift)
+        settings_layout.addWidget(self.track_drift_button)
+        self.apply_drift_checkbox = QCheckBox("Apply drift correction")
+        self.apply_drift_checkbox.setEnabled(False)
+        settings_layout.addWidget(self.apply_drift_checkbox)
+        self.sum_files_button = QPushButton("Sum Files (drift-corrected)")
+        self.sum_files_button.clicked.connect(self.sum_drift_corrected_files)
+        settings_layout.addWidget(self.sum_files_button)
+
+        '''
+        Incremental detect, calibrate, sum and export of the whole folder
+        '''
+        settings_layout.addWidget(QLabel("Folder Pipeline:"))
+        self.process_folder_button = QPushButton("Process Folder")
+        self.process_folder_button.clicked.connect(self.process_folder_pipeline)
+        settings_layout.addWidget(self.process_folder_button)
+        self.queue_folder_button = QPushButton("Queue Folder Job")
+        self.queue_folder_button.clicked.connect(self.queue_folder_pipeline)
+        settings_layout.addWidget(self.queue_folder_button)
+
+        '''
+        Checked, restartable conversion of the whole folder to a binary or columnar format
+        '''
+        settings_layout.addWidget(QLabel("Convert Folder To:"))
+        self.output_format_combo = QComboBox()
+        self.output_format_combo.addItems(output_format_names())
+        settings_layout.addWidget(self.output_format_combo)
+        self.convert_folder_button = QPushButton("Convert Folder")
+        self.convert_folder_button.clicked.connect(self.convert_folder)
+        settings_layout.addWidget(self.convert_folder_button)
+
+        '''
+        Live acquisition from a growing capture file, named pipe or DAQ socket
+        '''
+        settings_layout.addWidget(QLabel("Live Acquisition:"))
+        self.live_source_input = QLineEdit()
+        self.live_source_input.setPlaceholderText("capture file or host:port")
+        settings_layout.addWidget(self.live_source_input)
+        self.live_button = QPushButton("Start Live")
+        self.live_button.clicked.connect(self.toggle_live_acquisition)
+        settings_layout.addWidget(self.live_button)
+        self.save_live_button = QPushButton("Save Live Capture")
+        self.save_live_button.clicked.connect(self.save_live_capture)
+        settings_layout.addWidget(self.save_live_button)
         
         '''
         Datastore options for saving detected peaks and spectra
@@ -221,6 +333,44 @@ class GammaToolsWindow(QMainWindow):
         self.open_metadata_dialog_button.clicked.connect(self.open_metadata_dialog)
         settings_layout.addWidget(self.open_metadata_dialog_button)
 
+        '''
+        Capture-log options for joining log entries to files and filtering the file list
+        '''
+        settings_layout.addWidget(QLabel("Capture-Log:"))
+        self.load_capture_log_button = QPushButton("Load Capture Log")
+        self.load_capture_log_button.clicked.connect(self.load_capture_log)
+        settings_layout.addWidget(self.load_capture_log_button)
+        self.capture_log_filter_input = QLineEdit()
+        self.capture_log_filter_input.setPlaceholderText("e.g. hv >= 800, temperature < 30")
+        self.capture_log_filter_input.returnPressed.connect(self.apply_capture_log_filter)
+        settings_layout.addWidget(self.capture_log_filter_input)
+        self.apply_capture_log_filter_button = QPushButton("Filter Files by Log")
+        self.apply_capture_log_filter_button.clicked.connect(self.apply_capture_log_filter)
+        settings_layout.addWidget(self.apply_capture_log_filter_button)
+        settings_layout.addWidget(QLabel("Dead-time correction:"))
+        self.dead_time_model_combo = QComboBox()
+        self.dead_time_model_combo.addItems(DEAD_TIME_MODELS)
+        settings_layout.addWidget(self.dead_time_model_combo)
+        self.dead_time_input = QLineEdit()
+        self.dead_time_input.setPlaceholderText("dead time per event (µs)")
+        settings_layout.addWidget(self.dead_time_input)
+
+        '''
+        Diagnostics options for latency readout and trace recording
+        '''
+        settings_layout.addWidget(QLabel("Diagnostics:"))
+        self.show_latency_checkbox = QCheckBox("Show latency")
+        self.show_latency_checkbox.setChecked(Instrumentation.is_enabled())
+        self.show_latency_checkbox.toggled.connect(self.toggle_latency_readout)
+        settings_layout.addWidget(self.show_latency_checkbox)
+        self.record_trace_checkbox = QCheckBox("Record trace")
+        self.record_trace_checkbox.setChecked(Instrumentation.is_tracing())
+        self.record_trace_checkbox.toggled.connect(Instrumentation.set_tracing)
+        settings_layout.addWidget(self.record_trace_checkbox)
+        self.save_trace_button = QPushButton("Save Trace")
+        self.save_trace_button.clicked.connect(self.save_trace)
+        settings_layout.addWidget(self.save_trace_button)
+
         list_layout.addLayout(settings_layout)
 
         '''
@@ -243,6 +393,20 @@ class GammaToolsWindow(QMainWindow):
         '''
         self.file_channels = {}
         self.selected_channel = None
+        self.capture_log = None
+        self.capture_log_rows = {}
+        self.drift_tracker = None
+        self.detection_cache = None
+        self.live_acquisition = None
+        self.finished_live_acquisition = None
+        self.live_detector = None
+        self.shared_spectra = []
+        self.live_timer = QTimer(self)
+        self.live_timer.setInterval(int(1000 / MAX_FPS))
+        self.live_timer.timeout.connect(self.refresh_live_plot)
+        self.latency_label = QLabel("")
+        self.statusBar().addPermanentWidget(self.latency_label)
+        self.latency_label.setVisible(Instrumentation.is_enabled())
         self.load_last_used_folder()
         self.showMaximized()
         
@@ -274,21 +438,39 @@ class GammaToolsWindow(QMainWindow):
     Event handling methods
     '''
 
+    def showEvent(self, event):
+        # The main menu reopens the same window after it is closed, so the readout listens while shown
+        Instrumentation.add_listener(self.on_span_finished)
+        super().showEvent(event)
+
     def closeEvent(self, event):
+        self.stop_live_acquisition()
+        for shared in self.shared_spectra:
+            shared.close()
+        self.shared_spectra = []
+        Instrumentation.remove_listener(self.on_span_finished)
         self.closed.emit()
         super().closeEvent(event)
     
+    @timed("load_csv")
+    def read_spectrum_file(self, file_path):
+        """
+        Read a spectrum CSV file into a DataFrame, parsed by the selected CSV loader.
+        """
+        return read_dataframe(file_path, self.csv_engine_combo.currentText())
+
     def load_folder_contents(self, folder_path):
         """
         Load the contents of the specified folder and update the file list.
         """
         if os.path.isdir(folder_path):
-            csv_files = [file for file in os.listdir(folder_path) if file.endswith('.csv')]
+            csv_files = [file for file in os.listdir(folder_path) if is_capture_file(file)]
             if csv_files:
-                csv_files.sort(key=lambda x: self.extract_number_from_filename(x) if re.search(r'\d+', x) else x)
+                csv_files.sort(key=lambda x: self.extract_number_from_filename(x))
                 self.file_list_widget.clear()
                 self.file_list_widget.addItems(csv_files)
                 self.file_path_label.setText(folder_path)
+                self.join_capture_log()
             else:
                 QMessageBox.warning(self, "Warning", "No CSV files found in the selected directory.")
         else:
@@ -317,11 +499,12 @@ class GammaToolsWindow(QMainWindow):
     def update_file_list(self):
         folder_path = self.file_path_label.text()
         if os.path.isdir(folder_path):
-            csv_files = [file for file in os.listdir(folder_path) if file.endswith('.csv')]
+            csv_files = [file for file in os.listdir(folder_path) if is_capture_file(file)]
             if csv_files:
                 csv_files.sort(key=lambda x: self.extract_number_from_filename(x))
                 self.file_list_widget.clear()
                 self.file_list_widget.addItems(csv_files)
+                self.join_capture_log()
     
     def connect_signals(self):
         self.channel_list_widget.itemClicked.connect(self.on_channel_selected)
@@ -369,7 +552,7 @@ class GammaToolsWindow(QMainWindow):
         
         if channel_text != self.selected_channel:
             self.selected_channel = channel_text
-            if self.isotope_combo.currentText() == "241Am | 137Cs" or self.isotope_combo.currentText() == "241Am | 137Cs | 60Co":
+            if len(get_library().split_selection(self.isotope_combo.currentText())) > 1:
                 self.plot_multi_peaks()
             else:
                 self.plot_single_channel()
@@ -382,7 +565,10 @@ class GammaToolsWindow(QMainWindow):
         
     def on_file_selected(self, item):
         self.selected_file = item.text()
-        self.plot_all_channels()
+        self.show_capture_log_entry()
+        self.detected_peak_list.clear()
+        if not self.restore_cached_peaks(plot_channel=False):
+            self.plot_all_channels()
             
         
     def on_file_selection_changed(self):
@@ -398,19 +584,20 @@ class GammaToolsWindow(QMainWindow):
     '''
     Updating channel list for different file selection
     '''
+    @timed()
     def update_channel_list(self, item):
         selected_file = item.text()
         file_path = os.path.join(self.file_path_label.text(), selected_file)
         if os.path.isfile(file_path):
-            df = pd.read_csv(file_path)
-            if df.shape[1] == 2:
+            spectrum = self.get_spectrum(selected_file)
+            if spectrum.single_channel:
                 self.channel_list_widget.clear()
                 self.channel_list_widget.addItem("Single_Channel")
                 self.file_channels[selected_file] = ["Single_Channel"]
 
                 self.disable_sum_channels_button()
             else:
-                channels = [f'Channel_{i}' for i in range(df.shape[0])]
+                channels = spectrum.channel_names()
                 self.channel_list_widget.clear()
                 self.channel_list_widget.addItems(channels)
                 self.file_channels[selected_file] = channels
@@ -421,12 +608,79 @@ class GammaToolsWindow(QMainWindow):
     '''
     Automatic Photopeak detection for all channels
     '''
+    @timed()
     def detect_peaks(self):
-        if self.isotope_combo.currentText() == "241Am | 137Cs":
-            isotopes = ["241Am", "137Cs"]
-            MultiISODetector.run_multi_detection(self, isotopes)
+        isotopes = get_library().split_selection(self.isotope_combo.currentText())
+        if self.restore_cached_peaks():
+            return
+        if len(isotopes) > 1:
+            detected_peaks = MultiISODetector.run_multi_detection(self, isotopes)
         else:
-            PhotopeakDetector.run_detection(self)
+            detected_peaks = PhotopeakDetector.run_detection(self)
+        if detected_peaks is None or not self.detection_cacheable(isotopes):
+            return
+
+        selection = self.isotope_combo.currentText()
+        calibrated = self.calibrated_radio.isChecked()
+        try:
+            cache = self.get_detection_cache()
+            with cache.batch():
+                cache.store(self.selected_file, selection, calibrated,
+                            PhotopeakDetector.detection_parameters(self, isotopes), detected_peaks)
+                fixed_peaks = cache.apply_overrides(self.selected_file, selection, calibrated, detected_peaks)
+        except OSError as e:
+            print(f"Error caching detected peaks: {str(e)}")
+            return
+        if fixed_peaks != [(channel, float(position)) for channel, position in detected_peaks]:
+            self.show_detected_peaks(fixed_peaks)
+
+    '''
+    Detection cache: restoring earlier results for the selected file and settings
+    '''
+    def get_detection_cache(self):
+        folder_path = self.file_path_label.text()
+        if self.detection_cache is None or self.detection_cache.folder_path != folder_path:
+            self.detection_cache = DetectionCache(folder_path)
+        return self.detection_cache
+
+    def detection_cacheable(self, isotopes):
+        return (self.selected_file is not None and bool(isotopes)
+                and all(get_library().reference_energy(isotope) is not None for isotope in isotopes))
+
+    def show_detected_peaks(self, detected_peaks):
+        self.detected_peak_list.clear()
+        self.detected_peak_list.addItems([f"{channel}: Peak at {position:.2f} keV" for channel, position in detected_peaks])
+
+    def restore_cached_peaks(self, plot_channel=True):
+        """
+        Show the cached peaks of the selected file for the current isotope selection and detection
+        settings, with manual fixes applied.
+
+        Returns:
+            bool: True if cached peaks were restored.
+        """
+        isotopes = get_library().split_selection(self.isotope_combo.currentText())
+        if not self.use_detection_cache_checkbox.isChecked() or not self.detection_cacheable(isotopes):
+            return False
+        try:
+            detected_peaks = self.get_detection_cache().lookup(self.selected_file, self.isotope_combo.currentText(),
+                                                               self.calibrated_radio.isChecked(),
+                                                               PhotopeakDetector.detection_parameters(self, isotopes))
+        except OSError as e:
+            print(f"Error reading the detection cache: {str(e)}")
+            return False
+        if detected_peaks is None:
+            return False
+
+        self.show_detected_peaks(detected_peaks)
+        if not plot_channel or self.selected_channel is None or self.last_plot_all_channels:
+            self.plot_all_channels_with_peaks(self.get_spectrum(), detected_peaks)
+        elif len(isotopes) > 1:
+            self.plot_multi_peaks()
+        else:
+            self.plot_single_channel()
+        self.statusBar().showMessage(f"Restored {len(detected_peaks)} cached peaks for {self.selected_file}.")
+        return True
     ''' 
     Plotting/visualization methods
     '''
@@ -459,17 +713,9 @@ class GammaToolsWindow(QMainWindow):
             QMessageBox.warning(self, "Warning", "Please select an isotope first.")
             return
 
-        file_path = os.path.join(self.file_path_label.text(), self.selected_file)
-        df = pd.read_csv(file_path)
-
-        if self.selected_channel == "Single_Channel":
-            x_values = pd.to_numeric(df.iloc[:, 0], errors='coerce')
-            y_values = df.iloc[:, 1].values
-        else:
-            channel_index = int(self.selected_channel.split('_')[1])
-            channel_data = df.iloc[channel_index]
-            x_values = pd.to_numeric(df.columns, errors='coerce')
-            y_values = channel_data.values
+        spectrum = self.get_spectrum()
+        x_values = spectrum.x_values
+        y_values = spectrum.channel(self.selected_channel, np.float64)
 
         peak_range_mask = (x_values > selected_peak_position - 100) & (x_values < selected_peak_position + 100)
         peak_x_values = x_values[peak_range_mask]
@@ -481,6 +727,12 @@ class GammaToolsWindow(QMainWindow):
 
             updated_peak_info = f"{self.selected_channel}: Peak at {new_peak_position:.2f} keV"
             peak_item.setText(updated_peak_info)
+            if self.detection_cacheable(get_library().split_selection(isotope)):
+                try:
+                    self.get_detection_cache().set_override(self.selected_file, isotope, self.calibrated_radio.isChecked(),
+                                                            self.selected_channel, selected_peak_position, new_peak_position)
+                except OSError as e:
+                    print(f"Error caching the fine-tuned peak: {str(e)}")
 
             self.figure.clear()
             self.ax = self.figure.add_subplot(111)
@@ -505,14 +757,16 @@ class GammaToolsWindow(QMainWindow):
             item_text = self.detected_peak_list.item(i).text()
             channel, peak = item_text.split(':')
             peak_value = float(peak.strip().split(' ')[2])
-            peak_data.append((channel.strip(), peak_value))
+            net, uncertainty = self.get_peak_net_area(channel.strip(), peak_value)
+            peak_data.append((channel.strip(), peak_value, net, uncertainty))
         
         original_filename = os.path.splitext(self.selected_file)[0]
-        peaks_filename = f"{original_filename}_peaks.csv"
+        peaks_filename = os.path.join(self.file_path_label.text(), f"{original_filename}_peaks.csv")
         
-        df_peaks = pd.DataFrame(peak_data, columns=['Channel', 'Peak (keV)'])
+        df_peaks = pd.DataFrame(peak_data, columns=['Channel', 'Peak (keV)', 'Net Counts', 'Net Counts Uncertainty'])
         df_peaks.to_csv(peaks_filename, index=False)
-        QMessageBox.information(self, "Save Complete", f"Peaks saved to file successfully: {peaks_filename}")           
+        QMessageBox.information(self, "Save Complete", f"Peaks saved to file successfully: {peaks_filename}\n"
+                                "Net counts cover the peak window with edge bins counted in proportion to their overlap.")           
     
     
     def get_detected_peaks(self):
@@ -528,28 +782,90 @@ class GammaToolsWindow(QMainWindow):
         print(f"Detected peaks: {detected_peaks}")
         return detected_peaks
 
+    def get_listed_peaks(self):
+        """(channel name, peak position) of every peak in the detected peaks list."""
+        peaks = []
+        for i in range(self.detected_peak_list.count()):
+            item_text = self.detected_peak_list.item(i).text()
+            try:
+                channel, peak = item_text.split(':')
+                peaks.append((channel.strip(), float(peak.strip().split(' ')[2])))
+            except (IndexError, ValueError) as e:
+                print(f"Error parsing detected peak from item text '{item_text}': {e}")
+        return peaks
+
+    def share_with_notebook(self):
+        """
+        Put the selected file's spectrum, its listed peaks and (when gain drift was tracked) its channel
+        gains in shared memory, for a notebook to map with AnalysisExport.attach_spectrum without
+        re-reading anything. The block is removed when the window closes.
+        """
+        if not self.selected_file:
+            QMessageBox.warning(self, "Error", "No file selected.")
+            return
+        spectrum = self.get_spectrum()
+        gains = None
+        tracker = self.drift_tracker
+        if tracker is not None and self.selected_file in tracker.file_names:
+            gains = tracker.gains()[tracker.file_names.index(self.selected_file), :spectrum.num_channels]
+        try:
+            shared = share_spectrum(spectrum, self.get_listed_peaks(), gains,
+                                    name=f"gamma_tools_{os.getpid()}_{len(self.shared_spectra)}")
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Could not share the spectrum: {str(e)}")
+            print(f"Error sharing spectrum: {str(e)}")
+            return
+        self.shared_spectra.append(shared)
+        self.statusBar().showMessage(f"Shared {self.selected_file} as '{shared.name}' until this window closes.")
+        print(f"Attach from a notebook with: from AnalysisExport import attach_spectrum; shared = attach_spectrum('{shared.name}')")
+
+    def get_channel_spectrum(self, spectrum, channel):
+        """
+        X-values, counts and cached SNIP continuum of one channel ('Channel_<n>' or 'Single_Channel').
+        The continuum is estimated for all channels of the file at once.
+        """
+        channel_index = spectrum.channel_indices(channel)[0]
+        return spectrum.x_values, spectrum.channel(channel, np.float64), spectrum.background()[channel_index]
+
+    def get_spectrum(self, file_name=None):
+        """
+        Cached Spectrum (compact counts, cumulative sums for window integrals) of a file in the folder,
+        by default the selected file.
+        """
+        file_path = os.path.join(self.file_path_label.text(), file_name or self.selected_file)
+        return load_spectrum(file_path, self.calibrated_radio.isChecked(), engine=self.csv_engine_combo.currentText())
+
+    def get_peak_net_area(self, channel, peak_energy):
+        """
+        Net counts above the SNIP continuum in the integration window around a detected peak
+        (Spectrum.net). The window is integrated with sub-bin interpolation, so a bin cut by a window
+        edge counts for the part of it inside the window, not in full as in an inclusive bin sum.
+
+        Returns:
+            tuple: (net counts, uncertainty).
+        """
+        spectrum = self.get_spectrum()
+        low, high = peak_window(spectrum.x_values, peak_energy, self.calibrated_radio.isChecked())
+        net, uncertainty = spectrum.net(low, high, channel)
+        return float(net[0]), float(uncertainty[0])
+
     def get_known_energies(self):
         isotope = self.isotope_combo.currentText()
-        known_energies = {
-            "241Am": 59.54,
-            "137Cs": 661.66,
-            "60Co": 1173.23,
-        }
-        known_energy = known_energies.get(isotope, None)
+        known_energy = get_library().reference_energy(isotope)
         print(f"Known energy for {isotope}: {known_energy}")
         return [known_energy] if known_energy else []
     
     
 ######   PLOTTING METHODS   ######
     
-    def plot_all_channels(self, df=None):
+    @timed()
+    def plot_all_channels(self, spectrum=None, y_label='Counts'):
         """
-        Plot all channels in the spectral file or a provided DataFrame.
+        Plot all channels in the spectral file or a provided Spectrum.
         """
-        if df is None:
-            file_path = os.path.join(self.file_path_label.text(), self.selected_file)
+        if spectrum is None:
             try:
-                df = pd.read_csv(file_path)
+                spectrum = self.get_spectrum()
             except Exception as e:
                 QMessageBox.critical(self, "Error", str(e))
                 print(f"Error in loading the file: {str(e)}")
@@ -558,37 +874,26 @@ class GammaToolsWindow(QMainWindow):
         self.figure.clear()
         ax = self.figure.add_subplot(111)
 
-        if df.shape[1] == 2:
-            x_values = pd.to_numeric(df.iloc[:, 0], errors='coerce')
-            y_values = df.iloc[:, 1].values
-            ax.plot(x_values, y_values, label="Single_Channel")
-        else:
-            num_channels = df.shape[0]
-            for index in range(num_channels):
-                channel_data = df.iloc[index, :]
-                channel_data.index = pd.to_numeric(channel_data.index, errors='coerce')
-                channel_name = f'Channel_{index}'
-                ax.plot(channel_data.index, channel_data.values, label=channel_name)
+        for channel_name, y_values in zip(spectrum.channel_names(), spectrum.counts):
+            ax.plot(spectrum.x_values, y_values, label=channel_name)
 
         ax.set_title(f'All Channels in {self.selected_file}')
         ax.set_xlabel('Energy (keV)' if self.calibrated_radio.isChecked() else 'ADC')
-        ax.set_ylabel('Counts')
+        ax.set_ylabel(y_label)
 
         self.canvas.draw()
         self.last_plot_all_channels = True
         
-    def plot_all_channels_with_peaks(self, df, detected_peaks):
+    @timed()
+    def plot_all_channels_with_peaks(self, spectrum, detected_peaks):
         """
-        Plot all channels and mark detected peaks.
+        Plot all channels of a Spectrum and mark detected peaks.
         """
         self.figure.clear()
         ax = self.figure.add_subplot(111)
 
-        for index, row in df.iterrows():
-            channel_name = f'Channel_{index}'
-            x_values = pd.to_numeric(df.columns, errors='coerce')
-            y_values = row.values
-            ax.plot(x_values, y_values, label=channel_name)
+        for channel_name, y_values in zip(spectrum.channel_names(), spectrum.counts):
+            ax.plot(spectrum.x_values, y_values, label=channel_name)
 
         for channel_name, peak_energy in detected_peaks:
             ax.axvline(x=peak_energy, color='r', linestyle='--', linewidth = 0.5)
@@ -604,39 +909,25 @@ class GammaToolsWindow(QMainWindow):
     '''
     Plotting a single channel spectra
     '''
+    @timed()
     def plot_single_channel(self):        
-        file_path = os.path.join(self.file_path_label.text(), self.selected_file)
-        df = pd.read_csv(file_path)
+        spectrum = self.get_spectrum()
         self.figure.clear()
         ax = self.figure.add_subplot(111)
 
-        if self.selected_channel == "Single_Channel":
-            x_values = df.iloc[:, 0]  
-            y_values = df.iloc[:, 1]  
-        else:
-            try:
-                channel_index = int(self.selected_channel.split('_')[1])
-                channel_data = df.iloc[channel_index]
-                x_values = pd.to_numeric(df.columns, errors='coerce')
-                y_values = channel_data.values
-            except ValueError as e:
-                QMessageBox.critical(self, "Error", f"Failed to parse channel index from {self.selected_channel}: {e}")
-                return
-        ref_e = 0
-        if self.isotope_combo.currentText() == "241Am":
-            ref_e = 59.7
-        if self.isotope_combo.currentText() == "137Cs":
-            ref_e = 661.9
-        if self.isotope_combo.currentText() == "60Co":
-            ref_e = 1172.3
-            ref_e1 = 1332.5
-        else:
-            ref_e1 = None
+        x_values = spectrum.x_values
+        try:
+            y_values = spectrum.channel(self.selected_channel, np.float64)
+        except (ValueError, IndexError) as e:
+            QMessageBox.critical(self, "Error", f"Failed to parse channel index from {self.selected_channel}: {e}")
+            return
         ax.plot(x_values, y_values)
+        if self.subtract_background_checkbox.isChecked():
+            _, _, background = self.get_channel_spectrum(spectrum, self.selected_channel)
+            ax.plot(x_values, background, linestyle='--', linewidth=0.7, color='g', label='SNIP continuum')
         if self.calibrated_radio.isChecked():
-            ax.axvline(x = ref_e, linestyle = 'dotted', linewidth = 0.7, color = 'k', label = f'Iso ref energy @ {ref_e}')
-        if ref_e1 is not None:
-            ax.axvline(x = ref_e1)
+            for ref_e in get_library().reference_energies(self.isotope_combo.currentText()):
+                ax.axvline(x = ref_e, linestyle = 'dotted', linewidth = 0.7, color = 'k', label = f'Iso ref energy @ {ref_e}')
         ax.set_title(f'{self.selected_channel}')
         ax.set_xlabel('Energy (keV)' if self.calibrated_radio.isChecked() else 'ADC')
         ax.set_ylabel('Counts')
@@ -649,7 +940,9 @@ class GammaToolsWindow(QMainWindow):
                 smoothed_y =  gaussian_filter1d(y_values, sigma=15)
                 ax.plot(x_values, smoothed_y, label = 'Smoothed data', linewidth = 0.5, color ='r', alpha =0.5)
                 
-                ax.axvline(x=peak_energy, color='r', linestyle='--', linewidth = 0.5, label=f'Peak at {peak_energy:.2f} keV')
+                net, uncertainty = self.get_peak_net_area(self.selected_channel, peak_energy)
+                ax.axvline(x=peak_energy, color='r', linestyle='--', linewidth = 0.5,
+                           label=f'Peak at {peak_energy:.2f} keV (net {net:.0f} ± {uncertainty:.0f})')
                 ax.legend()
                 break
 
@@ -657,32 +950,24 @@ class GammaToolsWindow(QMainWindow):
         self.last_plot_all_channels = False
     
     
+    @timed()
     def plot_multi_peaks(self):
-            file_path = os.path.join(self.file_path_label.text(), self.selected_file)
-            df = pd.read_csv(file_path)
+            spectrum = self.get_spectrum()
             self.figure.clear()
             ax = self.figure.add_subplot(111)
 
-            if self.selected_channel == "Single_Channel":
-                x_values = df.iloc[:, 0]
-                y_values = df.iloc[:, 1]
-            else:
-                try:
-                    channel_index = int(self.selected_channel.split('_')[1])
-                    channel_data = df.iloc[channel_index]
-                    x_values = pd.to_numeric(df.columns, errors='coerce')
-                    y_values = channel_data.values
-                except ValueError as e:
-                    QMessageBox.critical(self, "Error", f"Failed to parse channel index from {self.selected_channel}: {e}")
-                    return
+            x_values = spectrum.x_values
+            try:
+                y_values = spectrum.channel(self.selected_channel, np.float64)
+            except (ValueError, IndexError) as e:
+                QMessageBox.critical(self, "Error", f"Failed to parse channel index from {self.selected_channel}: {e}")
+                return
 
             ax.plot(x_values, y_values, label='Channel Data')
 
-            reference_energies = {
-                "241Am": [59.54],
-                "137Cs": [661.66],
-                "60Co": [1173.23, 1332.5]
-            }
+            library = get_library()
+            reference_energies = {isotope: library.reference_energies(isotope)
+                                  for isotope in library.split_selection(self.isotope_combo.currentText())}
 
             detected_peaks = []
 
@@ -703,9 +988,8 @@ class GammaToolsWindow(QMainWindow):
             # Plot reference energies if calibrated radio is checked
             if self.calibrated_radio.isChecked():
                 for isotope, energies in reference_energies.items():
-                    if isotope in self.isotope_combo.currentText():
-                        for energy in energies:
-                            ax.axvline(x=energy, linestyle='dotted', linewidth=0.7, color='k', label=f'{isotope} Ref energy @ {energy} keV')
+                    for energy in energies:
+                        ax.axvline(x=energy, linestyle='dotted', linewidth=0.7, color='k', label=f'{isotope} Ref energy @ {energy} keV')
 
             ax.set_title(f'{self.selected_channel}')
             ax.set_xlabel('Energy (keV)' if self.calibrated_radio.isChecked() else 'ADC')
@@ -717,16 +1001,30 @@ class GammaToolsWindow(QMainWindow):
 
 ###### DATA-PROCESSING METHODS ######
             
+    @timed()
     def normalize_all_channels(self):
             """
-            Normalize all channels in the DataFrame and replot.
+            Normalize every bin by its total over all channels (a single channel by its total counts) and replot.
+            Channels with their own live/real times in the capture log are weighted by their dead-time corrected
+            rates, so the per-bin channel fractions keep the correction. A single channel's own total would divide
+            it out, so a corrected single-channel file is plotted as its count rate instead.
             """
-            file_path = os.path.join(self.file_path_label.text(), self.selected_file)
             try:
-                df = pd.read_csv(file_path)
-                normalized_df = df.div(df.sum(axis=0), axis=1)
+                spectrum = self.get_spectrum()
+                times = self.get_acquisition_times(self.selected_file, spectrum)
+                counts = spectrum.counts if times is None else spectrum.count_rates(times)
+                if times is not None and spectrum.single_channel:
+                    self.plot_all_channels(Spectrum(counts, spectrum.x_values, spectrum.calibrated, spectrum.name, True),
+                                           f'Count rate (cps, {times.describe()})')
+                    self.statusBar().showMessage("Single channel shown as its corrected count rate; unit area would cancel the correction.")
+                    return
+                totals = counts.sum(axis=1 if spectrum.single_channel else 0, keepdims=True, dtype=np.float64)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    normalized = counts / totals
 
-                self.plot_all_channels(normalized_df)
+                y_label = 'Counts' if times is None else f'Fraction of count rate ({times.describe()})'
+                self.plot_all_channels(Spectrum(normalized, spectrum.x_values, spectrum.calibrated, spectrum.name,
+                                                spectrum.single_channel), y_label)
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"An error occurred during normalization: {str(e)}")
                 print(f"Error in normalization: {str(e)}")
@@ -734,48 +1032,90 @@ class GammaToolsWindow(QMainWindow):
     '''
     Plot channel-summed spectra
     '''
+    @timed()
     def sum_and_plot_all_channels(self):
         if self.selected_file is None:
             QMessageBox.warning(self, "Error", "No file selected. Please select a file first.")
             return
         
-        file_path = os.path.join(self.file_path_label.text(), self.selected_file)
-        df = pd.read_csv(file_path)
         try:
-            sum_spectrum = df.sum(axis=0)
-            x_values = pd.to_numeric(df.columns, errors='coerce')
-
+            spectrum = self.get_spectrum()
+            times = self.get_acquisition_times(self.selected_file, spectrum)
+            x_values, sum_spectrum = self.get_summed_spectrum(spectrum, times)
+            y_label = 'Counts' if times is None else f'Count rate (cps, {times.describe()})'
 
             self.figure.clear()
             ax = self.figure.add_subplot(111)
             ax.plot(x_values, sum_spectrum)
-            ax.set_title(f'Summed Spectrum of All Channels in {self.selected_file}')
+            drift_note = ' (drift-corrected)' if self.drift_correction_applies(self.selected_file) else ''
+            ax.set_title(f'Summed Spectrum of All Channels in {self.selected_file}{drift_note}')
             ax.set_xlabel('Energy (kev)' if self.calibrated_radio.isChecked() else 'ADC')
-            ax.set_ylabel('Counts')
+            ax.set_ylabel(y_label)
             self.canvas.draw()
         except Exception as e:
             QMessageBox.critical(self, "Error", f"An error occurred: {str(e)}")
             print(f"Error in summing and plotting: {str(e)}")    
         
+    def drift_correction_applies(self, file_name):
+        return (self.apply_drift_checkbox.isChecked() and self.drift_tracker is not None
+                and file_name in self.drift_tracker.file_names)
+
+    def get_summed_spectrum(self, spectrum, times=None):
+        """
+        Sum all channels of the selected file's Spectrum, realigning them first when drift correction is applied.
+        With acquisition times, the channels' dead-time corrected count rates are summed instead of their counts.
+
+        Returns:
+            tuple: (x_values, summed counts or count rates as an array).
+        """
+        counts = spectrum.counts if times is None else spectrum.count_rates(times)
+        if self.drift_correction_applies(self.selected_file):
+            return spectrum.x_values, self.drift_tracker.align_file(self.selected_file, spectrum.x_values, counts).sum(axis=0)
+        return spectrum.x_values, counts.sum(axis=0, dtype=np.float64)
+
+    def get_acquisition_times(self, file_name, spectrum):
+        """
+        Per-channel live/real times of a file from its capture-log entry, with the selected dead-time model.
+
+        Returns:
+            AcquisitionTimes: Or None when the file has no log entry with the times the model needs.
+
+        Raises:
+            ValueError: If a dead-time model is selected without a valid dead time per event.
+        """
+        log_row = self.capture_log_rows.get(file_name)
+        if log_row is None or self.capture_log is None:
+            return None
+        model = self.dead_time_model_combo.currentText()
+        tau = None
+        if model != LIVE_TIME:
+            try:
+                tau = float(self.dead_time_input.text()) * 1e-6
+            except ValueError:
+                raise ValueError(f"Enter the dead time per event in µs for the {model} model.")
+        times = times_from_log(self.capture_log, log_row, spectrum.num_channels, model, tau)
+        return times if times.known() else None
+
     '''
     Saving the channel-summed spectra
     '''
+    @timed()
     def save_summed_spectrum(self):
         if not self.selected_file:
             QMessageBox.warning(self, "Error", "No file selected. Please select a file first.")
             return
         
-        file_path = os.path.join(self.file_path_label.text(), self.selected_file)
-        df = pd.read_csv(file_path)
         try:
-            summed_spectrum = df.sum(axis=0)
-            x_values = pd.to_numeric(df.columns, errors='coerce')
+            spectrum = self.get_spectrum()
+            times = self.get_acquisition_times(self.selected_file, spectrum)
+            x_values, summed_spectrum = self.get_summed_spectrum(spectrum, times)
             
             original_filename = os.path.splitext(self.selected_file)[0]
             summed_filename = f"{original_filename}_combined.csv"
             summed_file_path = os.path.join(self.file_path_label.text(), summed_filename)
             
-            summed_spectrum_df = pd.DataFrame({'Channel/Energy': x_values, 'Counts': summed_spectrum})
+            y_column = 'Counts' if times is None else 'Count rate (cps)'
+            summed_spectrum_df = pd.DataFrame({'Channel/Energy': x_values, y_column: summed_spectrum})
             summed_spectrum_df.to_csv(summed_file_path, index=False)
             
             QMessageBox.information(self, "Save Complete", f"Summed spectrum saved successfully to {summed_file_path}.")
@@ -785,6 +1125,595 @@ class GammaToolsWindow(QMainWindow):
             print(f"Error in saving summed spectrum: {str(e)}") 
             
 
+    def integrate_windows(self):
+        """
+        Gross and net counts of the selected channels (all channels if none are selected) in every
+        entered energy window, per channel and summed over the selection, with an option to save them.
+        """
+        if self.selected_file is None:
+            QMessageBox.warning(self, "Error", "No file selected. Please select a file first.")
+            return
+        try:
+            windows = parse_windows(self.integral_windows_input.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "Warning", str(e))
+            return
+        if not windows:
+            QMessageBox.warning(self, "Warning", "Please enter at least one energy window, e.g. 640-685.")
+            return
+
+        try:
+            spectrum = self.get_spectrum()
+            channels = [item.text() for item in self.channel_list_widget.selectedItems()] or None
+            indices = spectrum.channel_indices(channels)
+            lows, highs = np.array(windows).T
+            gross = spectrum.integrate(lows, highs, indices)
+            net, uncertainty = spectrum.net(lows, highs, indices)
+            total_gross = spectrum.integrate(lows, highs, indices, sum_channels=True)
+            total_net, total_uncertainty = spectrum.net(lows, highs, indices, sum_channels=True)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred: {str(e)}")
+            print(f"Error in window integration: {str(e)}")
+            return
+
+        channel_names = self.file_channels.get(self.selected_file) or [f"Channel_{i}" for i in range(spectrum.num_channels)]
+        names = [channel_names[i] for i in indices]
+        rows = []
+        for w, (low, high) in enumerate(windows):
+            rows.extend((name, low, high, gross[c, w], net[c, w], uncertainty[c, w]) for c, name in enumerate(names))
+            rows.append((f"Sum of {len(names)} channels", low, high, total_gross[w], total_net[w], total_uncertainty[w]))
+        summary = "\n".join(f"{low:g}-{high:g}: gross {total_gross[w]:.0f}, net {total_net[w]:.0f} ± {total_uncertainty[w]:.0f}"
+                            for w, (low, high) in enumerate(windows))
+
+        msg_box = QMessageBox(self)
+        msg_box.setWindowTitle("Window Integrals")
+        msg_box.setText(f"Summed over {len(names)} channels of {self.selected_file}:\n{summary}\n\nSave the per-channel integrals to CSV?")
+        msg_box.setStandardButtons(QMessageBox.StandardButton.Save | QMessageBox.StandardButton.Close)
+        if msg_box.exec() != QMessageBox.StandardButton.Save:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Save Window Integrals",
+                                              os.path.join(self.file_path_label.text(), f"{os.path.splitext(self.selected_file)[0]}_windows.csv"),
+                                              "CSV Files (*.csv)")
+        if path:
+            pd.DataFrame(rows, columns=['Channel', 'Low', 'High', 'Gross Counts', 'Net Counts', 'Net Counts Uncertainty']).to_csv(path, index=False)
+            QMessageBox.information(self, "Save Complete", f"Window integrals saved to {path}")
+
+
+###### SPECTRAL IMAGING METHODS ######
+
+    def show_spectral_image(self):
+        """
+        Open the selected camera capture as a pixels x energy hypercube, with the selected isotope's
+        ROI (or the full range) as the initial energy window.
+        """
+        if self.selected_file is None:
+            QMessageBox.warning(self, "Error", "No file selected. Please select a file first.")
+            return
+        spectrum = self.get_spectrum()
+        if spectrum.single_channel:
+            QMessageBox.warning(self, "Warning", "Spectral imaging needs a multi-channel capture (one channel per pixel).")
+            return
+        try:
+            hypercube = Hypercube.from_spectrum(spectrum)
+        except ValueError as e:
+            QMessageBox.critical(self, "Error", f"Could not build the spectral image: {str(e)}")
+            print(f"Error building hypercube: {str(e)}")
+            return
+
+        initial_window = None
+        isotopes = get_library().split_selection(self.isotope_combo.currentText())
+        if isotopes:
+            initial_window = get_library().roi(isotopes[0], self.calibrated_radio.isChecked())
+        dialog = HypercubeDialog(self, hypercube, self.selected_file, initial_window,
+                                 'Energy (keV)' if self.calibrated_radio.isChecked() else 'ADC')
+        dialog.exec()
+
+
+###### GAIN-DRIFT METHODS ######
+
+    def track_gain_drift(self):
+        """
+        Track the selected isotope's reference peak through the listed files in order, and plot the
+        median peak position per file with the channel spread.
+        """
+        isotopes = get_library().split_selection(self.isotope_combo.currentText())
+        if not isotopes or get_library().reference_energy(isotopes[0]) is None:
+            QMessageBox.warning(self, "Warning", "Please select an isotope first.")
+            return
+        file_names = [self.file_list_widget.item(i).text() for i in range(self.file_list_widget.count())
+                      if not self.file_list_widget.item(i).isHidden()]
+        if not file_names:
+            QMessageBox.warning(self, "Warning", "No files to track.")
+            return
+
+        tracker = GainDriftTracker(isotopes[0], calibrated=self.calibrated_radio.isChecked(),
+                                   backend=self.detection_backend_combo.currentText(), reader=self.read_spectrum_file)
+        try:
+            positions = tracker.track(self.file_path_label.text(), file_names,
+                                      progress=lambda done, total: self.statusBar().showMessage(f"Tracking drift: {done}/{total} files"))
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred during drift tracking: {str(e)}")
+            print(f"Error in drift tracking: {str(e)}")
+            return
+        if not tracker.file_names:
+            QMessageBox.warning(self, "Warning", "No multi-channel files to track.")
+            return
+
+        self.drift_tracker = tracker
+        self.apply_drift_checkbox.setEnabled(True)
+        self.apply_drift_checkbox.setChecked(True)
+
+        drift = tracker.file_drift()
+        file_numbers = range(1, len(tracker.file_names) + 1)
+        self.figure.clear()
+        ax = self.figure.add_subplot(111)
+        for channel_positions in positions.T:
+            ax.plot(file_numbers, channel_positions, color='grey', linewidth=0.3, alpha=0.5)
+        ax.plot(file_numbers, np.nanmedian(positions, axis=1), color='r', marker='o', markersize=3, label='Median over channels')
+        ax.set_title(f'{isotopes[0]} peak position per file (drift {np.nanmin(drift):.3f} to {np.nanmax(drift):.3f} x first file)')
+        ax.set_xlabel('File (acquisition order)')
+        ax.set_ylabel('Peak position (keV)' if self.calibrated_radio.isChecked() else 'Peak position (ADC)')
+        ax.legend()
+        self.canvas.draw()
+        self.last_plot_all_channels = False
+        found = np.isfinite(positions).mean() if positions.size else 0.0
+        skipped_note = f"; skipped {len(tracker.skipped_files)} single-channel files" if tracker.skipped_files else ""
+        self.statusBar().showMessage(f"Tracked {len(tracker.file_names)} files; peak found in {found:.0%} of channels{skipped_note}.")
+
+    def sum_drift_corrected_files(self):
+        """
+        Sum every channel of every tracked file after drift correction, plot the result and save it
+        as a two-column spectrum in the folder.
+        """
+        if self.drift_tracker is None:
+            QMessageBox.warning(self, "Warning", "Please track the gain drift first.")
+            return
+        folder_path = self.file_path_label.text()
+        try:
+            x_values, summed_spectrum = self.drift_tracker.sum_files(folder_path)
+            summed_filename = f"{os.path.basename(os.path.normpath(folder_path))}_drift_corrected_combined.csv"
+            summed_file_path = os.path.join(folder_path, summed_filename)
+            pd.DataFrame({'Channel/Energy': x_values, 'Counts': summed_spectrum}).to_csv(summed_file_path, index=False)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred: {str(e)}")
+            print(f"Error in drift-corrected summing: {str(e)}")
+            return
+
+        self.figure.clear()
+        ax = self.figure.add_subplot(111)
+        ax.plot(x_values, summed_spectrum)
+        ax.set_title(f'Drift-corrected sum of {len(self.drift_tracker.file_names)} files')
+        ax.set_xlabel('Energy (kev)' if self.calibrated_radio.isChecked() else 'ADC')
+        ax.set_ylabel('Counts')
+        self.canvas.draw()
+        self.last_plot_all_channels = False
+        QMessageBox.information(self, "Save Complete", f"Drift-corrected sum saved successfully to {summed_file_path}.")
+        self.update_file_list()
+
+    def process_folder_pipeline(self):
+        """
+        Detect the selected isotope's reference peak, gain-match and sum every capture file of the
+        folder, recomputing only files added or changed since the last run, then plot the sum.
+        """
+        folder_path = self.file_path_label.text()
+        isotopes = get_library().split_selection(self.isotope_combo.currentText())
+        if not os.path.isdir(folder_path):
+            QMessageBox.warning(self, "Warning", "Please load a folder first.")
+            return
+        if not isotopes or get_library().reference_energy(isotopes[0]) is None:
+            QMessageBox.warning(self, "Warning", "Please select an isotope first.")
+            return
+
+        try:
+            pipeline = FolderPipeline(folder_path, isotopes[0], calibrated=self.calibrated_radio.isChecked(),
+                                      backend=self.detection_backend_combo.currentText())
+            report = pipeline.run(progress=lambda stage, done, total: self.statusBar().showMessage(f"Pipeline {stage}: {done}/{total} files"))
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred in the folder pipeline: {str(e)}")
+            print(f"Error in folder pipeline: {str(e)}")
+            return
+
+        peaks_name, combined_name = pipeline.output_names()
+        self.update_file_list()
+        processed = report["detect_calibrate"]["processed"]
+        self.statusBar().showMessage(f"Pipeline: {processed} of {report['load']['files']} files processed, "
+                                     f"{report['sum']['members']} summed in {report['seconds']:.1f} s.")
+        if not report["sum"]["members"]:
+            QMessageBox.warning(self, "Warning", f"No file had a {isotopes[0]} peak to calibrate on.")
+            return
+        combined = pd.read_csv(os.path.join(folder_path, combined_name))
+        self.figure.clear()
+        ax = self.figure.add_subplot(111)
+        ax.plot(combined['Channel/Energy'], combined['Counts'])
+        ax.set_title(f'Gain-matched sum of {report["sum"]["members"]} files ({isotopes[0]})')
+        ax.set_xlabel('Energy (kev)' if self.calibrated_radio.isChecked() else 'ADC')
+        ax.set_ylabel('Counts')
+        ax.set_yscale('log')
+        self.canvas.draw()
+        self.last_plot_all_channels = False
+        print(f"Folder pipeline report: {json.dumps(report)}")
+        print(f"Peaks saved to {peaks_name}, sum saved to {combined_name}")
+
+    def queue_folder_pipeline(self):
+        """
+        Queue the folder pipeline as a background job, one task per file, which survives restarts
+        and is followed in the main menu's Job Monitor.
+        """
+        folder_path = self.file_path_label.text()
+        isotopes = get_library().split_selection(self.isotope_combo.currentText())
+        if not os.path.isdir(folder_path):
+            QMessageBox.warning(self, "Warning", "Please load a folder first.")
+            return
+        if not isotopes or get_library().reference_energy(isotopes[0]) is None:
+            QMessageBox.warning(self, "Warning", "Please select an isotope first.")
+            return
+        try:
+            job_id = submit_job("pipeline", {"folder": os.path.abspath(folder_path), "isotope": isotopes[0],
+                                             "calibrated": self.calibrated_radio.isChecked(),
+                                             "backend": self.detection_backend_combo.currentText()})
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Could not queue the folder job: {str(e)}")
+            print(f"Error queueing folder job: {str(e)}")
+            return
+        self.statusBar().showMessage(f"Queued folder job {job_id}; follow it in the Job Monitor.")
+
+    def convert_folder(self):
+        """
+        Convert every capture file of the folder to the selected format in worker processes, into
+        <folder>_<format> next to it, redoing only files that are new, changed or failed before.
+        """
+        folder_path = self.file_path_label.text()
+        if not os.path.isdir(folder_path):
+            QMessageBox.warning(self, "Warning", "Please load a folder first.")
+            return
+        try:
+            converter = FolderConverter(folder_path, output_format=self.output_format_combo.currentText(),
+                                        engine=self.csv_engine_combo.currentText())
+            report = converter.run(progress=lambda stage, done, total: self.statusBar().showMessage(f"Converting: {done}/{total} files"))
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred converting the folder: {str(e)}")
+            print(f"Error converting folder: {str(e)}")
+            return
+
+        self.statusBar().showMessage(f"Converted {report['converted']} of {report['files']} files "
+                                     f"({report['reused']} up to date) in {report['seconds']:.1f} s.")
+        print(f"Folder conversion report: {json.dumps(report)}")
+        if report["failed"]:
+            failed = "\n".join(f"{file_name}: {message}" for file_name, message in list(report["failed"].items())[:10])
+            QMessageBox.warning(self, "Warning", f"{len(report['failed'])} file(s) could not be converted:\n{failed}")
+        else:
+            QMessageBox.information(self, "Conversion Complete", f"The folder was converted to {report['output']}")
+
+
+###### LIVE ACQUISITION METHODS ######
+
+    def toggle_live_acquisition(self):
+        if self.live_acquisition is not None:
+            self.stop_live_acquisition()
+        else:
+            self.start_live_acquisition()
+
+    def live_axis(self):
+        """
+        X-axis and channel count for live spectra: taken from the selected file when there is one,
+        otherwise raw ADC bins with the default capture size.
+        """
+        if self.selected_file is not None:
+            try:
+                spectrum = self.get_spectrum()
+                if not spectrum.single_channel:
+                    return spectrum.x_values.copy(), spectrum.num_channels
+            except Exception as e:
+                print(f"Could not use {self.selected_file} as the live template: {str(e)}")
+        return np.arange(DEFAULT_NUM_BINS, dtype=float), DEFAULT_NUM_CHANNELS
+
+    def start_live_acquisition(self):
+        """
+        Start accumulating events from the live source and refreshing the plot at a bounded frame rate.
+        """
+        source_spec = self.live_source_input.text().strip()
+        if not source_spec:
+            QMessageBox.warning(self, "Warning", "Please enter a capture file or host:port to stream from.")
+            return
+        try:
+            source = open_source(source_spec)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Could not open live source {source_spec}: {str(e)}")
+            print(f"Error opening live source: {str(e)}")
+            return
+
+        x_values, num_channels = self.live_axis()
+        self.live_acquisition = LiveAcquisition(source, x_values, num_channels)
+        self.live_detector = None
+        isotopes = get_library().split_selection(self.isotope_combo.currentText())
+        if isotopes and get_library().reference_energy(isotopes[0]) is not None:
+            mask = PhotopeakDetector.get_initial_mask(self, isotopes[0], x_values, ascending=True)
+            self.live_detector = IncrementalDetector(self.live_acquisition.accumulator, x_values, mask,
+                                                     backend=self.detection_backend_combo.currentText(),
+                                                     calibrated=self.calibrated_radio.isChecked(),
+                                                     subtract_background=self.subtract_background_checkbox.isChecked())
+        self.live_version = -1
+        self.live_line = None
+
+        self.figure.clear()
+        self.live_ax = self.figure.add_subplot(111)
+        self.live_unit = 'keV' if self.calibrated_radio.isChecked() else 'ADC'
+        self.live_ax.set_xlabel('Energy (keV)' if self.calibrated_radio.isChecked() else 'ADC')
+        self.live_ax.set_ylabel('Counts')
+        self.last_plot_all_channels = False
+        self.detected_peak_list.clear()
+
+        self.live_acquisition.start()
+        self.live_timer.start()
+        self.live_button.setText("Stop Live")
+
+    def stop_live_acquisition(self):
+        acquisition = self.live_acquisition
+        if acquisition is None:
+            return
+        self.live_acquisition = None
+        self.live_timer.stop()
+        acquisition.stop()
+        self.draw_live_spectrum(acquisition)
+        self.finished_live_acquisition = acquisition
+        self.live_button.setText("Start Live")
+        self.statusBar().showMessage(f"Live acquisition stopped after {acquisition.accumulator.total_events} events.")
+
+    def refresh_live_plot(self):
+        """
+        Timer callback: redraw the live spectrum, and stop when the source ended or failed.
+        """
+        acquisition = self.live_acquisition
+        if acquisition is None:
+            return
+        self.draw_live_spectrum(acquisition)
+        if acquisition.error is not None:
+            self.stop_live_acquisition()
+            QMessageBox.critical(self, "Error", f"Live acquisition stopped: {str(acquisition.error)}")
+        elif acquisition.source.finished:
+            self.stop_live_acquisition()
+
+    def draw_live_spectrum(self, acquisition):
+        """
+        Redraw the summed live spectrum if it changed, and re-detect peaks on channels that changed significantly.
+        """
+        summed, version = acquisition.accumulator.summed()
+        if version == self.live_version:
+            return
+        self.live_version = version
+
+        if self.live_detector is not None and self.live_detector.update().size:
+            positions = self.live_detector.positions
+            self.detected_peak_list.clear()
+            self.detected_peak_list.addItems([f"Channel_{channel}: Peak at {positions[channel]:.2f} {self.live_unit}"
+                                              for channel in np.flatnonzero(np.isfinite(positions))])
+
+        if self.live_line is None:
+            self.live_line, = self.live_ax.plot(acquisition.x_values, summed)
+            self.live_peak_line = self.live_ax.axvline(x=np.nan, color='r', linewidth=0.5, linestyle='--')
+        else:
+            self.live_line.set_ydata(summed)
+        if self.live_detector is not None and np.isfinite(self.live_detector.positions).any():
+            self.live_peak_line.set_xdata([np.nanmedian(self.live_detector.positions)] * 2)
+        self.live_ax.relim()
+        self.live_ax.autoscale_view()
+
+        accumulator = acquisition.accumulator
+        elapsed = max(acquisition.elapsed(), 1e-9)
+        self.live_ax.set_title(f'Live: {accumulator.total_events} events in {elapsed:.0f} s '
+                               f'({accumulator.total_events / elapsed:.0f} /s)')
+        self.canvas.draw_idle()
+        if accumulator.dropped_events:
+            self.statusBar().showMessage(f"{accumulator.dropped_events} live events were outside the channel/bin range.")
+
+    def save_live_capture(self):
+        """
+        Save the accumulated live counts as a capture file in the current folder, in the same layout as other captures.
+        """
+        acquisition = self.live_acquisition or self.finished_live_acquisition
+        if acquisition is None:
+            QMessageBox.warning(self, "Warning", "No live acquisition to save.")
+            return
+        folder_path = self.file_path_label.text()
+        if not os.path.isdir(folder_path):
+            QMessageBox.warning(self, "Warning", "Please select a folder to save the live capture in.")
+            return
+        file_name = f"live_capture_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+        try:
+            columns = [f"{value:.3f}" for value in acquisition.x_values]
+            pd.DataFrame(acquisition.accumulator.snapshot(), columns=columns).to_csv(os.path.join(folder_path, file_name), index=False)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred: {str(e)}")
+            print(f"Error saving live capture: {str(e)}")
+            return
+        QMessageBox.information(self, "Save Complete", f"Live capture saved to {file_name}.")
+        self.update_file_list()
+
+
+###### NUCLIDE IDENTIFICATION METHODS ######
+
+    @timed()
+    def identify_nuclides(self):
+        """
+        Search the selected file's channel-summed spectrum for all significant peaks, rank the matching
+        library nuclides, and offer to select the best candidate for photopeak detection.
+        """
+        if self.selected_file is None:
+            QMessageBox.warning(self, "Error", "No file selected. Please select a file first.")
+            return
+        if not self.calibrated_radio.isChecked():
+            QMessageBox.warning(self, "Warning", "Nuclide identification needs energy-calibrated data.")
+            return
+
+        try:
+            spectrum = self.get_spectrum()
+            result = NuclideID.identify_spectra(spectrum.x_values, spectrum.summed())[0]
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred during identification: {str(e)}")
+            print(f"Error in nuclide identification: {str(e)}")
+            return
+
+        peaks = ", ".join(f"{energy:.1f}" for energy, _ in result["peaks"]) or "none"
+        message = f"Peaks (keV): {peaks}\n\n{NuclideID.format_candidates(result['candidates'])}"
+        candidates = result["candidates"]
+        if candidates and self.isotope_combo.findText(candidates[0]["nuclide"]) >= 0:
+            reply = QMessageBox.question(self, "Nuclide Identification",
+                                         f"{message}\n\nSelect {candidates[0]['nuclide']} for photopeak detection?")
+            if reply == QMessageBox.StandardButton.Yes:
+                self.isotope_combo.setCurrentText(candidates[0]["nuclide"])
+        else:
+            QMessageBox.information(self, "Nuclide Identification", message)
+
+    @timed()
+    def identify_folder_nuclides(self):
+        """
+        Identify every listed (not filtered-out) file in the folder in one batch and optionally save
+        the ranked candidates to CSV.
+        """
+        if not self.calibrated_radio.isChecked():
+            QMessageBox.warning(self, "Warning", "Nuclide identification needs energy-calibrated data.")
+            return
+        file_names = [self.file_list_widget.item(i).text() for i in range(self.file_list_widget.count())
+                      if not self.file_list_widget.item(i).isHidden()]
+        if not file_names:
+            QMessageBox.warning(self, "Warning", "No files to identify.")
+            return
+
+        try:
+            results = NuclideID.identify_folder(self.file_path_label.text(), file_names)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred during identification: {str(e)}")
+            print(f"Error in folder identification: {str(e)}")
+            return
+
+        rows = []
+        summary = []
+        for file_name, result in results.items():
+            candidates = result["candidates"]
+            summary.append(f"{file_name}: " + (", ".join(f"{c['nuclide']} ({c['confidence']:.0%})" for c in candidates) or "none"))
+            for rank, candidate in enumerate(candidates, start=1):
+                rows.append((file_name, rank, candidate["nuclide"], candidate["confidence"],
+                             " ".join(f"{peak:.2f}" for _, peak in candidate["matched_lines"])))
+
+        msg_box = QMessageBox(self)
+        msg_box.setWindowTitle("Nuclide Identification")
+        msg_box.setText(f"Identified {len(results)} files. Save the candidates to CSV?")
+        msg_box.setDetailedText("\n".join(summary))
+        msg_box.setStandardButtons(QMessageBox.StandardButton.Save | QMessageBox.StandardButton.Close)
+        if msg_box.exec() != QMessageBox.StandardButton.Save:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Save Identification Results",
+                                              os.path.join(self.file_path_label.text(), "nuclide_identification.txt"),
+                                              "CSV Text (*.txt *.csv)")
+        if path:
+            pd.DataFrame(rows, columns=['File', 'Rank', 'Nuclide', 'Confidence', 'Matched peaks (keV)']).to_csv(path, index=False)
+            QMessageBox.information(self, "Save Complete", f"Identification results saved to {path}")
+
+
+###### DIAGNOSTICS METHODS ######
+
+    def toggle_latency_readout(self, checked):
+        """
+        Enable or disable instrumentation and the status-bar latency readout.
+        """
+        Instrumentation.set_enabled(checked)
+        self.latency_label.setVisible(checked)
+        if not checked:
+            self.record_trace_checkbox.setChecked(False)
+
+    def on_span_finished(self, name, seconds):
+        """
+        Show the latest top-level action's latency with its rolling p50/p95 in the status bar.
+        """
+        if not self.show_latency_checkbox.isChecked() or not name.startswith("GammaToolsWindow."):
+            return
+        summary = Instrumentation.latency_summary(name)
+        self.latency_label.setText(f"{name.split('.', 1)[1]}: {seconds * 1000:.0f} ms "
+                                   f"(p50 {summary['p50']:.0f} / p95 {summary['p95']:.0f} ms, n={summary['count']})")
+
+    def save_trace(self):
+        """
+        Save recorded spans as Chrome trace JSON and print the rolling latency table.
+        """
+        if not Instrumentation.is_tracing():
+            QMessageBox.warning(self, "Warning", "Trace recording is off. Tick 'Record trace' and repeat the actions first.")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Save Trace", "gamma_tools_trace.json", "JSON Files (*.json)")
+        if not path:
+            return
+        count = Instrumentation.dump_trace(path)
+        print(Instrumentation.format_report())
+        QMessageBox.information(self, "Trace Saved", f"{count} events saved to {path}. Open it in chrome://tracing or Perfetto.")
+
+
+###### CAPTURE-LOG METHODS ######
+
+    def load_capture_log(self):
+        """
+        Load a capture log and join its entries to the files in the current folder.
+        """
+        path, _ = QFileDialog.getOpenFileName(self, "Select Capture Log", self.file_path_label.text(),
+                                              "Capture Logs (*.csv *.txt *.log *.tsv);;All Files (*)")
+        if not path:
+            return
+        try:
+            self.capture_log = CaptureLog(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", f"Failed to load capture log: {str(e)}")
+            print(f"Error in loading capture log: {str(e)}")
+            return
+        self.join_capture_log()
+        QMessageBox.information(self, "Capture Log Loaded",
+                                f"{self.capture_log.num_entries} log entries, "
+                                f"{len(self.capture_log_rows)} of {self.file_list_widget.count()} files matched.")
+
+    def join_capture_log(self):
+        """
+        Match the listed files to capture-log entries and re-apply any active log filter.
+        """
+        if getattr(self, "capture_log", None) is None:
+            return
+        file_names = [self.file_list_widget.item(i).text() for i in range(self.file_list_widget.count())]
+        self.capture_log_rows = self.capture_log.join_files(self.file_path_label.text(), file_names)
+        if self.capture_log_filter_input.text().strip():
+            self.apply_capture_log_filter()
+
+    def apply_capture_log_filter(self):
+        """
+        Hide files whose capture-log entry does not satisfy the filter; unmatched files are hidden too.
+        An empty filter shows every file again.
+        """
+        expression = self.capture_log_filter_input.text().strip()
+        if not expression:
+            for i in range(self.file_list_widget.count()):
+                self.file_list_widget.item(i).setHidden(False)
+            return
+        if self.capture_log is None:
+            QMessageBox.warning(self, "Warning", "Please load a capture log first.")
+            return
+        try:
+            keep = set(self.capture_log.filter_files(self.capture_log_rows, expression))
+        except ValueError as e:
+            QMessageBox.warning(self, "Warning", str(e))
+            return
+        for i in range(self.file_list_widget.count()):
+            item = self.file_list_widget.item(i)
+            item.setHidden(item.text() not in keep)
+        self.statusBar().showMessage(f"{len(keep)} files match '{expression}'")
+
+    def show_capture_log_entry(self):
+        """
+        Show the selected file's capture-log entry in the status bar.
+        """
+        log_row = self.capture_log_rows.get(self.selected_file)
+        if log_row is None:
+            self.statusBar().clearMessage()
+            return
+        entry = self.capture_log.entry(log_row)
+        fields = [f"{name}={value}" for name, value in entry.items() if name not in ("file", "timestamp")]
+        self.statusBar().showMessage(f"Capture log: {', '.join(fields)}")
+
+
 ###### DATASTORE UPLOADING METHODS ######
 
     '''
@@ -796,15 +1725,16 @@ class GammaToolsWindow(QMainWindow):
         if dialog.exec() == QDialog.DialogCode.Accepted:
             metadata = dialog.save_metadata()
             print("Metadata Saved:", metadata)
+            dialog.upload_to_datastore(metadata)
 
 
+    @timed()
     def quick_calibrate_channel(self):
         if not self.selected_file:
             QMessageBox.warning(self, "Error", "No file selected. Please select a file first.")
             return
 
-        file_path = os.path.join(self.file_path_label.text(), self.selected_file)
-        df = pd.read_csv(file_path)
+        spectrum = self.get_spectrum()
 
         detected_peaks = self.get_detected_peaks()
         known_energies = self.get_known_energies()
@@ -819,13 +1749,13 @@ class GammaToolsWindow(QMainWindow):
 
         try:
             for detected_peak, known_energy in zip(detected_peaks, known_energies):
-                # Use quick_calibrate function to adjust the index for each channel
-                calibrated_df = quick_calibrate(df, detected_peak, known_energy)
+                # Use quick_calibrate function to rescale the x-axis shared by all channels
+                calibrated_spectrum = quick_calibrate(spectrum, detected_peak, known_energy)
 
-                # Save the calibrated DataFrame to a new CSV file
+                # Save the calibrated spectrum to a new CSV file, in the layout it was read from
                 calibrated_filename = os.path.splitext(self.selected_file)[0] + f"_calibrated_{known_energy:.2f}keV.csv"
                 calibrated_file_path = os.path.join(self.file_path_label.text(), calibrated_filename)
-                calibrated_df.to_csv(calibrated_file_path, index=True)  # Index=True to save the index
+                calibrated_spectrum.to_dataframe().to_csv(calibrated_file_path, index=False)
 
                 QMessageBox.information(self, "Calibration Complete", f"Calibrated spectrum saved to {calibrated_file_path}.")
                 self.update_file_list()
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import bisect
+import threading
+import functools
+from collections import deque
+
+'''
+Lightweight instrumentation for the toolkit's hot paths:
+- span(name) context manager and @timed(name) decorator around loading, detection, calibration and plotting.
+- A rolling window of recent latencies per span name, with percentiles and a log-scale histogram.
+- Optional Chrome trace recording (open the dumped JSON in chrome://tracing or Perfetto).
+- Listeners notified on every finished span, used for the GammaToolsWindow status-bar readout.
+
+Everything is off by default and can be switched on at runtime, or at start-up with the
+GAMMA_TOOLS_INSTRUMENT=1 / GAMMA_TOOLS_TRACE=1 environment variables. When off, span() returns a
+shared no-op object and @timed adds only a flag check per call.
+'''
+
+ROLLING_WINDOW = 512
+MAX_TRACE_EVENTS = 1_000_000
+# Histogram bucket upper edges in milliseconds
+HISTOGRAM_EDGES_MS = [0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000, 3000, 10000]
+
+
+class _State:
+    enabled = os.environ.get("GAMMA_TOOLS_INSTRUMENT") == "1" or os.environ.get("GAMMA_TOOLS_TRACE") == "1"
+    tracing = os.environ.get("GAMMA_TOOLS_TRACE") == "1"
+
+
+_lock = threading.Lock()
+_latencies = {}
+_trace_events = []
+_listeners = []
+_trace_origin = time.perf_counter()
+
+
+class _NoOpSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoOpSpan()
+
+
+class _Span:
+    __slots__ = ("name", "category", "start")
+
+    def __init__(self, name, category):
+        self.name = name
+        self.category = category
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, self.category, self.start, time.perf_counter())
+        return False
+
+
+def _record(name, category, start, end):
+    duration = end - start
+    with _lock:
+        window = _latencies.get(name)
+        if window is None:
+            window = _latencies[name] = deque(maxlen=ROLLING_WINDOW)
+        window.append(duration)
+        if _State.tracing and len(_trace_events) < MAX_TRACE_EVENTS:
+            _trace_events.append({
+                "name": name, "cat": category, "ph": "X",
+                "ts": (start - _trace_origin) * 1e6, "dur": duration * 1e6,
+                "pid": os.getpid(), "tid": threading.get_ident(),
+            })
+        listeners = list(_listeners)
+    for listener in listeners:
+        listener(name, duration)
+
+
+def span(name, category="toolkit"):
+    """
+    Time a block of code when instrumentation is enabled.
+
+    Usage:
+        with span("find_peaks"):
+            peaks, properties = find_peaks(...)
+    """
+    if not _State.enabled:
+        return _NOOP_SPAN
+    return _Span(name, category)
+
+
+def timed(name=None, category="toolkit"):
+    """
+    Decorator timing every call of a function or method as a span (default name: the qualified name).
+
+    Arguments are passed through unchanged, so a decorated method connected to a Qt signal receives
+    every signal argument (e.g. the 'checked' flag of QPushButton.clicked); connect it through a
+    lambda taking only the arguments it accepts.
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _State.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(span_name, category, start, time.perf_counter())
+        return wrapper
+    return decorator
+
+
+###### CONTROL ######
+
+def set_enabled(enabled):
+    _State.enabled = bool(enabled)
+    if not enabled:
+        _State.tracing = False
+
+
+def is_enabled():
+    return _State.enabled
+
+
+def set_tracing(tracing):
+    """Start or stop recording trace events; tracing implies timing is enabled."""
+    _State.tracing = bool(tracing)
+    if tracing:
+        _State.enabled = True
+
+
+def is_tracing():
+    return _State.tracing
+
+
+def add_listener(listener):
+    """Register listener(name, seconds), called after every finished span; registering twice has no effect."""
+    with _lock:
+        if listener not in _listeners:
+            _listeners.append(listener)
+
+
+def remove_listener(listener):
+    with _lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def reset():
+    with _lock:
+        _latencies.clear()
+        _trace_events.clear()
+
+
+###### REPORTING ######
+
+def latency_summary(name):
+    """
+    Summarise the rolling latency window of a span.
+
+    Returns:
+        dict: count, p50, p95 and max in milliseconds, or None if the span has not run.
+    """
+    with _lock:
+        window = sorted(_latencies.get(name, ()))
+    if not window:
+        return None
+
+    def percentile(fraction):
+        return window[min(len(window) - 1, int(fraction * len(window)))] * 1000
+
+    return {"count": len(window), "p50": percentile(0.5), "p95": percentile(0.95), "max": window[-1] * 1000}
+
+
+def latency_histogram(name):
+    """
+    Histogram of the rolling latency window over HISTOGRAM_EDGES_MS.
+
+    Returns:
+        list: (upper edge in ms, count) pairs; the last edge is inf.
+    """
+    counts = [0] * (len(HISTOGRAM_EDGES_MS) + 1)
+    with _lock:
+        window = list(_latencies.get(name, ()))
+    for duration in window:
+        counts[bisect.bisect_left(HISTOGRAM_EDGES_MS, duration * 1000)] += 1
+    return list(zip(HISTOGRAM_EDGES_MS + [float("inf")], counts))
+
+
+def span_names():
+    with _lock:
+        return sorted(_latencies)
+
+
+def format_report():
+    """Plain-text table of every span's rolling latency summary."""
+    lines = [f"{'span':<44} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"]
+    for name in span_names():
+        summary = latency_summary(name)
+        if summary:
+            lines.append(f"{name:<44} {summary['count']:>6} {summary['p50']:9.2f} "
+                         f"{summary['p95']:9.2f} {summary['max']:9.2f}")
+    return "\n".join(lines)
+
+
+def dump_trace(path):
+    """
+    Write the recorded events as Chrome trace JSON.
+
+    Returns:
+        int: Number of events written.
+    """
+    with _lock:
+        events = list(_trace_events)
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return len(events)
@@ -0,0 +1,611 @@
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QTableWidget, QTableWidgetItem,
+    QTextEdit, QAbstractItemView, QHeaderView, QMessageBox
+)
+from PyQt6.QtCore import QTimer
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+'''
+Persistent local job queue for long-running batch operations:
+- A job (folder processing, dataset upload, ...) is planned into one task per file when it is
+  submitted. Jobs and tasks live in an SQLite database, so their state survives crashes and restarts.
+- One JobRunner thread claims queued jobs and runs their pending tasks on a worker pool (processes
+  for CPU-bound kinds, threads for I/O-bound ones). Failed tasks are retried up to MAX_ATTEMPTS
+  times; a job finishes (recipe, sum, export) only once every task is done, with its heartbeat
+  kept fresh while it finishes.
+- A running job carries the runner's heartbeat. A job whose runner died (crash, sleep, killed
+  process) is reclaimed once its heartbeat is stale, and its interrupted tasks are run again;
+  finished tasks are never repeated.
+- JobMonitorDialog lists the jobs with their progress and lets them be paused, resumed, retried,
+  cancelled or removed.
+
+Job kinds register with register_job_kind(); "pipeline" (FolderPipeline) and "upload" (DataStore
+upload) are built in.
+'''
+
+JOBS_PATH = os.path.join(os.path.expanduser("~"), ".gamma_tools_jobs.sqlite")
+MAX_ATTEMPTS = 3
+HEARTBEAT_INTERVAL = 2.0
+STALE_AFTER = 30.0
+POLL_INTERVAL = 1.0
+MONITOR_REFRESH_MS = 1000
+# Save the chunk manifest every this many uploaded files, so a resumed upload skips them cheaply
+UPLOAD_MANIFEST_INTERVAL = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    description TEXT,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    runner TEXT,
+    heartbeat REAL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL,
+    item TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_job_status ON tasks (job_id, status);
+"""
+
+# Job states: queued -> running -> done | failed; paused and cancelled are set from the monitor
+UNFINISHED_STATES = ("queued", "running")
+
+
+class JobKind:
+    """
+    A kind of batch job.
+
+    Attributes:
+        name (str): Kind name stored with each job.
+        plan (callable): plan(params) -> list of task items (strings), called on submission.
+        run_task (callable): run_task(params, item) -> JSON-serialisable result. Must be a module-level
+            function when processes is True.
+        finish (callable): finish(params, results) -> JSON-serialisable job result, with results a
+            dict item -> task result; called once all tasks are done.
+        describe (callable): describe(params) -> short description for the monitor.
+        processes (bool): Run tasks in worker processes instead of threads.
+    """
+
+    def __init__(self, name, plan, run_task, finish=None, describe=None, processes=False):
+        self.name = name
+        self.plan = plan
+        self.run_task = run_task
+        self.finish = finish
+        self.describe = describe or (lambda params: name)
+        self.processes = processes
+
+
+_kinds = {}
+
+
+def register_job_kind(kind):
+    _kinds[kind.name] = kind
+
+
+def get_job_kind(name):
+    if name not in _kinds:
+        raise ValueError(f"Unknown job kind '{name}'. Available: {', '.join(_kinds)}")
+    return _kinds[name]
+
+
+class JobQueue:
+    """
+    SQLite-backed job and task state. Each thread uses its own JobQueue (connection).
+
+    Attributes:
+        path (str): Database path.
+    """
+
+    def __init__(self, path=JOBS_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30.0)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    ###### SUBMISSION ######
+
+    def submit(self, kind_name, params):
+        """
+        Plan a job into tasks and queue it.
+
+        Returns:
+            int: The job ID.
+        """
+        kind = get_job_kind(kind_name)
+        items = kind.plan(params)
+        now = time.time()
+        with self.conn:
+            job_id = self.conn.execute(
+                "INSERT INTO jobs (kind, description, params, status, created, updated) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (kind_name, kind.describe(params), json.dumps(params), now, now)).lastrowid
+            self.conn.executemany("INSERT INTO tasks (job_id, item, status, updated) VALUES (?, ?, 'pending', ?)",
+                                  [(job_id, item, now) for item in items])
+        return job_id
+
+    ###### MONITORING ######
+
+    def jobs(self):
+        """
+        Every job with its task counts, newest first.
+
+        Returns:
+            list: dicts with the job columns plus total, done, failed and pending task counts.
+        """
+        rows = self.conn.execute("""
+            SELECT jobs.*, COUNT(tasks.task_id) AS total,
+                   SUM(tasks.status = 'done') AS done, SUM(tasks.status = 'failed') AS failed,
+                   SUM(tasks.status IN ('pending', 'running')) AS pending
+            FROM jobs LEFT JOIN tasks ON tasks.job_id = jobs.job_id
+            GROUP BY jobs.job_id ORDER BY jobs.job_id DESC""").fetchall()
+        return [dict(row) for row in rows]
+
+    def failed_tasks(self, job_id):
+        return [dict(row) for row in self.conn.execute(
+            "SELECT item, attempts, error FROM tasks WHERE job_id = ? AND status = 'failed' ORDER BY task_id", (job_id,))]
+
+    def has_unfinished_jobs(self):
+        return self.conn.execute("SELECT 1 FROM jobs WHERE status IN ('queued', 'running') LIMIT 1").fetchone() is not None
+
+    ###### CONTROL ######
+
+    def pause(self, job_id):
+        self._set_status(job_id, "paused", UNFINISHED_STATES)
+
+    def resume(self, job_id):
+        self._set_status(job_id, "queued", ("paused", "failed", "cancelled"))
+
+    def cancel(self, job_id):
+        self._set_status(job_id, "cancelled", UNFINISHED_STATES + ("paused",))
+
+    def retry_failed(self, job_id):
+        """Give the failed tasks of a job a fresh set of attempts and queue the job again."""
+        with self.conn:
+            self.conn.execute("UPDATE tasks SET status = 'pending', attempts = 0, error = NULL WHERE job_id = ? AND status = 'failed'",
+                              (job_id,))
+        self._set_status(job_id, "queued", ("failed", "paused", "cancelled"))
+
+    def remove(self, job_id):
+        """Delete a job that is not running, with its tasks."""
+        with self.conn:
+            if self.conn.execute("DELETE FROM jobs WHERE job_id = ? AND status != 'running'", (job_id,)).rowcount:
+                self.conn.execute("DELETE FROM tasks WHERE job_id = ?", (job_id,))
+
+    def _set_status(self, job_id, status, from_states):
+        with self.conn:
+            self.conn.execute(f"UPDATE jobs SET status = ?, updated = ? WHERE job_id = ? AND status IN ({','.join('?' * len(from_states))})",
+                              (status, time.time(), job_id, *from_states))
+
+    ###### RUNNER SIDE ######
+
+    def claim_job(self, runner_id):
+        """
+        Take the oldest queued job, or a running job whose runner stopped sending heartbeats, and
+        return its interrupted tasks to pending.
+
+        Returns:
+            dict: The job row, or None if there is nothing to run.
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            row = self.conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND heartbeat < ?) ORDER BY job_id LIMIT 1",
+                (now - STALE_AFTER,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE jobs SET status = 'running', runner = ?, heartbeat = ?, updated = ? WHERE job_id = ?",
+                              (runner_id, now, now, row["job_id"]))
+            self.conn.execute("UPDATE tasks SET status = 'pending' WHERE job_id = ? AND status = 'running'", (row["job_id"],))
+        return dict(row)
+
+    def heartbeat(self, job_id, runner_id):
+        """
+        Refresh the job's heartbeat.
+
+        Returns:
+            str: The job's current status ("running" unless it was paused, cancelled or removed meanwhile).
+        """
+        with self.conn:
+            self.conn.execute("UPDATE jobs SET heartbeat = ? WHERE job_id = ? AND runner = ?", (time.time(), job_id, runner_id))
+        row = self.conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row["status"] if row else "removed"
+
+    def pending_tasks(self, job_id):
+        return [(row["task_id"], row["item"]) for row in self.conn.execute(
+            "SELECT task_id, item FROM tasks WHERE job_id = ? AND status = 'pending' ORDER BY task_id", (job_id,))]
+
+    def start_tasks(self, task_ids):
+        with self.conn:
+            self.conn.executemany("UPDATE tasks SET status = 'running', updated = ? WHERE task_id = ?",
+                                  [(time.time(), task_id) for task_id in task_ids])
+
+    def release_tasks(self, task_ids):
+        """Return tasks that were handed out but not run to pending, without counting an attempt."""
+        with self.conn:
+            self.conn.executemany("UPDATE tasks SET status = 'pending' WHERE task_id = ? AND status = 'running'",
+                                  [(task_id,) for task_id in task_ids])
+
+    def finish_task(self, task_id, result):
+        with self.conn:
+            self.conn.execute("UPDATE tasks SET status = 'done', attempts = attempts + 1, result = ?, error = NULL, updated = ? WHERE task_id = ?",
+                              (json.dumps(result), time.time(), task_id))
+
+    def fail_task(self, task_id, error):
+        """Record a failed attempt; the task goes back to pending until it has used MAX_ATTEMPTS."""
+        with self.conn:
+            self.conn.execute("""
+                UPDATE tasks SET attempts = attempts + 1, error = ?, updated = ?,
+                    status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END
+                WHERE task_id = ?""", (error, time.time(), MAX_ATTEMPTS, task_id))
+
+    def task_results(self, job_id):
+        return {row["item"]: json.loads(row["result"]) for row in self.conn.execute(
+            "SELECT item, result FROM tasks WHERE job_id = ? AND status = 'done'", (job_id,))}
+
+    def task_counts(self, job_id):
+        return {row["status"]: row["count"] for row in self.conn.execute(
+            "SELECT status, COUNT(*) AS count FROM tasks WHERE job_id = ? GROUP BY status", (job_id,))}
+
+    def complete_job(self, job_id, runner_id, status, result=None, error=None):
+        """Set a job's final state, or hand it back (status 'queued') when the runner stops early."""
+        with self.conn:
+            self.conn.execute("UPDATE jobs SET status = ?, result = ?, error = ?, runner = NULL, updated = ? WHERE job_id = ? AND runner = ?",
+                              (status, None if result is None else json.dumps(result), error, time.time(), job_id, runner_id))
+
+
+class JobRunner:
+    """
+    Background thread running queued jobs one after another on a worker pool.
+
+    Attributes:
+        path (str): Job database path.
+        max_workers (int): Worker pool size; defaults to the CPU count.
+        runner_id (str): Identifies this runner's claim on a job.
+    """
+
+    def __init__(self, path=JOBS_PATH, max_workers=None):
+        self.path = path
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.runner_id = uuid.uuid4().hex
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="JobRunner", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop after handing the current job back to the queue; running tasks are repeated on resume."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        queue = JobQueue(self.path)
+        try:
+            while not self._stop.is_set():
+                job = queue.claim_job(self.runner_id)
+                if job is None:
+                    self._stop.wait(POLL_INTERVAL)
+                    continue
+                try:
+                    self.run_job(queue, job)
+                except Exception as e:
+                    print(f"Job {job['job_id']} failed: {e}")
+                    queue.complete_job(job["job_id"], self.runner_id, "failed", error=str(e))
+        finally:
+            queue.close()
+
+    def run_job(self, queue, job):
+        job_id = job["job_id"]
+        kind = get_job_kind(job["kind"])
+        params = json.loads(job["params"])
+        pool_class = ProcessPoolExecutor if kind.processes else ThreadPoolExecutor
+        pool = pool_class(max_workers=self.max_workers)
+        in_flight = {}
+        status = "running"
+        last_heartbeat = time.monotonic()
+        try:
+            while True:
+                if status == "running" and not self._stop.is_set() and len(in_flight) < 2 * self.max_workers:
+                    running_ids = set(in_flight.values())
+                    batch = [(task_id, item) for task_id, item in queue.pending_tasks(job_id) if task_id not in running_ids]
+                    batch = batch[:2 * self.max_workers - len(in_flight)]
+                    queue.start_tasks([task_id for task_id, _ in batch])
+                    for task_id, item in batch:
+                        in_flight[pool.submit(kind.run_task, params, item)] = task_id
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, timeout=HEARTBEAT_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task_id = in_flight.pop(future)
+                    try:
+                        queue.finish_task(task_id, future.result())
+                    except Exception as e:
+                        print(f"Job {job_id} task {task_id} failed: {e}")
+                        queue.fail_task(task_id, "".join(traceback.format_exception_only(type(e), e)).strip())
+                if time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL or done:
+                    status = queue.heartbeat(job_id, self.runner_id)
+                    last_heartbeat = time.monotonic()
+                if status != "running" or self._stop.is_set():
+                    # Paused, cancelled or shutting down: drop what has not started and stop handing out tasks
+                    for future in [future for future in in_flight if future.cancel()]:
+                        queue.release_tasks([in_flight.pop(future)])
+                    if self._stop.is_set():
+                        break
+        finally:
+            pool.shutdown(wait=not self._stop.is_set(), cancel_futures=True)
+
+        if self._stop.is_set():
+            queue.release_tasks(list(in_flight.values()))
+            if status == "running":
+                queue.complete_job(job_id, self.runner_id, "queued")
+            return
+        if status != "running":
+            return
+        counts = queue.task_counts(job_id)
+        if counts.get("failed"):
+            queue.complete_job(job_id, self.runner_id, "failed", error=f"{counts['failed']} tasks failed after {MAX_ATTEMPTS} attempts")
+            return
+        result = self._with_heartbeat(queue, job_id, kind.finish, params, queue.task_results(job_id)) if kind.finish else None
+        queue.complete_job(job_id, self.runner_id, "done", result=result)
+
+    def _with_heartbeat(self, queue, job_id, function, *args):
+        """Call function(*args) on a helper thread, keeping the job's heartbeat fresh until it returns."""
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(function, *args)
+            while not wait([future], timeout=HEARTBEAT_INTERVAL).done:
+                queue.heartbeat(job_id, self.runner_id)
+            return future.result()
+
+
+_runner = None
+
+
+def get_runner():
+    """Return the shared job runner, started on first use."""
+    global _runner
+    if _runner is None:
+        _runner = JobRunner()
+    _runner.start()
+    return _runner
+
+
+def stop_runner(timeout=5.0):
+    """Hand the current job back to the queue on exit, so the next session resumes it at once."""
+    if _runner is not None:
+        _runner.stop(timeout)
+
+
+def submit_job(kind_name, params):
+    """Queue a job and make sure the shared runner is working through the queue."""
+    queue = JobQueue()
+    try:
+        job_id = queue.submit(kind_name, params)
+    finally:
+        queue.close()
+    get_runner()
+    return job_id
+
+
+###### BUILT-IN JOB KINDS ######
+
+_pipelines = {}
+
+
+def _pipeline(params):
+    """FolderPipeline for a job's parameters, kept per worker process."""
+    from FolderPipeline import FolderPipeline
+    key = json.dumps(params, sort_keys=True)
+    if key not in _pipelines:
+        _pipelines[key] = FolderPipeline(params["folder"], params["isotope"], calibrated=params["calibrated"],
+                                         backend=params.get("backend"), max_workers=1)
+    return _pipelines[key]
+
+
+def _plan_pipeline(params):
+    return _pipeline(params).input_files()
+
+
+def _run_pipeline_task(params, file_name):
+    entry = _pipeline(params).process_file(file_name)
+    # A failed file is a failed task, so it is retried and listed under Retry Failed
+    if entry["status"] == "error":
+        raise RuntimeError(entry["message"])
+    return entry
+
+
+def _finish_pipeline(params, results):
+    from FolderPipeline import FolderPipeline
+    pipeline = FolderPipeline(params["folder"], params["isotope"], calibrated=params["calibrated"],
+                              backend=params.get("backend"))
+    pipeline.record(results)
+    return pipeline.run()
+
+
+register_job_kind(JobKind(
+    "pipeline", _plan_pipeline, _run_pipeline_task, _finish_pipeline, processes=True,
+    describe=lambda params: f"Process {os.path.basename(os.path.normpath(params['folder']))} ({params['isotope']})"))
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _store(store_root):
+    from ChunkStore import ChunkStore
+    with _stores_lock:
+        if store_root not in _stores:
+            _stores[store_root] = [ChunkStore(store_root), 0]
+        return _stores[store_root]
+
+
+def _plan_upload(params):
+    folder_path = params["metadata"]["Dataset Path"]
+    if not os.path.isdir(folder_path):
+        raise ValueError(f"The dataset path '{folder_path}' is not a valid directory.")
+    if params["metadata"].get("Compressed Archive"):
+        # The archive is transcoded from the whole folder, so it is uploaded as one task
+        return [""]
+    items = []
+    for root, _, files in os.walk(folder_path):
+        items.extend(os.path.relpath(os.path.join(root, name), folder_path).replace(os.sep, "/") for name in files)
+    return sorted(items)
+
+
+def _run_upload_task(params, item):
+    if not item:
+        from DataStoreUpload import upload_dataset
+        dataset_id, stats = upload_dataset(params["metadata"], params["store_root"])
+        return {"dataset_id": dataset_id, "stats": stats}
+    entry, stats = _store(params["store_root"])[0].put_file(os.path.join(params["metadata"]["Dataset Path"], *item.split("/")))
+    with _stores_lock:
+        state = _stores[params["store_root"]]
+        state[1] += 1
+        save = state[1] % UPLOAD_MANIFEST_INTERVAL == 0
+    if save:
+        state[0].save_manifest()
+    return {"entry": entry, "stats": stats}
+
+
+def _finish_upload(params, results):
+    if "" in results:
+        return results[""]
+    from DataStoreUpload import catalog_dataset
+    store = _store(params["store_root"])[0]
+    dataset_id = store.write_recipe({item: result["entry"] for item, result in results.items()}, params["metadata"])
+    store.save_manifest()
+    catalog_dataset(store, dataset_id)
+    stats = {"files": len(results)}
+    for result in results.values():
+        for key, value in result["stats"].items():
+            stats[key] = stats.get(key, 0) + value
+    return {"dataset_id": dataset_id, "stats": stats}
+
+
+register_job_kind(JobKind(
+    "upload", _plan_upload, _run_upload_task, _finish_upload, processes=False,
+    describe=lambda params: f"Upload {os.path.basename(os.path.normpath(params['metadata']['Dataset Path']))}"))
+
+
+class JobMonitorDialog(QDialog):
+    """
+    Live view of the job queue, with controls for the selected job.
+    """
+    COLUMNS = ["Job", "Description", "Status", "Progress", "Failed", "Updated", "Result"]
+
+    def __init__(self, parent=None, path=JOBS_PATH):
+        super().__init__(parent)
+        self.setWindowTitle("Job Monitor")
+        self.setMinimumSize(800, 400)
+        self.queue = JobQueue(path)
+        self.layout = QVBoxLayout(self)
+
+        self.runner_label = QLabel("")
+        self.layout.addWidget(self.runner_label)
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        self.table.itemSelectionChanged.connect(self.show_failures)
+        self.layout.addWidget(self.table)
+        self.failures_text = QTextEdit()
+        self.failures_text.setReadOnly(True)
+        self.failures_text.setMaximumHeight(100)
+        self.layout.addWidget(self.failures_text)
+
+        button_layout = QHBoxLayout()
+        for label, action in [("Start Workers", self.start_workers), ("Pause", self.queue.pause),
+                              ("Resume", self.queue.resume), ("Retry Failed", self.queue.retry_failed),
+                              ("Cancel", self.queue.cancel), ("Remove", self.queue.remove)]:
+            button = QPushButton(label)
+            button.clicked.connect(lambda checked=False, action=action: self.apply(action))
+            button_layout.addWidget(button)
+        self.layout.addLayout(button_layout)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(MONITOR_REFRESH_MS)
+        self.refresh()
+
+    def selected_job(self):
+        rows = self.table.selectionModel().selectedRows()
+        return int(self.table.item(rows[0].row(), 0).text()) if rows else None
+
+    def apply(self, action):
+        if action == self.start_workers:
+            action()
+            return
+        job_id = self.selected_job()
+        if job_id is None:
+            QMessageBox.warning(self, "Warning", "Please select a job first.")
+            return
+        action(job_id)
+        if action != self.queue.remove:
+            get_runner()
+        self.refresh()
+
+    def start_workers(self):
+        get_runner()
+        self.refresh()
+
+    def refresh(self):
+        selected = self.selected_job()
+        jobs = self.queue.jobs()
+        self.table.setRowCount(len(jobs))
+        for row, job in enumerate(jobs):
+            result = json.loads(job["result"]) if job["result"] else None
+            summary = job["error"] or (f"dataset {result['dataset_id'][:12]}" if isinstance(result, dict) and "dataset_id" in result
+                                       else f"{result['seconds']:.1f} s" if isinstance(result, dict) and "seconds" in result else "")
+            values = [job["job_id"], job["description"], job["status"], f"{job['done'] or 0}/{job['total']}",
+                      job["failed"] or 0, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job["updated"])), summary]
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(str(value)))
+            if job["job_id"] == selected:
+                self.table.selectRow(row)
+        self.runner_label.setText("Workers running" if _runner is not None and _runner.is_running() else
+                                  "Workers stopped (queued jobs wait until workers are started)")
+
+    def show_failures(self):
+        job_id = self.selected_job()
+        failures = self.queue.failed_tasks(job_id) if job_id is not None else []
+        self.failures_text.setPlainText("\n".join(f"{task['item']} ({task['attempts']} attempts): {task['error']}"
+                                                  for task in failures))
+
+    def done(self, result):
+        self.timer.stop()
+        self.queue.close()
+        super().done(result)
@@ -0,0 +1,432 @@
+import io
+import os
+import sys
+import stat
+import time
+import socket
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+from Instrumentation import span
+from PeakFinders import get_peak_finder
+from Background import snip, clipping_windows
+
+'''
+Live acquisition: watch spectra build up while a measurement is running.
+- The DAQ stream is list-mode text, one detected event per line as "channel,bin" (bin is the index
+  into the x-axis); lines starting with '#' are ignored. It is read from a growing capture file, a
+  named pipe, or a local TCP socket ("host:port").
+- A background thread parses each new block of complete lines in one pass and adds the events
+  in place into one preallocated (num_channels, num_bins) count array; nothing is reallocated while
+  acquiring.
+- The GUI pulls a summed snapshot at a bounded frame rate, and peak detection re-runs only on
+  channels that gained enough counts since their last detection to change the result.
+
+Run "python LiveAcquisition.py simulate <file or host:port>" for a DAQ stand-in that streams events
+drawn from synthetic spectra.
+'''
+
+DEFAULT_NUM_CHANNELS = 16
+DEFAULT_NUM_BINS = 2048
+READ_CHUNK_BYTES = 1 << 20
+POLL_INTERVAL = 0.05
+MAX_FPS = 5
+# A channel is re-detected once it gained at least this many counts...
+MIN_NEW_COUNTS = 200
+# ...and at least this fraction of the counts it had at its last detection
+RELATIVE_CHANGE = 0.1
+
+
+def _parse_lines(block):
+    """
+    Parse a block line by line, skipping malformed lines.
+
+    Returns:
+        tuple: (channels, bins, number of lines dropped).
+    """
+    channels, bins, dropped = [], [], 0
+    for line in block.split(b"\n"):
+        line = line.split(b"#", 1)[0].strip()
+        if not line:
+            continue
+        fields = line.split(b",")
+        try:
+            if len(fields) != 2:
+                raise ValueError
+            channel, bin_index = int(fields[0]), int(fields[1])
+        except ValueError:
+            dropped += 1
+            continue
+        channels.append(channel)
+        bins.append(bin_index)
+    return np.array(channels, dtype=np.int64), np.array(bins, dtype=np.int64), dropped
+
+
+def parse_events(buffer):
+    """
+    Parse the complete lines of a block of stream data. A block with malformed lines is parsed
+    again line by line, so only those lines are dropped.
+
+    Parameters:
+        buffer (bytes): Raw stream data, possibly ending in a partial line.
+
+    Returns:
+        tuple: (channels, bins, remainder) where remainder is the trailing partial line.
+    """
+    end = buffer.rfind(b"\n")
+    if end < 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), buffer
+    complete, remainder = buffer[:end + 1], buffer[end + 1:]
+    try:
+        # pandas' C parser is several times faster than splitting the text in Python
+        values = pd.read_csv(io.BytesIO(complete), header=None, comment="#", dtype=np.int64).to_numpy()
+    except pd.errors.EmptyDataError:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), remainder
+    except (ValueError, pd.errors.ParserError):
+        values = None
+    if values is None or values.ndim != 2 or values.shape[1] != 2:
+        channels, bins, dropped = _parse_lines(complete)
+        print(f"Dropping {dropped} malformed live-stream lines: expected 'channel,bin'.")
+        return channels, bins, remainder
+    return values[:, 0], values[:, 1], remainder
+
+
+class SpectrumAccumulator:
+    """
+    Preallocated per-channel count array that events are added into in place.
+
+    Attributes:
+        counts (np.ndarray): Counts shaped (num_channels, num_bins).
+        channel_totals (np.ndarray): Total counts per channel.
+        pending (np.ndarray): Counts per channel added since that channel was last detected.
+        total_events (int): Events accumulated so far.
+        dropped_events (int): Events outside the channel/bin range.
+        version (int): Incremented on every change, so readers can skip unchanged frames.
+    """
+
+    def __init__(self, num_channels=DEFAULT_NUM_CHANNELS, num_bins=DEFAULT_NUM_BINS):
+        self.counts = np.zeros((num_channels, num_bins), dtype=np.int64)
+        self.channel_totals = np.zeros(num_channels, dtype=np.int64)
+        self.pending = np.zeros(num_channels, dtype=np.int64)
+        self.total_events = 0
+        self.dropped_events = 0
+        self.version = 0
+        self._flat = self.counts.reshape(-1)
+        self._lock = threading.Lock()
+
+    @property
+    def num_channels(self):
+        return self.counts.shape[0]
+
+    @property
+    def num_bins(self):
+        return self.counts.shape[1]
+
+    def add_events(self, channels, bins):
+        """Add one count per (channel, bin) event."""
+        channels = np.asarray(channels, dtype=np.int64)
+        bins = np.asarray(bins, dtype=np.int64)
+        valid = (channels >= 0) & (channels < self.num_channels) & (bins >= 0) & (bins < self.num_bins)
+        channels, bins = channels[valid], bins[valid]
+        flat = channels * self.num_bins + bins
+        per_channel = np.bincount(channels, minlength=self.num_channels)
+        with self._lock:
+            # Large blocks are histogrammed in one pass; small ones are scattered into the array
+            if flat.size > self._flat.size // 8:
+                self._flat += np.bincount(flat, minlength=self._flat.size)
+            else:
+                np.add.at(self._flat, flat, 1)
+            self.channel_totals += per_channel
+            self.pending += per_channel
+            self.total_events += int(flat.size)
+            self.dropped_events += int(valid.size - flat.size)
+            self.version += 1
+
+    def summed(self):
+        """Counts summed over all channels, with the version they correspond to."""
+        with self._lock:
+            return self.counts.sum(axis=0), self.version
+
+    def snapshot(self):
+        """Copy of the full count array."""
+        with self._lock:
+            return self.counts.copy()
+
+    def take_changed(self, min_new_counts=MIN_NEW_COUNTS, relative_change=RELATIVE_CHANGE):
+        """
+        Channels that gained enough counts since their last detection, with a copy of their spectra.
+        Their pending counts are reset in the same step, so no events are missed in between.
+
+        Returns:
+            tuple: (channel indices, counts shaped (len(channels), num_bins)).
+        """
+        with self._lock:
+            previous = self.channel_totals - self.pending
+            changed = np.flatnonzero((self.pending >= min_new_counts) & (self.pending >= relative_change * previous))
+            spectra = self.counts[changed].astype(np.float64)
+            self.pending[changed] = 0
+        return changed, spectra
+
+    def reset(self):
+        with self._lock:
+            self.counts.fill(0)
+            self.channel_totals.fill(0)
+            self.pending.fill(0)
+            self.total_events = 0
+            self.dropped_events = 0
+            self.version += 1
+
+
+###### STREAM SOURCES ######
+
+class FileTailSource:
+    """
+    Follows a growing capture file (or named pipe) from its start, returning newly written bytes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.finished = False
+        self._pipe = stat.S_ISFIFO(os.stat(path).st_mode)
+        if self._pipe:
+            self._fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        else:
+            self._file = open(path, "rb")
+
+    def read(self):
+        if self._pipe:
+            try:
+                return os.read(self._fd, READ_CHUNK_BYTES)
+            except BlockingIOError:
+                return b""
+        data = self._file.read(READ_CHUNK_BYTES)
+        if not data and os.path.getsize(self.path) < self._file.tell():
+            print(f"{self.path} was truncated; following it from the start.")
+            self._file.seek(0)
+        return data
+
+    def close(self):
+        if self._pipe:
+            os.close(self._fd)
+        else:
+            self._file.close()
+
+
+class SocketSource:
+    """
+    Reads the event stream from a TCP connection to a DAQ (or the simulator) on host:port.
+    """
+
+    def __init__(self, host, port, timeout=5.0):
+        self.finished = False
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._socket.settimeout(POLL_INTERVAL)
+
+    def read(self):
+        try:
+            data = self._socket.recv(READ_CHUNK_BYTES)
+        except socket.timeout:
+            return b""
+        if not data:
+            self.finished = True
+        return data
+
+    def close(self):
+        self._socket.close()
+
+
+def parse_address(spec):
+    """Split 'host:port' into (host, port), or return None if spec is not an address."""
+    host, separator, port = spec.rpartition(":")
+    if separator and port.isdigit() and host and not os.path.exists(spec):
+        return host, int(port)
+    return None
+
+
+def open_source(spec):
+    """
+    Open a stream source from a capture file / named pipe path or a 'host:port' address.
+
+    Raises:
+        OSError: If the file cannot be opened or the connection is refused.
+    """
+    address = parse_address(spec)
+    if address is not None:
+        return SocketSource(*address)
+    return FileTailSource(spec)
+
+
+###### ACQUISITION ######
+
+class LiveAcquisition:
+    """
+    Reads a stream source on a background thread and accumulates its events.
+
+    Attributes:
+        x_values (np.ndarray): X-axis of the accumulated spectra.
+        accumulator (SpectrumAccumulator): The live counts.
+        error (Exception): The error that stopped reading, if any.
+    """
+
+    def __init__(self, source, x_values, num_channels=DEFAULT_NUM_CHANNELS):
+        self.source = source
+        self.x_values = np.asarray(x_values, dtype=np.float64)
+        self.accumulator = SpectrumAccumulator(num_channels, self.x_values.size)
+        self.error = None
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.source.close()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def elapsed(self):
+        return 0.0 if self.started_at is None else time.monotonic() - self.started_at
+
+    def _run(self):
+        remainder = b""
+        try:
+            while not self._stop.is_set() and not self.source.finished:
+                data = self.source.read()
+                if not data:
+                    self._stop.wait(POLL_INTERVAL)
+                    continue
+                with span("live.ingest"):
+                    channels, bins, remainder = parse_events(remainder + data)
+                    self.accumulator.add_events(channels, bins)
+        except Exception as e:
+            self.error = e
+            print(f"Error in live acquisition: {str(e)}")
+
+
+class IncrementalDetector:
+    """
+    Keeps the photopeak position of every live channel up to date, re-detecting only channels whose
+    counts changed significantly since their last detection.
+
+    Attributes:
+        positions (np.ndarray): Latest peak position per channel on the x-axis (NaN if none found).
+    """
+
+    def __init__(self, accumulator, x_values, mask, backend=None, calibrated=True, subtract_background=False,
+                 min_new_counts=MIN_NEW_COUNTS, relative_change=RELATIVE_CHANGE):
+        self.accumulator = accumulator
+        self.x_values = np.asarray(x_values, dtype=np.float64)
+        self.mask = np.asarray(mask, dtype=bool)
+        self.finder = get_peak_finder(backend)
+        self.min_new_counts = min_new_counts
+        self.relative_change = relative_change
+        self.windows = clipping_windows(self.x_values, calibrated, self.x_values.size) if subtract_background else None
+        self.positions = np.full(accumulator.num_channels, np.nan)
+
+    def update(self):
+        """
+        Re-detect the changed channels.
+
+        Returns:
+            np.ndarray: Indices of the channels that were re-detected.
+        """
+        channels, spectra = self.accumulator.take_changed(self.min_new_counts, self.relative_change)
+        if not channels.size:
+            return channels
+        with span("live.detect"):
+            if self.windows is not None:
+                spectra = spectra - snip(spectra, self.windows)
+            found, indices = self.finder.find_batch(self.x_values, spectra, self.mask)
+        self.positions[channels] = np.where(found, self.x_values[indices], np.nan)
+        return channels
+
+
+###### DAQ STAND-IN ######
+
+def sample_events(rng, cumulative, num_events):
+    """Draw (channel, bin) events from per-channel cumulative distributions."""
+    channels = rng.integers(0, cumulative.shape[0], num_events)
+    bins = np.empty(num_events, dtype=np.int64)
+    uniform = rng.random(num_events)
+    for channel in np.unique(channels):
+        selected = channels == channel
+        bins[selected] = np.searchsorted(cumulative[channel], uniform[selected], side="right")
+    return channels, np.minimum(bins, cumulative.shape[1] - 1)
+
+
+def simulate(target, rate=20000.0, duration=60.0, num_channels=DEFAULT_NUM_CHANNELS, num_bins=DEFAULT_NUM_BINS,
+             sources=("241Am", "137Cs", "60Co"), seed=0):
+    """
+    Stream events drawn from synthetic spectra, appending to a file or serving one TCP client.
+
+    Parameters:
+        target (str): Capture file path, or 'host:port' to listen on.
+        rate (float): Events per second.
+        duration (float): Seconds to stream for.
+    """
+    from SyntheticSpectra import synthetic_spectra
+
+    shapes = synthetic_spectra(num_channels=num_channels, num_bins=num_bins, sources=sources, seed=seed).to_numpy(dtype=float)
+    cumulative = np.cumsum(shapes, axis=1)
+    cumulative /= cumulative[:, -1:]
+    rng = np.random.default_rng(seed)
+
+    address = parse_address(target)
+    if address is not None:
+        server = socket.create_server(address)
+        print(f"Waiting for a live-acquisition client on {target}")
+        connection, _ = server.accept()
+        write = connection.sendall
+        close = lambda: (connection.close(), server.close())
+    else:
+        stream = open(target, "ab")
+        write = lambda data: (stream.write(data), stream.flush())
+        close = stream.close
+
+    start = time.monotonic()
+    sent = 0
+    try:
+        while time.monotonic() - start < duration:
+            due = int(rate * (time.monotonic() - start)) - sent
+            if due > 0:
+                channels, bins = sample_events(rng, cumulative, due)
+                write("".join(f"{c},{b}\n" for c, b in zip(channels, bins)).encode())
+                sent += due
+            time.sleep(POLL_INTERVAL)
+    except (BrokenPipeError, ConnectionResetError):
+        print("Live-acquisition client disconnected.")
+    finally:
+        close()
+    print(f"Streamed {sent} events to {target}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Live-acquisition tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    simulate_parser = subparsers.add_parser("simulate", help="stream synthetic events as a DAQ stand-in")
+    simulate_parser.add_argument("target", help="capture file to append to, or host:port to listen on")
+    simulate_parser.add_argument("--rate", type=float, default=20000.0, help="events per second")
+    simulate_parser.add_argument("--duration", type=float, default=60.0, help="seconds")
+    simulate_parser.add_argument("--channels", type=int, default=DEFAULT_NUM_CHANNELS)
+    simulate_parser.add_argument("--bins", type=int, default=DEFAULT_NUM_BINS)
+    simulate_parser.add_argument("--sources", default="241Am,137Cs,60Co", help="comma-separated nuclides")
+    simulate_parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    simulate(args.target, rate=args.rate, duration=args.duration, num_channels=args.channels,
+             num_bins=args.bins, sources=args.sources.split(","), seed=args.seed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,59 @@
-from PyQt6.QtWidgets import QApplication, QWidget, QPushButton, QVBoxLayout, QLabel, QDialog
-from PyQt6.QtCore import Qt
+import time
+STARTUP_TIME = time.perf_counter()
+
+from PyQt6.QtWidgets import QApplication, QWidget, QPushButton, QVBoxLayout, QLabel, QDialog, QMessageBox
+from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtGui import QFont, QPixmap
 import sys
+import os
+import importlib
+import threading
 
 '''
-Modular imports
+Modular imports. The tool windows pull in pandas, matplotlib and scipy, so they are imported
+when first opened (or preloaded in the background once the menu is visible) instead of here.
 '''
-from GammaSpecTools import GammaToolsWindow
-from DataStoreUpload import MetadataDialog
-from SimSpecTools import DataComparisonDialog
 from Utils import createHDivider
 
+# Safe to import off the GUI thread; the Qt-facing modules are left for the main thread.
+PRELOAD_MODULES = ["numpy", "pandas", "scipy.ndimage", "scipy.signal", "matplotlib", "matplotlib.figure"]
+PROFILE_MODULES = PRELOAD_MODULES + [
+    "matplotlib.pyplot", "matplotlib.backends.backend_qt5agg", "PhotopeakTools", "SimSpecTools",
+    "DataStoreUpload", "DataStoreRetrieval", "GammaSpecTools",
+]
+PROFILE_STARTUP = "--profile-startup" in sys.argv or os.environ.get("GAMMA_TOOLS_PROFILE_STARTUP") == "1"
+
+
+def preload_modules(modules=PRELOAD_MODULES, timings=None):
+    """
+    Import the heavy analysis and plotting modules ahead of use.
+
+    Parameters:
+        modules (list): Module names, imported in order.
+        timings (list): If given, receives (module, seconds) pairs; each time is the incremental
+            cost of that module on top of those imported before it.
+    """
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Preloading {name} failed: {e}")
+        if timings is not None:
+            timings.append((name, time.perf_counter() - start))
+
+
+def report_startup_profile(menu_shown_time):
+    """
+    Print time-to-menu followed by the import cost of each deferred module.
+    """
+    timings = []
+    preload_modules(PROFILE_MODULES, timings)
+    print(f"Startup profile: menu shown after {menu_shown_time - STARTUP_TIME:.3f} s")
+    for name, seconds in timings:
+        print(f"  {name:<40} {seconds * 1000:8.1f} ms")
+    print(f"  {'total deferred imports':<40} {sum(seconds for _, seconds in timings) * 1000:8.1f} ms")
+
 
 class MainMenu(QWidget):
     """
@@ -57,6 +100,10 @@ class MainMenu(QWidget):
         self.retrieveFromDataStoreButton.setFont(buttonFont)
         self.retrieveFromDataStoreButton.clicked.connect(self.retrieveFromDataStore)
 
+        self.openJobMonitorButton = QPushButton("Job Monitor", self)
+        self.openJobMonitorButton.setFont(buttonFont)
+        self.openJobMonitorButton.clicked.connect(self.openJobMonitor)
+
         self.closeMenuButton = QPushButton('Close', self)
         self.closeMenuButton.setFont(buttonFont)
         self.closeMenuButton.clicked.connect(self.closeApplication)
@@ -73,17 +120,51 @@ class MainMenu(QWidget):
         layout.addWidget(self.openMainAppButton)
         layout.addWidget(self.openComparisonDialogButton)
         layout.addWidget(createHDivider())
+        layout.addWidget(self.openJobMonitorButton)
+        layout.addWidget(createHDivider())
         layout.addWidget(self.closeMenuButton)
         layout.addWidget(createHDivider())
         self.setLayout(layout)
         self.Gamma_tools_window = None
         self.comparison_dialog=None
+        self.job_monitor = None
+
+    def showEvent(self, event):
+        """
+        Once the menu is visible, preload the tool modules in the background, or profile them
+        in startup-measurement mode.
+        """
+        super().showEvent(event)
+        if getattr(self, "_preload_started", False):
+            return
+        self._preload_started = True
+        if PROFILE_STARTUP:
+            menu_shown_time = time.perf_counter()
+            QTimer.singleShot(0, lambda: report_startup_profile(menu_shown_time))
+        else:
+            QTimer.singleShot(0, lambda: threading.Thread(target=preload_modules, daemon=True).start())
+        QTimer.singleShot(0, self.resumeJobs)
+
+    def resumeJobs(self):
+        """
+        Restart the job workers if batch jobs were left unfinished by an earlier session.
+        """
+        from JobQueue import JobQueue, get_runner
+        queue = JobQueue()
+        try:
+            unfinished = queue.has_unfinished_jobs()
+        finally:
+            queue.close()
+        if unfinished:
+            print("Resuming unfinished batch jobs.")
+            get_runner()
         
     def showGammaToolsWindow(self):
         """
         Display the main application window and hide the main menu.
         """
         if not self.Gamma_tools_window:
+            from GammaSpecTools import GammaToolsWindow
             self.Gamma_tools_window = GammaToolsWindow()
             self.Gamma_tools_window.closed.connect(self.show)
         self.Gamma_tools_window.show()
@@ -92,6 +173,7 @@ class MainMenu(QWidget):
     def openComparisonDialog(self):
         """Open the spectral comparison dialog and hide the main menu temporarily."""
         if not self.comparison_dialog:
+            from SimSpecTools import DataComparisonDialog
             self.comparison_dialog = DataComparisonDialog()
             self.comparison_dialog.finished.connect(self.show)
         self.comparison_dialog.show()
@@ -111,19 +193,45 @@ class MainMenu(QWidget):
         Parameters:
             dataset_type (str): The type of dataset, e.g., 'Gamma' or 'Neutron'.
         Outputs:
-            Saves metadata to a specified location or server if the dialog is accepted.
+            Saves metadata and uploads the dataset to the DataStore if the dialog is accepted.
         """
+        from DataStoreUpload import MetadataDialog
         dialog = MetadataDialog()
         if dialog.exec() == QDialog.DialogCode.Accepted:
             metadata = dialog.save_metadata()
             print(f"Metadata Saved for {dataset_type} Dataset:", metadata)
+            dialog.upload_to_datastore(metadata)
 
     def retrieveFromDataStore(self):
-        """Placeholder method for retrieving datasets from the DataStore."""
-        pass
+        """
+        Open the DataStore retrieval dialog and load the first retrieved dataset
+        into the Gamma Spectra Tools window; the folders of any others are listed to the user.
+        """
+        from DataStoreRetrieval import RetrievalDialog
+        dialog = RetrievalDialog()
+        if dialog.exec() == QDialog.DialogCode.Accepted and dialog.retrieved_folders:
+            self.showGammaToolsWindow()
+            self.Gamma_tools_window.load_folder_contents(dialog.retrieved_folders[0])
+            if len(dialog.retrieved_folders) > 1:
+                # The tools window shows one folder at a time
+                QMessageBox.information(self, "Datasets Retrieved",
+                                        f"Opened {dialog.retrieved_folders[0]}.\n\n"
+                                        f"The other retrieved datasets can be opened from:\n"
+                                        + "\n".join(dialog.retrieved_folders[1:]))
+
+    def openJobMonitor(self):
+        """Show the batch job monitor."""
+        from JobQueue import JobMonitorDialog
+        if not self.job_monitor:
+            self.job_monitor = JobMonitorDialog(self)
+            self.job_monitor.finished.connect(lambda: setattr(self, "job_monitor", None))
+        self.job_monitor.show()
+        self.job_monitor.raise_()
 
     def closeApplication(self):
         """Terminate the application."""
+        from JobQueue import stop_runner
+        stop_runner()
         QApplication.quit()
 
 
@@ -0,0 +1,256 @@
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+from ChunkStore import ChunkStore
+from DatasetCache import DatasetCache
+
+'''
+Local metadata catalog for DataStore datasets:
+- SQLite tables for datasets and their files, indexed on the fields MetadataDialog collects
+  (date, location, personnel, purpose, camera ID), plus an FTS5 index over notes and file names.
+- Filled on upload, and re-synchronised from the dataset recipes held by the store.
+- Matching datasets are retrieved through the local DatasetCache, with a concurrent download pool
+  for the files that are not cached yet.
+'''
+
+CATALOG_PATH = os.path.join(os.path.expanduser("~"), ".gamma_tools_catalog.sqlite")
+RETRIEVAL_ROOT = os.path.join(os.path.expanduser("~"), ".gamma_tools_retrieved")
+
+# Metadata dictionary keys (as produced by MetadataDialog.save_metadata) mapped to catalog columns.
+METADATA_COLUMNS = {
+    "Date of acquisition": "date_acquired",
+    "Location": "location",
+    "Personnel Involved": "personnel",
+    "Purpose of capture": "purpose",
+    "Camera ID": "camera_id",
+    "Additional notes": "notes",
+    "Dataset Path": "dataset_path",
+    "Capture-Log Path": "capture_log_path",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    dataset_id TEXT PRIMARY KEY,
+    store_root TEXT NOT NULL,
+    date_acquired TEXT,
+    location TEXT,
+    personnel TEXT,
+    purpose TEXT,
+    camera_id TEXT,
+    notes TEXT,
+    dataset_path TEXT,
+    capture_log_path TEXT,
+    num_files INTEGER,
+    total_bytes INTEGER,
+    uploaded_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_datasets_date ON datasets (date_acquired);
+CREATE INDEX IF NOT EXISTS idx_datasets_camera_date ON datasets (camera_id, date_acquired);
+CREATE INDEX IF NOT EXISTS idx_datasets_purpose_date ON datasets (purpose, date_acquired);
+CREATE INDEX IF NOT EXISTS idx_datasets_location ON datasets (location);
+CREATE INDEX IF NOT EXISTS idx_datasets_personnel ON datasets (personnel);
+CREATE TABLE IF NOT EXISTS files (
+    dataset_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER,
+    sha256 TEXT,
+    PRIMARY KEY (dataset_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files (sha256);
+"""
+
+
+def _fts_term(term):
+    """
+    Quote a search term for FTS5, expanding nuclide names so that 137Cs, Cs137 and Cs-137 all match.
+    """
+    match = re.fullmatch(r"(\d+)-?([A-Za-z]{1,2})|([A-Za-z]{1,2})-?(\d+)", term)
+    if not match:
+        return f'"{term}"'
+    mass, element = (match.group(1), match.group(2)) if match.group(1) else (match.group(4), match.group(3))
+    return f'("{mass}{element}" OR "{element}{mass}" OR "{element} {mass}" OR "{mass} {element}")'
+
+
+class MetadataCatalog:
+    """
+    SQLite-backed catalog of uploaded datasets.
+
+    Attributes:
+        catalog_path (str): Location of the SQLite database.
+        has_fts (bool): Whether full-text search (FTS5) is available in this SQLite build.
+    """
+
+    def __init__(self, catalog_path=CATALOG_PATH):
+        self.catalog_path = catalog_path
+        self.conn = sqlite3.connect(catalog_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+        try:
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS datasets_fts USING fts5(dataset_id UNINDEXED, notes, file_names)")
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            self.has_fts = False
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    ###### INDEXING ######
+
+    def add_dataset(self, dataset_id, recipe, store_root):
+        """
+        Insert or replace a dataset from its ChunkStore recipe.
+
+        Parameters:
+            dataset_id (str): Content-addressed dataset ID.
+            recipe (dict): Recipe with "metadata" and "files".
+            store_root (str): Root folder of the store holding the dataset.
+        """
+        metadata = recipe.get("metadata", {})
+        files = recipe.get("files", {})
+        row = {column: metadata.get(key, "") for key, column in METADATA_COLUMNS.items()}
+        row.update(dataset_id=dataset_id, store_root=os.path.abspath(store_root), num_files=len(files),
+                   total_bytes=sum(entry["size"] for entry in files.values()),
+                   uploaded_at=datetime.now().isoformat(timespec="seconds"))
+        columns = ", ".join(row)
+        placeholders = ", ".join(f":{column}" for column in row)
+        with self.conn:
+            self.conn.execute(f"INSERT OR REPLACE INTO datasets ({columns}) VALUES ({placeholders})", row)
+            self.conn.execute("DELETE FROM files WHERE dataset_id = ?", (dataset_id,))
+            self.conn.executemany("INSERT INTO files (dataset_id, name, size, sha256) VALUES (?, ?, ?, ?)",
+                                  [(dataset_id, name, entry["size"], entry["sha256"]) for name, entry in files.items()])
+            if self.has_fts:
+                self.conn.execute("DELETE FROM datasets_fts WHERE dataset_id = ?", (dataset_id,))
+                self.conn.execute("INSERT INTO datasets_fts (dataset_id, notes, file_names) VALUES (?, ?, ?)",
+                                  (dataset_id, row["notes"], " ".join(files)))
+
+    def sync_from_store(self, store_root):
+        """
+        Index any dataset recipes in the store that the local catalog does not know yet.
+
+        Returns:
+            int: Number of datasets added.
+        """
+        store = ChunkStore(store_root)
+        known = {row[0] for row in self.conn.execute("SELECT dataset_id FROM datasets")}
+        added = 0
+        for dataset_id in store.list_datasets():
+            if dataset_id not in known:
+                self.add_dataset(dataset_id, store.load_recipe(dataset_id), store_root)
+                added += 1
+        return added
+
+    ###### QUERIES ######
+
+    def query(self, date_from=None, date_to=None, location=None, personnel=None, purpose=None,
+              camera_id=None, text=None, limit=1000):
+        """
+        Find datasets matching every given filter.
+
+        Parameters:
+            date_from, date_to (str): Inclusive ISO date bounds (yyyy-MM-dd).
+            location, personnel, purpose, camera_id (str): Exact matches.
+            text (str): Full-text query over notes and file names, e.g. "137Cs".
+            limit (int): Maximum number of rows returned.
+
+        Returns:
+            list: sqlite3.Row objects ordered by acquisition date, newest first.
+        """
+        clauses = []
+        params = []
+        for column, value in (("location", location), ("personnel", personnel),
+                              ("purpose", purpose), ("camera_id", camera_id)):
+            if value:
+                clauses.append(f"d.{column} = ?")
+                params.append(value)
+        if date_from:
+            clauses.append("d.date_acquired >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("d.date_acquired <= ?")
+            params.append(date_to)
+        # Quotes are not searchable, so text made only of them (or blanks) adds no condition
+        terms = text.replace('"', " ").split() if text else []
+        if terms:
+            if self.has_fts:
+                clauses.append("d.dataset_id IN (SELECT dataset_id FROM datasets_fts WHERE datasets_fts MATCH ?)")
+                params.append(" AND ".join(_fts_term(term) for term in terms))
+            else:
+                clauses.append("(d.notes LIKE ? OR d.dataset_id IN (SELECT dataset_id FROM files WHERE name LIKE ?))")
+                params.extend([f"%{text}%"] * 2)
+
+        sql = "SELECT d.* FROM datasets d"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY d.date_acquired DESC LIMIT ?"
+        params.append(limit)
+        return self.conn.execute(sql, params).fetchall()
+
+    def get_dataset(self, dataset_id):
+        return self.conn.execute("SELECT * FROM datasets WHERE dataset_id = ?", (dataset_id,)).fetchone()
+
+    def distinct_values(self, column):
+        """Distinct non-empty values of a metadata column, for populating filter dropdowns."""
+        if column not in METADATA_COLUMNS.values():
+            raise ValueError(f"Unknown catalog column: {column}")
+        rows = self.conn.execute(
+            f"SELECT DISTINCT {column} FROM datasets WHERE {column} != '' ORDER BY {column}").fetchall()
+        return [row[0] for row in rows]
+
+
+def retrieve_datasets(rows, dest_root=RETRIEVAL_ROOT, cache=None, max_workers=8):
+    """
+    Make the datasets behind catalog rows available locally through the read-through cache.
+
+    Only files missing from the cache are downloaded, with a pool of concurrent fetches, so
+    reopening a dataset is instant and works offline. Spectrum archives are unpacked next to
+    themselves so the folder opens directly in GammaToolsWindow.
+
+    Parameters:
+        rows (list): Catalog rows as returned by MetadataCatalog.query.
+        dest_root (str): Folder receiving one sub-folder per dataset.
+        cache (DatasetCache): Cache to use; a default cache is opened if omitted.
+        max_workers (int): Number of concurrent downloads.
+
+    Returns:
+        list: Local folder path for each row, in the same order.
+    """
+    from SpectrumArchive import ARCHIVE_EXTENSION
+
+    own_cache = cache is None
+    cache = cache or DatasetCache()
+    stores = {}
+    folders = []
+    try:
+        for row in rows:
+            if row["store_root"] not in stores:
+                stores[row["store_root"]] = ChunkStore(row["store_root"])
+            store = stores[row["store_root"]]
+            folder = os.path.join(dest_root, row["dataset_id"])
+            recipe = cache.materialize_dataset(store, row["dataset_id"], folder, max_workers=max_workers)
+            for name, entry in recipe["files"].items():
+                if name.endswith(ARCHIVE_EXTENSION):
+                    _extract_archive(os.path.join(folder, *name.split("/")), entry["sha256"])
+            folders.append(folder)
+    finally:
+        if own_cache:
+            cache.close()
+    return folders
+
+
+def _extract_archive(archive_path, sha256):
+    """Unpack a retrieved spectrum archive once; a marker records which archive content was unpacked."""
+    from SpectrumArchive import SpectrumArchive
+
+    marker = f"{archive_path}.extracted"
+    if os.path.isfile(marker):
+        with open(marker, "r") as f:
+            if f.read() == sha256:
+                return
+    with SpectrumArchive(archive_path) as archive:
+        archive.extract_all(os.path.dirname(archive_path))
+    with open(marker, "w") as f:
+        f.write(sha256)
@@ -0,0 +1,333 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from Instrumentation import span
+from NuclideLibrary import get_library
+
+'''
+Automatic nuclide identification for captures of unknown sources:
+- A full-spectrum peak search returns every statistically significant peak, not only the most
+  prominent one inside an isotope's ROI. It runs on a 2-D array (one row per spectrum), so a whole
+  folder of captures is searched in a single vectorised pass.
+- Peak energies are matched against the nuclide library's sorted line index with binary search,
+  using a tolerance proportional to the detector resolution at each energy.
+- Each nuclide gets a confidence: the emission-weighted fraction of its gamma lines inside the
+  measured energy range that were found. Candidates are ranked by confidence, then by peak significance.
+
+Identification needs an energy axis (keV), so use it on calibrated data.
+'''
+
+# Detector FWHM as a fraction of energy at REFERENCE_ENERGY keV, scaling with sqrt(E)
+RESOLUTION = 0.07
+REFERENCE_ENERGY = 661.657
+SIGNIFICANCE_THRESHOLD = 5.0
+MIN_LINE_INTENSITY = 0.02
+MIN_CONFIDENCE = 0.5
+# Matching tolerance: max(TOLERANCE_KEV, TOLERANCE_FWHM * FWHM at the peak energy)
+TOLERANCE_KEV = 2.0
+TOLERANCE_FWHM = 0.5
+
+
+def spectra_from_dataframe(df, sum_channels=True):
+    """
+    Extract the x-axis and counts from a spectrum DataFrame in either toolkit layout.
+
+    Parameters:
+        df (pd.DataFrame): Wide file (bins as columns, one row per channel) or a two-column
+            'Channel/Energy', 'Counts' file.
+        sum_channels (bool): Sum all channels of a wide file into one spectrum.
+
+    Returns:
+        tuple: (x_values, counts) with counts shaped (num_spectra, num_bins).
+    """
+    if df.shape[1] == 2:
+        x_values = pd.to_numeric(df.iloc[:, 0], errors='coerce').to_numpy(dtype=np.float64)
+        counts = df.iloc[:, 1].to_numpy(dtype=np.float64)[np.newaxis, :]
+    else:
+        x_values = pd.to_numeric(df.columns, errors='coerce').to_numpy(dtype=np.float64)
+        counts = df.to_numpy(dtype=np.float64)
+        if sum_channels:
+            counts = counts.sum(axis=0, keepdims=True)
+    valid = ~np.isnan(x_values)
+    return x_values[valid], counts[:, valid]
+
+
+def fwhm(energies, resolution=RESOLUTION):
+    """Expected photopeak FWHM in keV: `resolution` x 662 keV at 662 keV, scaling with sqrt(E)."""
+    return resolution * np.sqrt(REFERENCE_ENERGY * np.maximum(energies, 0.0))
+
+
+def find_all_peaks(x_values, counts, resolution=RESOLUTION, threshold=SIGNIFICANCE_THRESHOLD):
+    """
+    Find every significant peak in one or more spectra.
+
+    For every bin, the counts in a window one FWHM wide are compared with two side windows, each half
+    a FWHM wide and starting half a FWHM beyond it, which estimate a linear continuum underneath. Window sums come
+    from cumulative sums, so the test is O(1) per bin with a different width at every energy, and
+    steps such as Compton edges cancel between the two sides. Local maxima of the Poisson
+    significance above `threshold` are kept, and weaker maxima within a FWHM of a stronger one are
+    dropped.
+
+    Parameters:
+        x_values (np.ndarray): Sorted energy axis (keV) shared by all spectra.
+        counts (np.ndarray): Counts shaped (num_spectra, num_bins) or (num_bins,).
+        resolution (float): Detector FWHM as a fraction of energy at 662 keV.
+        threshold (float): Minimum significance in standard deviations.
+
+    Returns:
+        dict: Arrays aligned per peak: 'spectrum' (row index), 'index' (bin), 'energy' (net-count
+            centroid in keV), 'net' (net counts in the peak window) and 'significance'.
+    """
+    x_values = np.asarray(x_values, dtype=np.float64)
+    counts = np.atleast_2d(np.asarray(counts, dtype=np.float64))
+    num_spectra, num_bins = counts.shape
+    empty = np.zeros(0, dtype=np.int64)
+    if num_bins < 5:
+        return {"spectrum": empty, "index": empty, "energy": np.zeros(0), "net": np.zeros(0), "significance": np.zeros(0)}
+
+    bin_width = np.gradient(x_values)
+    half_width = np.maximum(1, np.rint(0.5 * fwhm(x_values, resolution) / np.abs(bin_width))).astype(np.int64)
+    side_width = half_width
+    bins = np.arange(num_bins)
+
+    def window_indices(offset):
+        return np.clip(bins + offset, 0, num_bins)
+
+    peak_lo, peak_hi = window_indices(-half_width), window_indices(half_width + 1)
+    left_lo, left_hi = window_indices(-2 * half_width - side_width), window_indices(-2 * half_width)
+    right_lo, right_hi = window_indices(2 * half_width + 1), window_indices(2 * half_width + 1 + side_width)
+
+    with span("identify.windows"):
+        cumulative = np.zeros((num_spectra, num_bins + 1))
+        np.cumsum(counts, axis=1, out=cumulative[:, 1:])
+        weighted = np.zeros((num_spectra, num_bins + 1))
+        np.cumsum(counts * x_values, axis=1, out=weighted[:, 1:])
+        x_cumulative = np.concatenate(([0.0], np.cumsum(x_values)))
+
+        gross = cumulative[:, peak_hi] - cumulative[:, peak_lo]
+        sides = (cumulative[:, left_hi] - cumulative[:, left_lo]) + (cumulative[:, right_hi] - cumulative[:, right_lo])
+        side_bins = (left_hi - left_lo) + (right_hi - right_lo)
+        peak_bins = peak_hi - peak_lo
+        valid = (left_hi - left_lo == side_width) & (right_hi - right_lo == side_width)
+        scale = np.where(valid, peak_bins / np.maximum(side_bins, 1), 0.0)
+        background = sides * scale
+        net = gross - background
+        significance = np.where(valid, net / np.sqrt(np.maximum(gross + background * scale, 1.0)), 0.0)
+
+    centre = significance[:, 1:-1]
+    is_peak = (centre >= threshold) & (centre >= significance[:, :-2]) & (centre > significance[:, 2:])
+    rows, columns = np.nonzero(is_peak)
+    columns = columns + 1
+
+    # Keep the strongest maximum within a FWHM, per spectrum
+    keep = np.zeros(rows.size, dtype=bool)
+    accepted = {}
+    for candidate in np.argsort(-significance[rows, columns], kind='stable'):
+        row, column = rows[candidate], columns[candidate]
+        if all(abs(column - other) > 2 * half_width[column] for other in accepted.get(row, ())):
+            accepted.setdefault(row, []).append(column)
+            keep[candidate] = True
+    rows, columns = rows[keep], columns[keep]
+
+    # Net-count centroid over the peak window
+    lo, hi = peak_lo[columns], peak_hi[columns]
+    density = background[rows, columns] / peak_bins[columns]
+    net_first_moment = (weighted[rows, hi] - weighted[rows, lo]) - density * (x_cumulative[hi] - x_cumulative[lo])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        energies = np.where(net[rows, columns] > 0, net_first_moment / net[rows, columns], x_values[columns])
+    energies = np.clip(energies, x_values[lo], x_values[hi - 1])
+
+    return {
+        "spectrum": rows,
+        "index": columns,
+        "energy": energies,
+        "net": net[rows, columns],
+        "significance": significance[rows, columns],
+    }
+
+
+def match_peaks(peak_energies, resolution=RESOLUTION, tolerance_kev=TOLERANCE_KEV, tolerance_fwhm=TOLERANCE_FWHM,
+                library=None):
+    """
+    Find every library line within tolerance of each peak with two binary searches per peak.
+
+    Returns:
+        tuple: (peak indices, line indices) into the peak array and the library's line index,
+            one entry per matching pair.
+    """
+    library = library or get_library()
+    peak_energies = np.asarray(peak_energies, dtype=np.float64)
+    tolerance = np.maximum(tolerance_kev, tolerance_fwhm * fwhm(peak_energies, resolution))
+    start = np.searchsorted(library.line_energies, peak_energies - tolerance, side='left')
+    stop = np.searchsorted(library.line_energies, peak_energies + tolerance, side='right')
+    matches = stop - start
+    peak_indices = np.repeat(np.arange(peak_energies.size), matches)
+    # Position of each pair within its peak's run of matching lines
+    run_offsets = np.arange(peak_indices.size) - np.repeat(np.cumsum(matches) - matches, matches)
+    line_indices = np.repeat(start, matches) + run_offsets
+    return peak_indices, line_indices
+
+
+def rank_candidates(peaks, num_spectra, energy_range, min_intensity=MIN_LINE_INTENSITY,
+                    min_confidence=MIN_CONFIDENCE, library=None, **match_kwargs):
+    """
+    Score every library nuclide for every spectrum from the peaks found by find_all_peaks.
+
+    Parameters:
+        peaks (dict): Output of find_all_peaks.
+        num_spectra (int): Number of searched spectra.
+        energy_range (tuple): (low, high) keV covered by the spectra; lines outside are not expected.
+        min_intensity (float): Gamma lines weaker than this are neither expected nor matched.
+        min_confidence (float): Candidates below this confidence are dropped.
+        library (NuclideLibrary): Library to match against; defaults to the shared library.
+
+    Returns:
+        list: Per spectrum, a list of candidate dicts ('nuclide', 'confidence', 'significance',
+            'matched_lines' as (line keV, peak keV) pairs), best first.
+    """
+    library = library or get_library()
+    nuclide_names, nuclide_codes = np.unique(library.line_nuclides.astype(str), return_inverse=True)
+    num_nuclides = nuclide_names.size
+    num_lines = library.line_energies.size
+
+    # X-ray lines sit near the detector threshold and are shared between nuclides, so only gamma lines count
+    usable = (library.line_intensities >= min_intensity) & (library.line_kinds == "gamma")
+    in_range = (library.line_energies >= energy_range[0]) & (library.line_energies <= energy_range[1])
+    expected = np.bincount(nuclide_codes, weights=library.line_intensities * (usable & in_range),
+                           minlength=num_nuclides)
+
+    peak_indices, line_indices = match_peaks(peaks["energy"], library=library, **match_kwargs)
+    keep = usable[line_indices]
+    peak_indices, line_indices = peak_indices[keep], line_indices[keep]
+    spectra = peaks["spectrum"][peak_indices]
+
+    # Each (spectrum, line) pair counts once, credited to its most significant peak
+    order = np.lexsort((-peaks["significance"][peak_indices], spectra * num_lines + line_indices))
+    pair_keys = (spectra * num_lines + line_indices)[order]
+    first = np.ones(pair_keys.size, dtype=bool)
+    first[1:] = pair_keys[1:] != pair_keys[:-1]
+    peak_indices, line_indices, spectra = peak_indices[order][first], line_indices[order][first], spectra[order][first]
+
+    group = spectra * num_nuclides + nuclide_codes[line_indices]
+    size = num_spectra * num_nuclides
+    matched = np.bincount(group, weights=library.line_intensities[line_indices], minlength=size)
+    total_significance = np.bincount(group, weights=peaks["significance"][peak_indices], minlength=size)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        confidence = np.where(np.tile(expected, num_spectra) > 0, matched / np.tile(expected, num_spectra), 0.0)
+    confidence = np.minimum(confidence, 1.0).reshape(num_spectra, num_nuclides)
+    total_significance = total_significance.reshape(num_spectra, num_nuclides)
+
+    results = []
+    for spectrum in range(num_spectra):
+        candidates = []
+        for code in np.lexsort((-total_significance[spectrum], -confidence[spectrum])):
+            if confidence[spectrum, code] < min_confidence:
+                break
+            pairs = (spectra == spectrum) & (nuclide_codes[line_indices] == code)
+            candidates.append({
+                "nuclide": str(nuclide_names[code]),
+                "confidence": float(confidence[spectrum, code]),
+                "significance": float(total_significance[spectrum, code]),
+                "matched_lines": sorted(zip(library.line_energies[line_indices[pairs]].tolist(),
+                                            peaks["energy"][peak_indices[pairs]].tolist())),
+            })
+        results.append(candidates)
+    return results
+
+
+def identify_spectra(x_values, counts, library=None, **kwargs):
+    """
+    Search and identify one or more spectra sharing an energy axis.
+
+    Parameters:
+        x_values (np.ndarray): Sorted energy axis in keV.
+        counts (np.ndarray): Counts shaped (num_spectra, num_bins) or (num_bins,).
+        **kwargs: threshold goes to find_all_peaks, resolution to both; the rest to rank_candidates.
+
+    Returns:
+        list: Per spectrum, a dict with 'peaks' (list of (keV, significance)) and 'candidates'.
+    """
+    counts = np.atleast_2d(counts)
+    search_kwargs = {"resolution": kwargs.get("resolution", RESOLUTION)}
+    if "threshold" in kwargs:
+        search_kwargs["threshold"] = kwargs.pop("threshold")
+    with span("identify.find_peaks"):
+        peaks = find_all_peaks(x_values, counts, **search_kwargs)
+    with span("identify.match"):
+        candidates = rank_candidates(peaks, counts.shape[0], (np.nanmin(x_values), np.nanmax(x_values)),
+                                     library=library, **kwargs)
+    results = []
+    for spectrum, spectrum_candidates in enumerate(candidates):
+        selected = peaks["spectrum"] == spectrum
+        results.append({
+            "peaks": list(zip(peaks["energy"][selected].tolist(), peaks["significance"][selected].tolist())),
+            "candidates": spectrum_candidates,
+        })
+    return results
+
+
+def identify_file(file_path, sum_channels=True, **kwargs):
+    """
+    Identify the nuclides in one capture file; channels are summed unless sum_channels is False.
+
+    Returns:
+        list: identify_spectra results, one per channel, or a single one when summed.
+    """
+    x_values, counts = spectra_from_dataframe(pd.read_csv(file_path), sum_channels)
+    return identify_spectra(x_values, counts, **kwargs)
+
+
+def identify_folder(folder_path, file_names=None, max_workers=4, **kwargs):
+    """
+    Identify the channel-summed spectrum of every capture in a folder.
+
+    Files are read in parallel, then every group of files sharing an energy axis is stacked into
+    one array and searched in a single vectorised pass.
+
+    Parameters:
+        folder_path (str): Folder of capture CSV files.
+        file_names (list): Files to identify; defaults to every capture CSV file in the folder.
+        max_workers (int): Parallel file readers.
+        **kwargs: Passed to identify_spectra.
+
+    Returns:
+        dict: File name -> identify_spectra result for its summed spectrum.
+    """
+    if file_names is None:
+        # Imported here: Spectrum imports Background, which imports this module
+        from Spectrum import is_capture_file
+        # Channel-summed _combined.csv outputs would be identified a second time next to their capture
+        file_names = sorted(name for name in os.listdir(folder_path)
+                            if is_capture_file(name) and not name.endswith('_combined.csv'))
+
+    def load(name):
+        return spectra_from_dataframe(pd.read_csv(os.path.join(folder_path, name)))
+
+    with span("identify.load_folder"), ThreadPoolExecutor(max_workers=max_workers) as executor:
+        spectra = list(executor.map(load, file_names))
+
+    groups = {}
+    for name, (x_values, counts) in zip(file_names, spectra):
+        _, names, rows = groups.setdefault(x_values.tobytes(), (x_values, [], []))
+        names.append(name)
+        rows.append(counts[0])
+
+    results = {}
+    for x_values, names, rows in groups.values():
+        for name, result in zip(names, identify_spectra(x_values, np.vstack(rows), **dict(kwargs))):
+            results[name] = result
+    return {name: results[name] for name in file_names}
+
+
+def format_candidates(candidates, limit=5):
+    """One line per candidate, e.g. '137Cs  confidence 100%  (661.7 keV @ 660.9)'."""
+    if not candidates:
+        return "No library nuclide matched."
+    lines = []
+    for candidate in candidates[:limit]:
+        matched = ", ".join(f"{line:.1f} keV @ {peak:.1f}" for line, peak in candidate["matched_lines"])
+        lines.append(f"{candidate['nuclide']:<8} confidence {candidate['confidence']:.0%}  ({matched})")
+    return "\n".join(lines)
@@ -0,0 +1,179 @@
+import os
+import json
+
+import numpy as np
+
+'''
+Data-driven nuclide library shared by detection, calibration and plotting:
+- Loaded once from nuclides.json next to this module (or GAMMA_TOOLS_NUCLIDE_LIBRARY), with optional
+  additions/overrides from ~/.gamma_tools_nuclides.json, so new sources need no code changes.
+- All gamma lines of all nuclides are flattened into one energy-sorted index, so lines within an
+  energy interval or near an energy are found by binary search.
+- Photopeak search windows (ROIs) are resolved per nuclide and calibration state, and turned into
+  masks over sorted x-axes with binary search rather than a full comparison pass.
+'''
+
+LIBRARY_PATH = os.environ.get("GAMMA_TOOLS_NUCLIDE_LIBRARY",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "nuclides.json"))
+USER_LIBRARY_PATH = os.path.join(os.path.expanduser("~"), ".gamma_tools_nuclides.json")
+COMBINATION_SEPARATOR = " | "
+DEFAULT_ROI_FRACTION = 0.15
+REFERENCE_LINE_MIN_INTENSITY = 0.1
+
+
+class NuclideLibrary:
+    """
+    Nuclide data with a precomputed, energy-sorted line index.
+
+    Attributes:
+        nuclides (dict): Nuclide name -> entry dict from the data file.
+        combinations (list): Lists of nuclide names offered together in the isotope selection.
+        line_energies (np.ndarray): Energies of every line, sorted ascending.
+        line_intensities (np.ndarray): Intensities, aligned with line_energies.
+        line_nuclides (np.ndarray): Nuclide name of each line, aligned with line_energies.
+        line_kinds (np.ndarray): "gamma" or "xray" for each line, aligned with line_energies.
+    """
+
+    def __init__(self, data):
+        self.nuclides = data["nuclides"]
+        self.combinations = [list(combination) for combination in data.get("combinations", [])]
+        for name, entry in self.nuclides.items():
+            lines = [(float(line[0]), float(line[1]), line[2] if len(line) > 2 else "gamma") for line in entry["lines"]]
+            entry["lines"] = sorted(lines, key=lambda line: -line[1])
+
+        lines = sorted((energy, intensity, name, kind) for name, entry in self.nuclides.items()
+                       for energy, intensity, kind in entry["lines"])
+        self.line_energies = np.array([line[0] for line in lines], dtype=np.float64)
+        self.line_intensities = np.array([line[1] for line in lines], dtype=np.float64)
+        self.line_nuclides = np.array([line[2] for line in lines], dtype=object)
+        self.line_kinds = np.array([line[3] for line in lines], dtype=object)
+
+    @classmethod
+    def from_files(cls, path=LIBRARY_PATH, user_path=USER_LIBRARY_PATH):
+        """
+        Load the library file, merging nuclides and combinations from an optional user file.
+        """
+        with open(path, "r") as f:
+            data = json.load(f)
+        if user_path and os.path.isfile(user_path):
+            with open(user_path, "r") as f:
+                user_data = json.load(f)
+            data["nuclides"].update(user_data.get("nuclides", {}))
+            data.setdefault("combinations", []).extend(user_data.get("combinations", []))
+        return cls(data)
+
+    ###### NUCLIDES ######
+
+    def names(self):
+        return list(self.nuclides)
+
+    def selection_items(self):
+        """Isotope selection entries: every nuclide, then every configured combination."""
+        return self.names() + [COMBINATION_SEPARATOR.join(combination) for combination in self.combinations]
+
+    @staticmethod
+    def split_selection(selection):
+        """Split an isotope selection such as '241Am | 137Cs' into nuclide names."""
+        return [name.strip() for name in selection.split(COMBINATION_SEPARATOR.strip()) if name.strip()]
+
+    def reference_energy(self, nuclide):
+        """Energy of the line used for calibration, or None for an unknown nuclide."""
+        entry = self.nuclides.get(nuclide)
+        return None if entry is None else entry.get("reference_line", entry["lines"][0][0])
+
+    def reference_energies(self, nuclide, min_intensity=REFERENCE_LINE_MIN_INTENSITY):
+        """Energies of the nuclide's prominent gamma lines, ascending, for marking on plots."""
+        entry = self.nuclides.get(nuclide)
+        if entry is None:
+            return []
+        return sorted(energy for energy, intensity, kind in entry["lines"]
+                      if kind == "gamma" and intensity >= min_intensity)
+
+    def roi(self, nuclide, calibrated):
+        """
+        Initial photopeak search window for a nuclide.
+
+        Parameters:
+            nuclide (str): Nuclide name.
+            calibrated (bool): True for energy (keV) axes, False for raw ADC axes.
+
+        Returns:
+            tuple: (low, high), or None if no window is known for this axis type.
+        """
+        entry = self.nuclides.get(nuclide)
+        if entry is None:
+            return None
+        window = entry.get("roi", {}).get("calibrated" if calibrated else "raw")
+        if window is not None:
+            return float(window[0]), float(window[1])
+        if calibrated:
+            energy = self.reference_energy(nuclide)
+            half_width = max(10.0, DEFAULT_ROI_FRACTION * energy)
+            return energy - half_width, energy + half_width
+        return None
+
+    def roi_expansion(self, nuclide):
+        entry = self.nuclides.get(nuclide, {})
+        return float(entry.get("roi_expansion", 0.0))
+
+    ###### LINE INDEX ######
+
+    def lines_in(self, low, high, min_intensity=0.0):
+        """
+        All lines with low <= energy <= high, found by binary search on the sorted index.
+
+        Returns:
+            list: (energy, intensity, nuclide) tuples in ascending energy.
+        """
+        start = np.searchsorted(self.line_energies, low, side="left")
+        stop = np.searchsorted(self.line_energies, high, side="right")
+        return [(float(self.line_energies[i]), float(self.line_intensities[i]), self.line_nuclides[i])
+                for i in range(start, stop) if self.line_intensities[i] >= min_intensity]
+
+    def nearest_line(self, energy, tolerance, nuclides=None):
+        """
+        The line closest to an energy within a tolerance, optionally restricted to some nuclides.
+
+        Returns:
+            tuple: (energy, intensity, nuclide), or None.
+        """
+        candidates = [line for line in self.lines_in(energy - tolerance, energy + tolerance)
+                      if nuclides is None or line[2] in nuclides]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda line: abs(line[0] - energy))
+
+
+def is_ascending(x_values):
+    x_values = np.asarray(x_values)
+    return x_values.size > 1 and x_values[0] <= x_values[-1] and bool(np.all(x_values[1:] >= x_values[:-1]))
+
+
+def interval_mask(x_values, low, high, ascending=None):
+    """
+    Boolean mask of low <= x <= high. Sorted axes use binary search and a slice; others fall back
+    to elementwise comparison.
+
+    Parameters:
+        ascending (bool): Whether x_values is sorted ascending, e.g. True for a Spectrum's axis.
+            When None it is checked on every call, a full pass over the axis.
+    """
+    x_values = np.asarray(x_values, dtype=np.float64)
+    mask = np.zeros(x_values.shape, dtype=bool)
+    if ascending is None:
+        ascending = is_ascending(x_values)
+    if ascending and x_values.size:
+        mask[np.searchsorted(x_values, low, side="left"):np.searchsorted(x_values, high, side="right")] = True
+        return mask
+    return (x_values >= low) & (x_values <= high)
+
+
+_library = None
+
+
+def get_library():
+    """Return the shared library, loading it on first use."""
+    global _library
+    if _library is None:
+        _library = NuclideLibrary.from_files()
+    return _library
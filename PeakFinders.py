@@ -0,0 +1,243 @@
+import threading
+
+import numpy as np
+from scipy.fft import rfft, irfft, next_fast_len
+from scipy.ndimage import gaussian_filter1d, maximum_filter1d
+from scipy.signal import find_peaks
+
+from Instrumentation import span
+
+'''
+Interchangeable photopeak detection backends for PhotopeakDetector.
+
+Every backend takes whole spectra (one row per channel) plus a boolean ROI mask over the x-axis,
+and returns the strongest peak inside the ROI for every channel in one call:
+- "gaussian": the original single-scale detector (Gaussian smoothing, sigma=5, then the most
+  prominent scipy find_peaks maximum with prominence > 1.5).
+- "cwt": a multi-scale detector. Spectra are transformed with Ricker (Mexican-hat) wavelets over a
+  geometric range of widths, so sharp low-energy peaks and broad high-energy peaks both find a
+  matching scale. A peak needs a ridge of local maxima across several scales and a minimum
+  signal-to-noise ratio at its best scale, where it is then located. Only
+  the ROI plus a kernel half-length on each side is transformed, and the wavelet kernels are
+  precomputed in the frequency domain once per length and reused for every channel and file.
+
+Select a backend by name with get_peak_finder(); new backends register with register_peak_finder().
+'''
+
+DEFAULT_BACKEND = "gaussian"
+
+
+class PeakFinder:
+    """
+    Base class for detection backends.
+
+    Subclasses implement find_batch(); find() is provided for single spectra.
+    """
+    name = ""
+
+    def find_batch(self, x_values, spectra, mask):
+        """
+        Find the strongest peak inside the ROI of every spectrum.
+
+        Parameters:
+            x_values (array-like): X-axis shared by all spectra.
+            spectra (np.ndarray): Counts shaped (num_channels, num_bins).
+            mask (np.ndarray): Boolean ROI over the x-axis.
+
+        Returns:
+            tuple: (found, indices) arrays per channel; indices point into the full x-axis and are
+                only meaningful where found is True.
+        """
+        raise NotImplementedError
+
+    def find(self, x_values, y_values, mask):
+        """
+        Find the strongest peak inside the ROI of one spectrum.
+
+        Returns:
+            int: Index into the full x-axis, or None if no peak was found.
+        """
+        found, indices = self.find_batch(x_values, np.asarray(y_values, dtype=np.float64)[np.newaxis, :], mask)
+        return int(indices[0]) if found[0] else None
+
+
+class GaussianPeakFinder(PeakFinder):
+    """
+    Single-scale detector: Gaussian smoothing of the ROI, then the most prominent local maximum.
+    """
+    name = "gaussian"
+
+    def __init__(self, sigma=5, prominence=1.5):
+        self.sigma = sigma
+        self.prominence = prominence
+
+    def find_batch(self, x_values, spectra, mask):
+        spectra = np.atleast_2d(np.asarray(spectra, dtype=np.float64))
+        roi_indices = np.flatnonzero(mask)
+        found = np.zeros(spectra.shape[0], dtype=bool)
+        indices = np.zeros(spectra.shape[0], dtype=np.int64)
+        if not roi_indices.size:
+            return found, indices
+
+        with span("detect.smooth"):
+            smoothed = gaussian_filter1d(spectra[:, roi_indices], sigma=self.sigma, axis=1)
+        with span("detect.find_peaks"):
+            for channel, row in enumerate(smoothed):
+                peaks, properties = find_peaks(row, prominence=self.prominence)
+                if peaks.size > 0:
+                    found[channel] = True
+                    indices[channel] = roi_indices[peaks[np.argmax(properties['prominences'])]]
+        return found, indices
+
+
+class CWTPeakFinder(PeakFinder):
+    """
+    Multi-scale detector based on the continuous wavelet transform with Ricker wavelets.
+
+    Attributes:
+        widths (np.ndarray): Wavelet widths in bins (about the Gaussian sigma each scale matches).
+        min_snr (float): Minimum ratio of the best-scale coefficient to that scale's noise level.
+        min_ridge_length (int): Minimum number of scales with a local maximum at the peak.
+    """
+    name = "cwt"
+    # Upper bound on the size of one transformed chunk of channels (values, not bytes)
+    MAX_CHUNK_VALUES = 8_000_000
+    MAX_CACHED_KERNELS = 16
+
+    def __init__(self, widths=None, min_snr=3.0, min_ridge_length=4):
+        self.widths = np.asarray(widths if widths is not None else np.geomspace(1.0, 96.0, 16), dtype=np.float64)
+        self.min_snr = min_snr
+        self.min_ridge_length = min_ridge_length
+        self._kernels = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def ricker(points, width):
+        """Ricker wavelet sampled at `points` positions, centred, with unit L2 norm."""
+        t = np.arange(points) - (points - 1) / 2.0
+        t_sq = (t / width) ** 2
+        wavelet = (1.0 - t_sq) * np.exp(-t_sq / 2.0)
+        return wavelet / np.sqrt(np.sum(wavelet ** 2))
+
+    def kernels(self, num_bins):
+        """
+        Frequency-domain wavelet kernels for spectra of num_bins bins, computed once and reused.
+
+        Returns:
+            tuple: (kernel spectra shaped (num_scales, n_fft // 2 + 1), padding, n_fft, kernel length).
+        """
+        with self._lock:
+            cached = self._kernels.get(num_bins)
+            if cached is not None:
+                return cached
+            padding = int(min(num_bins - 1, np.ceil(5 * self.widths.max())))
+            length = 2 * padding + 1
+            n_fft = next_fast_len(num_bins + 2 * padding + length - 1, real=True)
+            wavelets = np.stack([self.ricker(length, width) for width in self.widths])
+            cached = (rfft(wavelets, n_fft, axis=1), padding, n_fft, length)
+            if len(self._kernels) >= self.MAX_CACHED_KERNELS:
+                self._kernels.pop(next(iter(self._kernels)))
+            self._kernels[num_bins] = cached
+            return cached
+
+    def transform(self, spectra):
+        """
+        Wavelet coefficients of every spectrum at every width.
+
+        Returns:
+            np.ndarray: Shaped (num_channels, num_scales, num_bins).
+        """
+        spectra = np.atleast_2d(np.asarray(spectra, dtype=np.float64))
+        num_channels, num_bins = spectra.shape
+        kernel_spectra, padding, n_fft, length = self.kernels(num_bins)
+        padded = np.pad(spectra, ((0, 0), (padding, padding)), mode='reflect') if padding else spectra
+        offset = padding + (length - 1) // 2
+
+        coefficients = np.empty((num_channels, self.widths.size, num_bins))
+        chunk = max(1, self.MAX_CHUNK_VALUES // (self.widths.size * n_fft))
+        for start in range(0, num_channels, chunk):
+            signal_spectra = rfft(padded[start:start + chunk], n_fft, axis=1)
+            convolved = irfft(signal_spectra[:, np.newaxis, :] * kernel_spectra[np.newaxis, :, :], n_fft, axis=2)
+            coefficients[start:start + chunk] = convolved[:, :, offset:offset + num_bins]
+        return coefficients
+
+    def find_batch(self, x_values, spectra, mask):
+        spectra = np.atleast_2d(np.asarray(spectra, dtype=np.float64))
+        mask = np.asarray(mask, dtype=bool)
+        num_channels, num_bins = spectra.shape
+        found = np.zeros(num_channels, dtype=bool)
+        indices = np.zeros(num_channels, dtype=np.int64)
+        roi_indices = np.flatnonzero(mask)
+        if not roi_indices.size or num_bins < 3:
+            return found, indices
+
+        # Transform only the ROI plus a kernel half-length of real data on each side
+        margin = int(np.ceil(5 * self.widths.max()))
+        lo, hi = max(0, roi_indices[0] - margin), min(num_bins, roi_indices[-1] + 1 + margin)
+        with span("detect.cwt"):
+            coefficients = self.transform(spectra[:, lo:hi])
+        window_mask = mask[lo:hi]
+
+        with span("detect.ridges"):
+            # Noise per channel and scale: robust spread of the coefficients inside the ROI
+            roi = coefficients[:, :, window_mask]
+            noise = 1.4826 * np.median(np.abs(roi - np.median(roi, axis=2, keepdims=True)), axis=2, keepdims=True)
+            snr = coefficients / np.maximum(noise, 1e-12)
+
+            is_max = np.zeros(snr.shape, dtype=bool)
+            is_max[:, :, 1:-1] = (snr[:, :, 1:-1] >= snr[:, :, :-2]) & (snr[:, :, 1:-1] > snr[:, :, 2:]) & (snr[:, :, 1:-1] > 0)
+            # A ridge continues across scales if maxima stay within about half a width of each other
+            ridge_length = np.zeros((num_channels, hi - lo), dtype=np.int64)
+            for scale, width in enumerate(self.widths):
+                ridge_length += maximum_filter1d(is_max[:, scale, :], size=2 * int(np.ceil(width / 2)) + 1, axis=1)
+
+            best_snr = snr.max(axis=1)
+            candidates = np.zeros(best_snr.shape, dtype=bool)
+            candidates[:, 1:-1] = (best_snr[:, 1:-1] >= best_snr[:, :-2]) & (best_snr[:, 1:-1] > best_snr[:, 2:])
+            candidates &= window_mask & (ridge_length >= self.min_ridge_length) & (best_snr >= self.min_snr)
+
+        scores = np.where(candidates, best_snr, -np.inf)
+        positions = np.argmax(scores, axis=1)
+        found = np.isfinite(scores[np.arange(num_channels), positions])
+
+        # The envelope of the best SNR over all scales can peak off-centre where the winning scale changes,
+        # so snap each peak to the maximum of its own best scale within half a width
+        best_scales = np.argmax(snr[np.arange(num_channels), :, positions], axis=1)
+        for channel in np.flatnonzero(found):
+            reach = int(np.ceil(self.widths[best_scales[channel]] / 2))
+            start = max(0, positions[channel] - reach)
+            stop = min(hi - lo, positions[channel] + reach + 1)
+            refined = start + int(np.argmax(coefficients[channel, best_scales[channel], start:stop]))
+            if window_mask[refined]:
+                positions[channel] = refined
+        indices = positions + lo
+        return found, indices
+
+
+_backends = {}
+
+
+def register_peak_finder(finder):
+    """Make a PeakFinder instance selectable by its name."""
+    _backends[finder.name] = finder
+
+
+def get_peak_finder(name=None):
+    """
+    Return the registered backend with this name (the default backend when name is None).
+
+    Raises:
+        ValueError: If no backend has this name.
+    """
+    name = name or DEFAULT_BACKEND
+    if name not in _backends:
+        raise ValueError(f"Unknown detection backend '{name}'. Available: {', '.join(_backends)}")
+    return _backends[name]
+
+
+def backend_names():
+    return list(_backends)
+
+
+register_peak_finder(GaussianPeakFinder())
+register_peak_finder(CWTPeakFinder())
@@ -1,16 +1,17 @@
 from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QLabel, QDialogButtonBox, QMessageBox
 )
-import pandas as pd
 import numpy as np
-import os
 import matplotlib.pyplot as plt
-from scipy.signal import find_peaks
-from scipy.ndimage import gaussian_filter1d
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
 
+from Instrumentation import timed
+from NuclideLibrary import get_library, interval_mask
+import Background
+import PeakFinders
+
 
 class PhotopeakDetector:
     """
@@ -35,28 +36,33 @@ class PhotopeakDetector:
             QMessageBox.warning(main_window, "Warning", "Please select an isotope first.")
             return
 
-        file_path = os.path.join(main_window.file_path_label.text(), main_window.selected_file)
-        df = pd.read_csv(file_path)
+        spectrum = main_window.get_spectrum()
         main_window.detected_peak_list.clear()
 
         detected_peaks = []
         user_defined_range = None
+        x_values, spectra = PhotopeakDetector.detection_spectra(main_window, spectrum)
+        expand_roi = get_library().roi_expansion(isotope)
+        if not expand_roi:
+            # The initial ROI is the same for every channel, so all channels are searched in one batch
+            mask = PhotopeakDetector.get_initial_mask(main_window, isotope, x_values, ascending=True)
+            batch_results = PhotopeakDetector.detect_peaks_batch(main_window, x_values, spectra, mask)
 
-        for index, row in df.iterrows():
-            channel_name = f'Channel_{index}'
-            x_values = pd.to_numeric(df.columns, errors='coerce')
-            y_values = row.values
+        for index, channel_name in enumerate(spectrum.channel_names()):
+            y_values = spectra[index]
 
             # Use a specific method based on isotope
-            if isotope == "60Co":
-                found_peak, peak_energy = PhotopeakDetector.adjust_ROI(main_window, isotope, channel_name, x_values, y_values)
+            if expand_roi:
+                found_peak, peak_energy = PhotopeakDetector.adjust_ROI(main_window, isotope, channel_name, x_values, y_values,
+                                                                       ascending=True)
                 if not found_peak:
                     found_peak, peak_energy, user_defined_range = PhotopeakDetector.prompt_for_new_range_until_peaks_found(
                         main_window, channel_name, x_values, y_values, user_defined_range)
             else:
-                mask = PhotopeakDetector.get_initial_mask(main_window, isotope, x_values)
-                found_peak, peak_energy = PhotopeakDetector.detect_peaks(main_window, channel_name, x_values, y_values, mask)
-                if not found_peak:
+                found_peak, peak_energy = batch_results[index]
+                if found_peak:
+                    main_window.detected_peak_list.addItem(f"{channel_name}: Peak at {peak_energy:.2f} keV")
+                else:
                     found_peak, peak_energy, user_defined_range = PhotopeakDetector.prompt_for_new_range_until_peaks_found(
                         main_window, channel_name, x_values, y_values, user_defined_range)
 
@@ -66,91 +72,136 @@ class PhotopeakDetector:
         QMessageBox.information(main_window, "Peak Detection Complete", "All channels have been processed for peaks.")
 
         if main_window.selected_channel is None or main_window.last_plot_all_channels:
-            main_window.plot_all_channels_with_peaks(df, detected_peaks)
+            main_window.plot_all_channels_with_peaks(spectrum, detected_peaks)
         else:
             main_window.plot_single_channel()
+        return detected_peaks
+
+    @staticmethod
+    def detection_spectra(main_window, spectrum):
+        """
+        X-values and per-channel spectra of a Spectrum used for detection, as float64. With continuum
+        subtraction enabled, the SNIP continuum of all channels (computed in one pass and cached) is
+        subtracted, so the most prominent peak is the photopeak rather than a Compton shoulder.
+
+        Returns:
+            tuple: (x_values, 2-D array with one row per channel). x_values is the Spectrum's ascending axis.
+        """
+        spectra = spectrum.counts.astype(np.float64)
+        if main_window.subtract_background_checkbox.isChecked():
+            spectra -= spectrum.background()
+        return spectrum.x_values, spectra
 
     @staticmethod
-    def adjust_ROI(main_window, isotope, channel_name, x_values, y_values):
+    @timed("PhotopeakDetector.adjust_ROI")
+    def adjust_ROI(main_window, isotope, channel_name, x_values, y_values, ascending=None):
         """
         Adjusts search range based on initial peak detection and detects peaks within the expanded range.
-        The range is limited to 25% outside the original mask range.
+        The range is widened by the isotope's roi_expansion fraction from the nuclide library.
+        ascending is passed to interval_mask.
         """
         # Get initial mask and range
-        mask = PhotopeakDetector.get_initial_mask(main_window, isotope, x_values)
+        mask = PhotopeakDetector.get_initial_mask(main_window, isotope, x_values, ascending)
         initial_x_values = x_values[mask]
         initial_y_values = y_values[mask]
 
         if not initial_x_values.size:
             return False, None
 
-        # Calculate the expansion of 20% outside the original mask range
+        # Calculate the expansion outside the original mask range
         initial_range = [np.min(initial_x_values), np.max(initial_x_values)]
         range_width = initial_range[1] - initial_range[0]
-        expansion = range_width * 0.25
+        expansion = range_width * get_library().roi_expansion(isotope)
 
         # Define the new search boundaries
         expanded_range = [initial_range[0] - expansion, initial_range[1] + expansion]
 
         # Apply the new range to filter values
-        mask = (x_values >= expanded_range[0]) & (x_values <= expanded_range[1])
-        restricted_x_values = x_values[mask]
-        restricted_y_values = y_values[mask]
+        mask = interval_mask(x_values, expanded_range[0], expanded_range[1], ascending)
 
         # Detect peaks in the new filtered range
-        found_peak, peak_energy = PhotopeakDetector.detect_peaks(main_window, channel_name, restricted_x_values, restricted_y_values, mask)
+        found_peak, peak_energy = PhotopeakDetector.detect_peaks(main_window, channel_name, x_values, y_values, mask)
         if found_peak:
-            peak_info = f"{channel_name}: Peak at {peak_energy:.2f} keV"
-            main_window.detected_peak_list.addItem(peak_info)
             return True, peak_energy
         return False, None
 
     @staticmethod
-    def get_initial_mask(main_window, isotope, x_values):
+    def get_initial_mask(main_window, isotope, x_values, ascending=None):
         """
         Returns a mask for x_values based on the selected isotope and calibration setting.
 
         Steps:
-        1. Check isotope and calibration status.
+        1. Look up the isotope's ROI in the nuclide library for the calibration status.
         2. Return a boolean array where True values correspond to x_values within the desired range.
         """
-        if isotope == "241Am":
-            return (x_values >= 20) & (x_values <= 70) if main_window.calibrated_radio.isChecked() else (x_values >= 70) & (x_values <= 800)
-        elif isotope == "137Cs":
-            return (x_values >= 400) & (x_values <= 1000) if main_window.calibrated_radio.isChecked() else (x_values >= 1000) & (x_values <= 2500)
-        elif isotope == "60Co":
-            return (x_values >= 1100) & (x_values <= 1700) if main_window.calibrated_radio.isChecked() else (x_values >= 5000) & (x_values <= 8000)
-        return np.full(x_values.shape, False, dtype=bool)
+        roi = get_library().roi(isotope, main_window.calibrated_radio.isChecked())
+        if roi is None:
+            return np.full(x_values.shape, False, dtype=bool)
+        return interval_mask(x_values, roi[0], roi[1], ascending)
 
     @staticmethod
-    def detect_peaks(main_window, channel_name, x_values, y_values, mask):
+    def detection_parameters(main_window, isotopes):
+        """
+        Everything that determines a detection result apart from the file itself, as used to key the
+        detection cache: backend and its settings, continuum subtraction and the library search windows.
         """
-        Detects peaks within given x and y values using Gaussian smoothing and peak finding.
+        finder = PhotopeakDetector.get_peak_finder(main_window)
+        calibrated = main_window.calibrated_radio.isChecked()
+        settings = {name: np.asarray(value).tolist() if isinstance(value, np.ndarray) else value
+                    for name, value in vars(finder).items() if not name.startswith('_')}
+        library = get_library()
+        return {
+            "backend": finder.name,
+            "backend_settings": settings,
+            "subtract_background": main_window.subtract_background_checkbox.isChecked(),
+            "background": [Background.WINDOW_FWHM, Background.RAW_WINDOW_FRACTION, Background.MIN_WINDOW],
+            "rois": [[isotope, library.roi(isotope, calibrated), library.roi_expansion(isotope)] for isotope in isotopes],
+        }
 
-        Steps:
-        1. Apply Gaussian smoothing to y-values.
-        2. Identify peaks with a specified prominence.
-        3. If peaks are found, return the highest peak and its energy.
-        4. Add detected peak information to the GUI.
+    @staticmethod
+    def get_peak_finder(main_window, backend=None):
+        """
+        Return the detection backend named by `backend`, or the one selected in the main window.
         """
-        restricted_x_values = x_values[mask]
-        restricted_y_values = y_values[mask]
+        return PeakFinders.get_peak_finder(backend or main_window.detection_backend_combo.currentText())
 
-        if not restricted_x_values.size:
-            return False, None
+    @staticmethod
+    @timed("PhotopeakDetector.detect_peaks")
+    def detect_peaks(main_window, channel_name, x_values, y_values, mask, backend=None):
+        """
+        Detects the strongest peak of one channel inside the mask with the selected detection backend.
 
-        smoothed_y_values = gaussian_filter1d(restricted_y_values, sigma=5)
-        peaks, properties = find_peaks(smoothed_y_values, prominence=1.5)  # Adjust parameters as necessary
+        Steps:
+        1. Run the backend (by default Gaussian smoothing and the most prominent peak) on the masked range.
+        2. If a peak is found, return it and its energy.
+        3. Add detected peak information to the GUI.
+        """
+        if not np.any(mask):
+            return False, None
 
-        if peaks.size > 0:
-            highest_peak_index = peaks[np.argmax(properties['prominences'])]
-            peak_energy = restricted_x_values[highest_peak_index]
+        peak_index = PhotopeakDetector.get_peak_finder(main_window, backend).find(x_values, y_values, mask)
+        if peak_index is not None:
+            peak_energy = x_values[peak_index]
             peak_info = f"{channel_name}: Peak at {peak_energy:.2f} keV"
             main_window.detected_peak_list.addItem(peak_info)
             return True, peak_energy
 
         return False, None
 
+    @staticmethod
+    @timed("PhotopeakDetector.detect_peaks_batch")
+    def detect_peaks_batch(main_window, x_values, spectra, mask, backend=None):
+        """
+        Detects the strongest peak inside the same mask for every channel in one backend call.
+        Unlike detect_peaks, the GUI is not updated.
+
+        Returns:
+            list: (found, peak energy) per channel.
+        """
+        found, indices = PhotopeakDetector.get_peak_finder(main_window, backend).find_batch(x_values, spectra, mask)
+        x_values = np.asarray(x_values)
+        return [(True, x_values[index]) if peak_found else (False, None) for peak_found, index in zip(found, indices)]
+
     @staticmethod
     def prompt_for_new_range_until_peaks_found(main_window, channel_name, x_values, y_values, user_defined_range):
         while True:
@@ -164,8 +215,6 @@ class PhotopeakDetector:
             mask = (x_values >= new_range[0]) & (x_values <= new_range[1])
             found_peak, peak_energy = PhotopeakDetector.detect_peaks(main_window, channel_name, x_values, y_values, mask)
             if found_peak:
-                peak_info = f"{channel_name}: Peak at {peak_energy:.2f} keV"
-                main_window.detected_peak_list.addItem(peak_info)
                 return True, peak_energy, new_range
 
             user_defined_range = None  # Reset user-defined range if no peak is found
@@ -246,28 +295,27 @@ class MultiISODetector(PhotopeakDetector):
             QMessageBox.warning(main_window, "Error", "No file selected. Please select a file first.")
             return
 
-        file_path = os.path.join(main_window.file_path_label.text(), main_window.selected_file)
-        df = pd.read_csv(file_path)
+        spectrum = main_window.get_spectrum()
         main_window.detected_peak_list.clear()
 
         detected_peaks = []
+        x_values, spectra = MultiISODetector.detection_spectra(main_window, spectrum)
 
         for isotope in isotopes:
             user_defined_range = None
-            for index, row in df.iterrows():
-                channel_name = f'Channel_{index}'
-                x_values = pd.to_numeric(df.columns, errors='coerce')
-                y_values = row.values
+            for index, channel_name in enumerate(spectrum.channel_names()):
+                y_values = spectra[index]
                 if detected_peaks:
                     last_detected_peak_energy = detected_peaks[-1][1]
                     start_index = np.searchsorted(x_values, last_detected_peak_energy + 1000)
                     mask = np.zeros_like(x_values, dtype=bool)
                     mask[start_index:] = True
                 else:
-                    mask = MultiISODetector.get_initial_mask(main_window, isotope, x_values)
+                    mask = MultiISODetector.get_initial_mask(main_window, isotope, x_values, ascending=True)
                 # Use a specific method based on isotope
-                if isotope == "60Co":
-                    found_peak, peak_energy = MultiISODetector.adjust_ROI(main_window, isotope, channel_name, x_values, y_values)
+                if get_library().roi_expansion(isotope):
+                    found_peak, peak_energy = MultiISODetector.adjust_ROI(main_window, isotope, channel_name, x_values, y_values,
+                                                                          ascending=True)
                     if not found_peak:
                         found_peak, peak_energy, user_defined_range = MultiISODetector.prompt_for_new_range_until_peaks_found(
                             main_window, channel_name, x_values, y_values, user_defined_range)
@@ -284,9 +332,10 @@ class MultiISODetector(PhotopeakDetector):
         QMessageBox.information(main_window, "Peak Detection Complete", "All channels have been processed for peaks.")
 
         if main_window.selected_channel is None or main_window.last_plot_all_channels:
-            main_window.plot_all_channels_with_peaks(df, detected_peaks)
+            main_window.plot_all_channels_with_peaks(spectrum, detected_peaks)
         else:
             main_window.plot_multi_peaks()
+        return detected_peaks
 
 
 class PeakTuningDialog(QDialog):
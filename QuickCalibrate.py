@@ -1,17 +1,26 @@
 import pandas as pd 
 
+from Instrumentation import timed
+from Spectrum import Spectrum
+
+@timed("quick_calibrate")
 def quick_calibrate(data, detected_peak, known_energy):
     """
     Perform quick calibration of the spectra based on a detected peak and known energy.
 
     Args:
-        df (pd.DataFrame): The original dataframe containing the spectra data.
+        data (Spectrum or pd.DataFrame): The spectrum to calibrate, or the original dataframe containing the spectra data.
         detected_peak (float): The detected peak position.
         known_energy (float): The known energy corresponding to the detected peak.
 
     Returns:
-        pd.DataFrame: The calibrated dataframe with the x-axis scaled.
+        Spectrum: For a Spectrum, one sharing its counts with the x-axis rescaled so that the detected peak
+            falls on the known energy.
+        pd.DataFrame: For a dataframe, the calibrated dataframe with the index scaled.
     """
+    if isinstance(data, Spectrum):
+        return Spectrum(data.counts, data.x_values * (known_energy / detected_peak), True, data.name, data.single_channel)
+
     # Calculate the scaling factor
     scaling_factor = detected_peak / known_energy
 
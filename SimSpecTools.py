@@ -1,33 +1,56 @@
+import os
 import pandas as pd
 import numpy as np
-from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QFileDialog, QMessageBox, QLabel
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QFileDialog, QMessageBox, QLabel, QCheckBox
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
+from Spectrum import Spectrum
+from CaptureLog import CaptureLog
+from DeadTime import LIVE_TIME, times_from_log
 
-def load_and_normalize_data(filepath):
+
+def load_and_normalize_data(filepath, capture_log=None, model=LIVE_TIME, tau=None, unit_area=True):
+    """
+    Sum the channels of a measured or simulated spectrum file and normalize it to unit area.
+    When the file has an entry in the capture log, its channels are summed as dead-time corrected
+    count rates (DeadTime), so channels with different live times are weighted correctly.
+    Unit area keeps only that relative weighting: the absolute rate, and with it the correction of a
+    file's overall dead time, is divided out. With unit_area False the summed spectrum is returned
+    as is, in counts per second when it was corrected (raw counts otherwise).
+    """
     try:
-        df = pd.read_csv(filepath, header=0, dtype=np.float64)
+        df = pd.read_csv(filepath, header=0)
 
         # Check if any non-numeric data still persists and handle it
-        if df.select_dtypes(include=[np.number]).empty:
+        if df.empty or not df.select_dtypes(exclude=[np.number]).empty:
             raise ValueError("No numeric data found in the file.")
         
-        # Decide based on dimensions whether rows or columns are channels
+        # Decide based on dimensions whether rows or columns are channels; the counts are kept
+        # in the compact dtype of the data rather than forced to float64
         if df.shape[0] < df.shape[1]:  # More columns than rows, so columns are the bins (x-axis)
-            summed_data = df.sum(axis=0)
-            channel_index = np.arange(len(summed_data))
+            counts = df.to_numpy()
         else:  # More rows than columns, so rows are the bins (x-axis)
-            summed_data = df.sum(axis=1)
-            channel_index = np.arange(len(summed_data))
-        
-        summed_data = pd.to_numeric(summed_data, errors='coerce')
+            counts = df.to_numpy().T
+        channel_index = np.arange(counts.shape[1])
+        spectrum = Spectrum(counts, channel_index, calibrated=False, name=os.path.basename(filepath))
+        summed_data = spectrum.summed()
+        if capture_log is not None:
+            file_name = os.path.basename(filepath)
+            row = capture_log.join_files(os.path.dirname(filepath), [file_name]).get(file_name)
+            times = None if row is None else times_from_log(capture_log, row, spectrum.num_channels, model, tau)
+            if times is not None and times.known():
+                summed_data = spectrum.count_rates(times).sum(axis=0)
 
-        if summed_data.isnull().any():
+        if np.isnan(summed_data).any():
             print("Non-numeric data found and ignored in the dataset.")
 
+        if not unit_area:
+            return pd.DataFrame({'Channel': channel_index, 'Counts': summed_data})
+
         # Normalize the area under the curve
-        area = np.trapz(summed_data.dropna(), channel_index[:len(summed_data.dropna())])
+        valid = ~np.isnan(summed_data)
+        area = np.trapezoid(summed_data[valid], channel_index[:np.count_nonzero(valid)])
         normalized_counts = summed_data / area
 
         return pd.DataFrame({'Channel': channel_index, 'Counts': normalized_counts})
@@ -56,19 +79,41 @@ class DataComparisonDialog(QDialog):
         self.load_simulated_button = QPushButton("Load Simulated Data")
         self.load_simulated_button.clicked.connect(self.load_simulated_data)
         layout.addWidget(self.load_simulated_button)
+
+        self.load_capture_log_button = QPushButton("Load Capture Log (live-time correction)")
+        self.load_capture_log_button.clicked.connect(self.load_capture_log)
+        layout.addWidget(self.load_capture_log_button)
+
+        # Unit area compares shapes; live-time corrected rates are only comparable without it
+        self.unit_area_checkbox = QCheckBox("Normalize to unit area (uncheck to keep corrected count rates)")
+        self.unit_area_checkbox.setChecked(True)
+        layout.addWidget(self.unit_area_checkbox)
         
         self.status_label = QLabel("Ready")
         layout.addWidget(self.status_label)
 
         self.benchmark_data = None
         self.simulated_data = None
+        self.capture_log = None
         
         self.setLayout(layout)
 
+    def load_capture_log(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Select Capture Log", "", "Capture Logs (*.csv *.txt *.log *.tsv);;All Files (*)")
+        if not path:
+            return
+        try:
+            self.capture_log = CaptureLog(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", f"Failed to load capture log: {str(e)}")
+            print(f"Error in loading capture log: {str(e)}")
+            return
+        self.status_label.setText(f"Capture log loaded: {self.capture_log.num_entries} entries; data loaded next is live-time corrected.")
+
     def load_benchmark_data(self):
         filepath, _ = QFileDialog.getOpenFileName(self, "Select Benchmark Data File", "", "CSV Files (*.csv)")
         if filepath:
-            self.benchmark_data = load_and_normalize_data(filepath)
+            self.benchmark_data = load_and_normalize_data(filepath, self.capture_log, unit_area=self.unit_area_checkbox.isChecked())
             if self.benchmark_data is not None:
                 self.update_plot()
                 self.status_label.setText("Benchmark data loaded and normalized.")
@@ -78,7 +123,7 @@ class DataComparisonDialog(QDialog):
     def load_simulated_data(self):
         filepath, _ = QFileDialog.getOpenFileName(self, "Select Simulated Data File", "", "CSV Files (*.csv)")
         if filepath:
-            self.simulated_data = load_and_normalize_data(filepath)
+            self.simulated_data = load_and_normalize_data(filepath, self.capture_log, unit_area=self.unit_area_checkbox.isChecked())
             if self.simulated_data is not None:
                 self.update_plot()
                 self.status_label.setText("Simulated data loaded and normalized.")
@@ -97,7 +142,7 @@ class DataComparisonDialog(QDialog):
         
         ax.set_title("Data Comparison")
         ax.set_xlabel("Channel")
-        ax.set_ylabel("Normalized Counts")
+        ax.set_ylabel("Normalized Counts" if self.unit_area_checkbox.isChecked() else "Count rate (cps) / Counts")
         ax.legend()
         
         self.canvas.draw()
\ No newline at end of file
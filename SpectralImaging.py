@@ -0,0 +1,205 @@
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QMessageBox
+)
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+from matplotlib.figure import Figure
+from matplotlib.widgets import SpanSelector
+
+from Spectrum import Spectrum
+
+'''
+Spectral imaging for pixelated camera captures, where every channel of a capture file is one pixel:
+- Hypercube is a Spectrum (pixels x energy counts with cumulative sums along energy) plus the pixel
+  grid geometry (row-major: Channel_<n> is row n // cols, column n % cols) and an optional pixel pitch.
+- The counts of every pixel inside any energy window are one subtraction of two interpolated
+  cumulative values, so a window image costs O(pixels), whatever its width.
+- HypercubeDialog shows the summed spectrum above the count image; dragging an energy window on the
+  spectrum updates the image while dragging, and clicking a pixel overlays its own spectrum.
+'''
+
+
+def infer_geometry(num_pixels):
+    """
+    Pixel grid for a capture: the factor pair of num_pixels closest to square.
+
+    Returns:
+        tuple: (rows, cols) with rows <= cols.
+    """
+    rows = int(np.sqrt(num_pixels))
+    while rows > 1 and num_pixels % rows:
+        rows -= 1
+    return rows, num_pixels // max(rows, 1)
+
+
+def parse_geometry(text):
+    """Parse 'rows x cols' (or 'rows,cols'), returning None if the text is not a grid."""
+    parts = text.lower().replace(",", "x").split("x")
+    if len(parts) != 2 or not all(part.strip().isdigit() for part in parts):
+        return None
+    return int(parts[0]), int(parts[1])
+
+
+class Hypercube(Spectrum):
+    """
+    Spectrum whose channels are the pixels of a camera, with the pixel grid geometry.
+
+    Attributes:
+        shape (tuple): Pixel grid (rows, cols).
+        pixel_pitch (float): Pixel spacing in mm, or None to show pixel indices.
+    """
+
+    __slots__ = ("shape", "pixel_pitch")
+
+    def __init__(self, counts, x_values, shape=None, pixel_pitch=None, calibrated=True, name=None):
+        super().__init__(counts, x_values, calibrated, name)
+        shape = tuple(shape) if shape is not None else infer_geometry(self.num_channels)
+        if shape[0] * shape[1] != self.num_channels:
+            raise ValueError(f"A {shape[0]}x{shape[1]} grid does not match {self.num_channels} pixels.")
+        self.shape = shape
+        self.pixel_pitch = pixel_pitch
+
+    @classmethod
+    def from_dataframe(cls, df, shape=None, pixel_pitch=None, calibrated=True, name=None):
+        """Build a hypercube from a capture DataFrame (one row per pixel, energies as columns)."""
+        return cls(df.to_numpy(), pd.to_numeric(df.columns, errors='coerce').to_numpy(dtype=np.float64),
+                   shape, pixel_pitch, calibrated, name)
+
+    @classmethod
+    def from_spectrum(cls, spectrum, shape=None, pixel_pitch=None):
+        """Hypercube over the counts of a loaded Spectrum, sharing its arrays."""
+        return cls(spectrum.counts, spectrum.x_values, shape, pixel_pitch, spectrum.calibrated, spectrum.name)
+
+    @property
+    def num_pixels(self):
+        return self.num_channels
+
+    def image(self, low, high):
+        """
+        Counts of every pixel inside an energy window, as a 2-D image.
+
+        Returns:
+            np.ndarray: Shaped (rows, cols).
+        """
+        return self.integrate(low, high).reshape(self.shape)
+
+    def pixel_index(self, row, col):
+        return row * self.shape[1] + col
+
+    def pixel_spectrum(self, row, col):
+        return self.counts[self.pixel_index(row, col)]
+
+    def summed_spectrum(self, pixel_mask=None):
+        """Spectrum summed over all pixels, or over the pixels where a (rows, cols) mask is True."""
+        if pixel_mask is None:
+            return self.counts.sum(axis=0)
+        return self.counts[np.asarray(pixel_mask, dtype=bool).reshape(-1)].sum(axis=0)
+
+    def extent(self):
+        """imshow extent in mm when the pixel pitch is known, else in pixel indices."""
+        pitch = self.pixel_pitch or 1.0
+        offset = 0.0 if self.pixel_pitch else -0.5
+        return (offset, offset + self.shape[1] * pitch, offset + self.shape[0] * pitch, offset)
+
+
+class HypercubeDialog(QDialog):
+    """
+    Interactive spectral image: drag an energy window on the summed spectrum to update the image.
+
+    Parameters:
+    - parent: Parent widget.
+    - hypercube: Hypercube to display.
+    - title: Capture name shown in the window title.
+    - initial_window: (low, high) energy window shown first, or None for the full range.
+    - x_label: X-axis label of the spectrum.
+    """
+    def __init__(self, parent=None, hypercube=None, title="", initial_window=None, x_label='Energy (keV)'):
+        super().__init__(parent)
+        self.setWindowTitle(f"Spectral Image - {title}")
+        self.hypercube = hypercube
+        self.window = initial_window or (hypercube.x_values[0], hypercube.x_values[-1])
+        self.layout = QVBoxLayout(self)
+
+        geometry_layout = QHBoxLayout()
+        geometry_layout.addWidget(QLabel("Pixel grid (rows x cols):"))
+        self.geometry_input = QLineEdit(f"{hypercube.shape[0]}x{hypercube.shape[1]}")
+        self.geometry_input.returnPressed.connect(self.update_geometry)
+        geometry_layout.addWidget(self.geometry_input)
+        self.window_label = QLabel("")
+        geometry_layout.addWidget(self.window_label)
+        self.layout.addLayout(geometry_layout)
+
+        self.figure = Figure(figsize=(10, 10))
+        self.canvas = FigureCanvas(self.figure)
+        self.spectrum_ax = self.figure.add_subplot(2, 1, 1)
+        self.image_ax = self.figure.add_subplot(2, 1, 2)
+        self.spectrum_ax.plot(hypercube.x_values, hypercube.summed_spectrum(), label='All pixels')
+        self.pixel_line, = self.spectrum_ax.plot([], [], linewidth=0.8, label='Selected pixel')
+        self.spectrum_ax.set_xlabel(x_label)
+        self.spectrum_ax.set_ylabel('Counts')
+        self.spectrum_ax.set_yscale('log')
+        self.spectrum_ax.legend()
+        self.window_patch = self.spectrum_ax.axvspan(*self.window, color='r', alpha=0.2)
+
+        self.image_artist = self.image_ax.imshow(hypercube.image(*self.window), cmap='viridis',
+                                                 interpolation='nearest', extent=hypercube.extent())
+        self.colorbar = self.figure.colorbar(self.image_artist, ax=self.image_ax, label='Counts in window')
+        self.image_ax.set_xlabel('x (mm)' if hypercube.pixel_pitch else 'Column')
+        self.image_ax.set_ylabel('y (mm)' if hypercube.pixel_pitch else 'Row')
+        self.figure.tight_layout()
+
+        self.layout.addWidget(self.canvas)
+        self.toolbar = NavigationToolbar(self.canvas, self)
+        self.layout.addWidget(self.toolbar)
+
+        self.span_selector = SpanSelector(self.spectrum_ax, self.on_window_selected, 'horizontal', useblit=True,
+                                          onmove_callback=self.on_window_selected, interactive=False,
+                                          props=dict(alpha=0.2, facecolor='tab:orange'))
+        self.canvas.mpl_connect('button_press_event', self.on_image_click)
+        self.update_image()
+
+    def on_window_selected(self, low, high):
+        """
+        Called while dragging and on release: integrate the new window and redraw the image.
+        """
+        if high <= low:
+            return
+        self.window = (low, high)
+        self.update_image()
+
+    def update_image(self):
+        image = self.hypercube.image(*self.window)
+        self.image_artist.set_data(image)
+        self.image_artist.set_clim(image.min(), max(image.max(), image.min() + 1))
+        self.window_patch.remove()
+        self.window_patch = self.spectrum_ax.axvspan(*self.window, color='r', alpha=0.2)
+        self.window_label.setText(f"Window {self.window[0]:.1f} - {self.window[1]:.1f}: {int(image.sum())} counts")
+        self.canvas.draw_idle()
+
+    def update_geometry(self):
+        shape = parse_geometry(self.geometry_input.text())
+        if shape is None or shape[0] * shape[1] != self.hypercube.num_pixels:
+            QMessageBox.warning(self, "Warning", f"The grid must be rows x cols with {self.hypercube.num_pixels} pixels in total.")
+            return
+        self.hypercube.shape = shape
+        self.image_artist.set_extent(self.hypercube.extent())
+        self.image_ax.set_xlim(self.hypercube.extent()[:2])
+        self.image_ax.set_ylim(self.hypercube.extent()[2:])
+        self.update_image()
+
+    def on_image_click(self, event):
+        """
+        Overlay the spectrum of the clicked pixel.
+        """
+        if event.inaxes != self.image_ax or event.xdata is None:
+            return
+        pitch = self.hypercube.pixel_pitch or 1.0
+        offset = 0.0 if self.hypercube.pixel_pitch else -0.5
+        col = int(np.clip((event.xdata - offset) // pitch, 0, self.hypercube.shape[1] - 1))
+        row = int(np.clip((event.ydata - offset) // pitch, 0, self.hypercube.shape[0] - 1))
+        self.pixel_line.set_data(self.hypercube.x_values, self.hypercube.pixel_spectrum(row, col))
+        self.pixel_line.set_label(f'Pixel ({row}, {col}) = Channel_{self.hypercube.pixel_index(row, col)}')
+        self.spectrum_ax.legend()
+        self.canvas.draw_idle()
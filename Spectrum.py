@@ -0,0 +1,432 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from Instrumentation import span
+from Background import estimate_background
+from WideCSV import read_capture
+
+'''
+Loaded spectra and window integrals over them:
+- Spectrum is the in-memory form of a capture shared by the analysis tools: one contiguous counts
+  array (num_channels x num_bins) in the narrowest dtype that holds the data exactly (uint8/16/32
+  for integer counts, float32 when that loses nothing, else float64), the ascending x-axis and the
+  channel metadata. A 16 x 1024 capture of counts takes 32 KiB as uint16 instead of the 128 KiB
+  of a float64 DataFrame, and it is sliced per channel without going through pandas.
+- Cumulative sums along the energy axis are computed on the first window integral. The counts of
+  any channel in any energy window are then the difference of two interpolated cumulative values,
+  O(1) per (channel, window) whatever the window width.
+- Window edges fall anywhere inside a bin: counts are taken as spread uniformly over each bin, so a
+  window edge halfway through a bin takes half of it.
+- Channel sets (e.g. a group of pixels or a detector ring) get their own summed cumulative array
+  the first time they are used, so repeated windows over the same set are O(1) as well.
+- Net counts subtract the cached SNIP continuum (Background.estimate_background) the same way.
+- Dead-time corrected count rates (DeadTime.AcquisitionTimes) are kept with the spectrum, per set
+  of times and model, so replotting or renormalising a file does not correct it again.
+- load_spectrum() reads files with the fast wide-CSV engines (WideCSV) and keeps recently loaded
+  files, so every consumer of a file shares one Spectrum.
+
+Example:
+    spectrum = load_spectrum("capture_1.csv")
+    cs_counts = spectrum.integrate(640.0, 685.0)                      # per channel
+    ring = spectrum.integrate(640.0, 685.0, channels=range(8), sum_channels=True)
+    net, uncertainty = spectrum.net(640.0, 685.0, channels="Channel_3")
+'''
+
+MAX_CACHED_FILES = 8
+MAX_CACHED_CHANNEL_SETS = 64
+MAX_CACHED_RATES = 4
+# Result tables written next to the data, which are not spectra
+RESULT_FILE_SUFFIXES = ('_peaks.csv', '_windows.csv')
+
+# Integer dtypes tried in order for integer-valued counts
+UNSIGNED_COUNT_DTYPES = (np.uint8, np.uint16, np.uint32, np.uint64)
+SIGNED_COUNT_DTYPES = (np.int8, np.int16, np.int32, np.int64)
+
+_file_cache = OrderedDict()
+_file_cache_lock = threading.Lock()
+
+
+def is_capture_file(file_name):
+    """Spectrum CSVs in a data folder; per-file result tables saved alongside them are left out."""
+    return file_name.endswith('.csv') and not file_name.endswith(RESULT_FILE_SUFFIXES)
+
+
+def compact_counts(values):
+    """
+    Counts in the narrowest dtype that holds them exactly.
+
+    Integer-valued data (including floats read from a CSV of whole counts) get the smallest
+    unsigned integer type, or signed if any count is negative; other data are float32 when the
+    conversion is lossless and float64 otherwise.
+
+    Returns:
+        np.ndarray: C-contiguous counts, the input itself when it is already compact.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == "b":
+        values = values.astype(np.uint8)
+    if values.dtype.kind not in "iuf":
+        raise ValueError("Counts must be numeric.")
+    if values.size:
+        integral = values.dtype.kind in "iu" or (np.isfinite(values).all() and not np.any(np.modf(values)[0]))
+        if integral:
+            low, high = values.min(), values.max()
+            for dtype in UNSIGNED_COUNT_DTYPES if low >= 0 else SIGNED_COUNT_DTYPES:
+                info = np.iinfo(dtype)
+                if info.min <= low and high <= info.max:
+                    return np.ascontiguousarray(values, dtype=dtype)
+        elif values.dtype.itemsize > 4:
+            single = values.astype(np.float32)
+            if np.array_equal(single, values, equal_nan=True):
+                return single
+    return np.ascontiguousarray(values)
+
+
+def bin_edges(x_values):
+    """Bin edges from bin centres (midpoints between centres, extrapolated at both ends)."""
+    x_values = np.asarray(x_values, dtype=np.float64)
+    if x_values.size < 2:
+        return np.array([x_values[0] - 0.5, x_values[0] + 0.5]) if x_values.size else np.zeros(1)
+    middle = 0.5 * (x_values[1:] + x_values[:-1])
+    return np.concatenate(([2 * x_values[0] - middle[0]], middle, [2 * x_values[-1] - middle[-1]]))
+
+
+def interpolate_cumulative(edges, prefix, energies, rows=None):
+    """
+    Cumulative counts at arbitrary energies, interpolated linearly inside each bin.
+
+    Parameters:
+        edges (np.ndarray): Bin edges, ascending, shaped (num_bins + 1,).
+        prefix (np.ndarray): Cumulative counts at the edges, shaped (num_rows, num_bins + 1).
+        energies (np.ndarray): Energies to evaluate at; clipped to the axis range.
+        rows (np.ndarray): Rows of prefix to evaluate, or None for all rows.
+
+    Returns:
+        np.ndarray: Shaped (num_selected_rows,) + energies.shape.
+    """
+    energies = np.clip(np.asarray(energies, dtype=np.float64), edges[0], edges[-1])
+    bins = np.clip(np.searchsorted(edges, energies, side="right") - 1, 0, edges.size - 2)
+    width = edges[bins + 1] - edges[bins]
+    fraction = np.divide(energies - edges[bins], width, out=np.zeros_like(energies), where=width > 0)
+    if rows is None:
+        lower, upper = prefix[:, bins], prefix[:, bins + 1]
+    else:
+        # Gather only the needed entries rather than copying whole rows
+        rows = np.asarray(rows).reshape((-1,) + (1,) * bins.ndim)
+        lower, upper = prefix[rows, bins], prefix[rows, bins + 1]
+    return lower + fraction * (upper - lower)
+
+
+def selection_key(channels):
+    """Hashable key for a channel selection, so equal selections are resolved once per batch."""
+    if channels is None or isinstance(channels, (str, int, np.integer)):
+        return channels
+    if isinstance(channels, range):
+        return ("range", channels.start, channels.stop, channels.step)
+    if isinstance(channels, np.ndarray):
+        return (channels.dtype.str, channels.tobytes())
+    return tuple(channels)
+
+
+class Spectrum:
+    """
+    Counts of all channels of a capture, with cumulative sums for constant-time window integrals.
+
+    Attributes:
+        counts (np.ndarray): Counts shaped (num_channels, num_bins), on an ascending axis, in the
+            dtype chosen by compact_counts.
+        x_values (np.ndarray): Bin centres (keV when calibrated), ascending.
+        edges (np.ndarray): Bin edges, shaped (num_bins + 1,).
+        prefix (np.ndarray): Cumulative counts at the edges, shaped (num_channels, num_bins + 1),
+            computed on first use.
+        calibrated (bool): Whether x_values is an energy axis.
+        name (str): Source file name, if any.
+        single_channel (bool): Whether the capture is a two-column (Channel/Energy, Counts) file.
+    """
+
+    __slots__ = ("counts", "x_values", "edges", "calibrated", "name", "single_channel",
+                 "_prefix", "_background_prefix", "_set_prefixes", "_rates", "_lock")
+
+    def __init__(self, counts, x_values, calibrated=True, name=None, single_channel=False):
+        counts = np.atleast_2d(compact_counts(counts))
+        x_values = np.asarray(x_values, dtype=np.float64)
+        if counts.shape[1] != x_values.size:
+            raise ValueError("Counts must have one column per x-value.")
+        valid = np.isfinite(x_values)
+        if not valid.all():
+            counts, x_values = counts[:, valid], x_values[valid]
+        order = np.argsort(x_values, kind="stable")
+        if np.any(order != np.arange(order.size)):
+            counts, x_values = counts[:, order], x_values[order]
+
+        self.counts = np.ascontiguousarray(counts)
+        self.x_values = x_values
+        self.calibrated = calibrated
+        self.name = name
+        self.single_channel = single_channel and self.counts.shape[0] == 1
+        self.edges = bin_edges(x_values)
+        self._prefix = None
+        self._background_prefix = None
+        self._set_prefixes = OrderedDict()
+        self._rates = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dataframe(cls, df, calibrated=True, name=None):
+        """
+        Build a Spectrum from a capture DataFrame: one row per channel with bin centres as columns, or
+        the two-column (Channel/Energy, Counts) layout of summed spectra as a single channel.
+        """
+        if df.shape[1] == 2:
+            x_values = pd.to_numeric(df.iloc[:, 0], errors='coerce').to_numpy(dtype=np.float64)
+            return cls(df.iloc[:, 1].to_numpy()[np.newaxis, :], x_values, calibrated, name, single_channel=True)
+        return cls(df.to_numpy(), pd.to_numeric(df.columns, errors='coerce').to_numpy(dtype=np.float64), calibrated, name)
+
+    @classmethod
+    def from_csv(cls, source, calibrated=True, name=None, engine=None):
+        """Read a capture CSV (path or binary stream) with a WideCSV engine, without building a DataFrame."""
+        x_values, counts, single_channel = read_capture(source, engine)
+        return cls(counts, x_values, calibrated, name, single_channel)
+
+    def to_dataframe(self):
+        """The capture in the layout it is read from: two columns for a single channel, else one row per channel."""
+        if self.single_channel:
+            return pd.DataFrame({'Channel/Energy': self.x_values, 'Counts': self.counts[0]})
+        return pd.DataFrame(self.counts, columns=self.x_values)
+
+    @property
+    def num_channels(self):
+        return self.counts.shape[0]
+
+    @property
+    def nbytes(self):
+        """Memory held by the arrays of the spectrum, including cumulative sums computed so far."""
+        cached = [self._prefix, self._background_prefix, *self._set_prefixes.values(), *self._rates.values()]
+        return self.counts.nbytes + self.x_values.nbytes + self.edges.nbytes + sum(a.nbytes for a in cached if a is not None)
+
+    @property
+    def prefix(self):
+        """Cumulative counts at the bin edges of every channel, computed on first use."""
+        if self._prefix is None:
+            with self._lock:
+                if self._prefix is None:
+                    with span("spectrum.prefix_sum"):
+                        prefix = np.zeros((self.counts.shape[0], self.counts.shape[1] + 1), dtype=np.float64)
+                        np.cumsum(self.counts, axis=1, dtype=np.float64, out=prefix[:, 1:])
+                    self._prefix = prefix
+        return self._prefix
+
+    def count_rates(self, times):
+        """
+        Dead-time corrected counts per second of every channel, cached per set of times and model.
+
+        Parameters:
+            times (DeadTime.AcquisitionTimes): Per-channel live/real times and the model to apply.
+
+        Returns:
+            np.ndarray: float64 rates shaped like counts.
+        """
+        key = times.key()
+        with self._lock:
+            rates = self._rates.get(key)
+            if rates is not None:
+                self._rates.move_to_end(key)
+                return rates
+        rates = times.correct(self.counts)
+        with self._lock:
+            self._rates[key] = rates
+            while len(self._rates) > MAX_CACHED_RATES:
+                self._rates.popitem(last=False)
+        return rates
+
+    ###### CHANNEL SELECTION ######
+
+    def channel_indices(self, channels=None):
+        """
+        Row indices for a channel selection.
+
+        Parameters:
+            channels: None for all channels; an index or 'Channel_<n>' name ('Single_Channel' for a
+                single-channel file); an iterable of these; or a boolean mask over the channels.
+
+        Returns:
+            np.ndarray: Channel indices.
+        """
+        if channels is None:
+            return np.arange(self.num_channels)
+        if isinstance(channels, (str, int, np.integer)):
+            channels = [channels]
+        channels = list(channels)
+        if channels and isinstance(channels[0], (bool, np.bool_)):
+            return np.flatnonzero(np.asarray(channels, dtype=bool))
+        indices = [0 if channel == "Single_Channel" else int(channel.split('_')[1]) if isinstance(channel, str) else int(channel)
+                   for channel in channels]
+        indices = np.asarray(indices, dtype=np.int64)
+        if indices.size and (indices.min() < 0 or indices.max() >= self.num_channels):
+            raise IndexError(f"Channel selection is outside the {self.num_channels} channels of the spectrum.")
+        return indices
+
+    def channel_names(self):
+        """Channel names as listed in the GUI: 'Single_Channel', or 'Channel_<n>' per row."""
+        if self.single_channel:
+            return ["Single_Channel"]
+        return [f'Channel_{index}' for index in range(self.num_channels)]
+
+    def channel(self, channel, dtype=None):
+        """
+        Counts of one channel (see channel_indices), as a view of the counts unless a dtype is given.
+        Smoothing, fitting or subtracting from compact integer counts needs dtype=np.float64.
+        """
+        counts = self.counts[self.channel_indices(channel)[0]]
+        return counts if dtype is None else counts.astype(dtype)
+
+    def summed(self):
+        """Counts summed over all channels, as float64."""
+        return self.counts.sum(axis=0, dtype=np.float64)
+
+    def set_prefix(self, indices, background=False):
+        """Cumulative counts (or continuum) summed over a channel set, cached per set."""
+        key = (indices.tobytes(), background)
+        with self._lock:
+            prefix = self._set_prefixes.get(key)
+            if prefix is not None:
+                self._set_prefixes.move_to_end(key)
+                return prefix
+        prefix = (self.background_prefix() if background else self.prefix)[indices].sum(axis=0, keepdims=True)
+        with self._lock:
+            self._set_prefixes[key] = prefix
+            while len(self._set_prefixes) > MAX_CACHED_CHANNEL_SETS:
+                self._set_prefixes.popitem(last=False)
+        return prefix
+
+    ###### WINDOW INTEGRALS ######
+
+    def _integrate(self, prefix, low, high, rows=None):
+        energies = np.stack(np.broadcast_arrays(np.asarray(low, dtype=np.float64), np.asarray(high, dtype=np.float64)))
+        cumulative = interpolate_cumulative(self.edges, prefix, energies, rows)
+        return cumulative[:, 1] - cumulative[:, 0]
+
+    def _window_integrals(self, prefix_of, indices, low, high, sum_channels, background=False):
+        if sum_channels:
+            return self._integrate(self.set_prefix(indices, background), low, high)[0]
+        all_channels = indices.size == self.num_channels and np.array_equal(indices, np.arange(self.num_channels))
+        return self._integrate(prefix_of(), low, high, None if all_channels else indices)
+
+    def integrate(self, low, high, channels=None, sum_channels=False):
+        """
+        Counts between low and high on the x-axis, with sub-bin interpolation at both edges.
+
+        Parameters:
+            low, high (float or array-like): Window edges; arrays give one window per element.
+            channels: Channel selection (see channel_indices).
+            sum_channels (bool): Sum over the selected channels instead of returning each channel.
+
+        Returns:
+            np.ndarray: Shaped (num_selected_channels,) + window shape, or the window shape when summed.
+        """
+        return self._window_integrals(lambda: self.prefix, self.channel_indices(channels), low, high, sum_channels)
+
+    def integrate_batch(self, queries):
+        """
+        Integrals for a batch of (channels, low, high) queries, each summed over its channel set.
+        Queries sharing a channel set are evaluated together against that set's cumulative sums.
+
+        Returns:
+            np.ndarray: One integral per query, in query order.
+        """
+        results = np.empty(len(queries), dtype=np.float64)
+        groups = {}
+        for position, (channels, low, high) in enumerate(queries):
+            groups.setdefault(selection_key(channels), (channels, []))[1].append((position, low, high))
+        for channels, members in groups.values():
+            positions, lows, highs = (np.array(column) for column in zip(*members))
+            results[positions] = self._integrate(self.set_prefix(self.channel_indices(channels)), lows, highs)[0]
+        return results
+
+    ###### NET COUNTS ######
+
+    def background(self):
+        """Cached SNIP continuum of every channel, shaped like counts."""
+        return estimate_background(self.x_values, self.counts, self.calibrated)
+
+    def background_prefix(self):
+        """Cumulative sums of the SNIP continuum of every channel, computed on first use."""
+        with self._lock:
+            if self._background_prefix is None:
+                background = self.background()
+                prefix = np.zeros((self.counts.shape[0], self.counts.shape[1] + 1), dtype=np.float64)
+                np.cumsum(background, axis=1, out=prefix[:, 1:])
+                self._background_prefix = prefix
+            return self._background_prefix
+
+    def net(self, low, high, channels=None, sum_channels=False):
+        """
+        Counts above the SNIP continuum between low and high, with their Poisson uncertainty.
+
+        Returns:
+            tuple: (net, uncertainty), shaped as for integrate().
+        """
+        indices = self.channel_indices(channels)
+        gross = self._window_integrals(lambda: self.prefix, indices, low, high, sum_channels)
+        continuum = self._window_integrals(self.background_prefix, indices, low, high, sum_channels, background=True)
+        return gross - continuum, np.sqrt(np.maximum(gross + continuum, 0.0))
+
+
+def load_spectrum(file_path, calibrated=True, reader=None, engine=None):
+    """
+    Spectrum of a capture file, shared between callers until the file changes on disk.
+
+    Parameters:
+        file_path (str): Capture file.
+        calibrated (bool): Whether the file's axis is in keV.
+        reader (callable): Reads a file path into a DataFrame, instead of a CSV engine.
+        engine (str): WideCSV engine name, or None for the default.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, bool(calibrated))
+    with _file_cache_lock:
+        spectrum = _file_cache.get(key)
+        if spectrum is not None:
+            _file_cache.move_to_end(key)
+            return spectrum
+    if reader is not None:
+        spectrum = Spectrum.from_dataframe(reader(file_path), calibrated, os.path.basename(file_path))
+    else:
+        with span("load_csv"):
+            spectrum = Spectrum.from_csv(file_path, calibrated, os.path.basename(file_path), engine)
+    with _file_cache_lock:
+        _file_cache[key] = spectrum
+        while len(_file_cache) > MAX_CACHED_FILES:
+            _file_cache.popitem(last=False)
+    return spectrum
+
+
+def clear_cache():
+    with _file_cache_lock:
+        _file_cache.clear()
+
+
+def parse_windows(text):
+    """
+    Parse energy windows written as 'low-high' pairs separated by commas or semicolons, e.g. '640-685, 1150-1190'.
+
+    Raises:
+        ValueError: If a window is not two ascending numbers.
+    """
+    windows = []
+    for part in text.replace(";", ",").split(","):
+        if not part.strip():
+            continue
+        # Split on the first '-' that is not a sign, so negative edges are allowed
+        position = part.strip().find("-", 1)
+        if position < 0:
+            raise ValueError(f"Window '{part.strip()}' is not written as low-high.")
+        low, high = float(part.strip()[:position]), float(part.strip()[position + 1:])
+        if high <= low:
+            raise ValueError(f"Window '{part.strip()}' must have low < high.")
+        windows.append((low, high))
+    return windows
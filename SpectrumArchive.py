@@ -0,0 +1,331 @@
+import os
+import io
+import json
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+'''
+Compressed, chunked binary archive for spectrum datasets:
+- Every channel (row of a wide spectrum CSV, or column of a two-column file) is stored as its
+  own compressed block, so a single channel or file is read without touching the rest.
+- Integer counts are delta encoded, zigzagged into the narrowest unsigned type and byte-shuffled
+  before compression (zstd when available, zlib otherwise); non-integer data is shuffled float64.
+- Files that are not numeric CSVs are stored as compressed raw bytes so the archive is complete.
+- The capture metadata and a block index are written as a JSON trailer.
+
+Layout: MAGIC | version | blocks... | index (zlib JSON) | index offset, index length, MAGIC
+'''
+
+ARCHIVE_MAGIC = b"GSPA"
+ARCHIVE_VERSION = 1
+ARCHIVE_EXTENSION = ".gsa"
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 6
+
+_HEADER = struct.Struct("<4sI")
+_FOOTER = struct.Struct("<QQ4s")
+
+
+def default_codec():
+    return "zstd" if zstandard is not None else "zlib"
+
+
+def _compress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def _decompress(data, codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("This archive is zstd compressed; install the 'zstandard' package to read it.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _shuffle(values):
+    """Group the bytes of each significance together (blosc-style byte shuffle)."""
+    return values.view(np.uint8).reshape(-1, values.dtype.itemsize).T.tobytes()
+
+
+def _unshuffle(buf, dtype, length):
+    dtype = np.dtype(dtype)
+    return np.frombuffer(buf, dtype=np.uint8).reshape(dtype.itemsize, length).T.copy().view(dtype).ravel()
+
+
+def encode_counts(values):
+    """
+    Encode a 1-D array of counts ahead of compression.
+
+    Args:
+        values (np.ndarray): Counts or any numeric values.
+
+    Returns:
+        tuple: (encoded bytes, block info dict describing how to decode them).
+    """
+    values = np.asarray(values)
+    length = values.size
+    # Whole floats are delta-encoded too, unless their differences could overflow int64
+    if np.issubdtype(values.dtype, np.integer) or (
+            np.all(np.isfinite(values)) and np.array_equal(values, np.round(values))
+            and (not length or np.abs(values).max() < 2.0 ** 62)):
+        ints = values.astype(np.int64)
+        deltas = np.diff(ints, prepend=np.int64(0))
+        zigzag = ((deltas << 1) ^ (deltas >> 63)).view(np.uint64)
+        peak = int(zigzag.max()) if length else 0
+        for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+            if peak <= np.iinfo(dtype).max:
+                break
+        return _shuffle(zigzag.astype(dtype)), {"encoding": "delta", "dtype": np.dtype(dtype).str, "length": length}
+    floats = values.astype(np.float64)
+    return _shuffle(floats), {"encoding": "float", "dtype": floats.dtype.str, "length": length}
+
+
+def decode_counts(buf, info):
+    """
+    Invert encode_counts.
+
+    Returns:
+        np.ndarray: int64 counts for delta blocks, float64 otherwise.
+    """
+    values = _unshuffle(buf, info["dtype"], info["length"])
+    if info["encoding"] == "delta":
+        zigzag = values.astype(np.uint64)
+        deltas = (zigzag >> np.uint64(1)).view(np.int64) ^ -(zigzag & np.uint64(1)).view(np.int64)
+        return np.cumsum(deltas)
+    return values
+
+
+def _encode_file(args):
+    """
+    Parse and compress one dataset file. Runs in a worker process.
+
+    Args:
+        args (tuple): (absolute path, relative name, codec).
+
+    Returns:
+        dict: File entry with compressed blocks in "blocks" as (info, bytes) pairs.
+    """
+    path, name, codec = args
+    entry = {"name": name}
+    try:
+        if not name.lower().endswith(".csv"):
+            raise ValueError("not a CSV file")
+        df = pd.read_csv(path)
+        matrix = df.to_numpy(dtype=np.float64)
+        if matrix.size == 0:
+            raise ValueError("empty CSV file")
+    except (ValueError, TypeError, pd.errors.ParserError, UnicodeDecodeError):
+        with open(path, "rb") as f:
+            raw = f.read()
+        entry.update(kind="raw", blocks=[({"encoding": "raw", "length": len(raw)}, _compress(raw, codec))])
+        return entry
+
+    return encode_entry(name, list(df.columns), df, codec)
+
+
+def encode_entry(name, columns, values, codec):
+    """
+    Compress a parsed spectrum file into an archive entry.
+
+    Args:
+        name (str): Name of the file inside the archive.
+        columns (list): Column labels of the CSV.
+        values (np.ndarray or pd.DataFrame): The values, one row per channel (or per bin of a two-column file).
+        codec (str): "zstd" or "zlib".
+
+    Returns:
+        dict: File entry with compressed blocks in "blocks" as (info, bytes) pairs.
+    """
+    entry = {"name": name, "columns": [str(column) for column in columns]}
+    if len(columns) == 2:
+        entry["kind"] = "single"
+        series = [values.iloc[:, i].to_numpy() if isinstance(values, pd.DataFrame) else np.asarray(values)[:, i]
+                  for i in range(2)]
+    else:
+        entry["kind"] = "wide"
+        series = list(np.asarray(values, dtype=np.float64) if isinstance(values, pd.DataFrame) else values)
+    blocks = []
+    for row in series:
+        encoded, info = encode_counts(row)
+        blocks.append((info, _compress(encoded, codec)))
+    entry["blocks"] = blocks
+    return entry
+
+
+def _append_entry(out, index, entry):
+    """Write an entry's blocks at the end of an open archive and record them in the index."""
+    refs = []
+    for info, data in entry.pop("blocks"):
+        refs.append(dict(info, offset=out.tell(), size=len(data)))
+        out.write(data)
+    entry["blocks"] = refs
+    index["files"][entry.pop("name")] = entry
+
+
+def _finish_archive(out, index):
+    index_data = zlib.compress(json.dumps(index).encode(), ZLIB_LEVEL)
+    index_offset = out.tell()
+    out.write(index_data)
+    out.write(_FOOTER.pack(index_offset, len(index_data), ARCHIVE_MAGIC))
+
+
+def write_archive(folder_path, archive_path, metadata=None, codec=None, max_workers=None):
+    """
+    Transcode every file below a dataset folder into a single archive, compressing in parallel.
+
+    Args:
+        folder_path (str): Dataset folder.
+        archive_path (str): Output archive path.
+        metadata (dict): Capture metadata stored with the archive.
+        codec (str): "zstd" or "zlib"; defaults to zstd when available.
+        max_workers (int): Number of compression processes; defaults to the CPU count.
+
+    Returns:
+        dict: The archive index.
+    """
+    codec = codec or default_codec()
+    folder_path = os.path.abspath(folder_path)
+    archive_abs = os.path.abspath(archive_path)
+    tasks = []
+    for root, _, files in os.walk(folder_path):
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            if os.path.abspath(path) != archive_abs:
+                tasks.append((path, os.path.relpath(path, folder_path).replace(os.sep, "/"), codec))
+    tasks.sort(key=lambda task: task[1])
+
+    index = {"version": ARCHIVE_VERSION, "codec": codec, "metadata": metadata or {}, "files": {}}
+    with open(archive_path, "wb") as out, ProcessPoolExecutor(max_workers=max_workers) as pool:
+        out.write(_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION))
+        for entry in pool.map(_encode_file, tasks, chunksize=4):
+            _append_entry(out, index, entry)
+        _finish_archive(out, index)
+    return index
+
+
+def write_capture_archive(archive_path, name, columns, values, metadata=None, codec=None):
+    """
+    Write a single parsed capture as its own archive (see encode_entry for the arguments).
+
+    Returns:
+        dict: The archive index.
+    """
+    codec = codec or default_codec()
+    index = {"version": ARCHIVE_VERSION, "codec": codec, "metadata": metadata or {}, "files": {}}
+    with open(archive_path, "wb") as out:
+        out.write(_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION))
+        _append_entry(out, index, encode_entry(name, columns, values, codec))
+        _finish_archive(out, index)
+    return index
+
+
+class SpectrumArchive:
+    """
+    Random-access reader for archives written by write_archive.
+
+    Usage:
+        with SpectrumArchive(path) as archive:
+            x_values, counts = archive.read_channel("capture_12.csv", 3)
+    """
+
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        self._file = open(archive_path, "rb")
+        magic, version = _HEADER.unpack(self._file.read(_HEADER.size))
+        if magic != ARCHIVE_MAGIC or version > ARCHIVE_VERSION:
+            self._file.close()
+            raise ValueError(f"{archive_path} is not a supported spectrum archive.")
+        self._file.seek(-_FOOTER.size, os.SEEK_END)
+        index_offset, index_size, magic = _FOOTER.unpack(self._file.read(_FOOTER.size))
+        if magic != ARCHIVE_MAGIC:
+            self._file.close()
+            raise ValueError(f"{archive_path} is truncated or corrupt.")
+        self._file.seek(index_offset)
+        self.index = json.loads(zlib.decompress(self._file.read(index_size)))
+        self.codec = self.index["codec"]
+        self.metadata = self.index["metadata"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def list_files(self):
+        return list(self.index["files"])
+
+    def _read_block(self, ref):
+        self._file.seek(ref["offset"])
+        data = _decompress(self._file.read(ref["size"]), self.codec)
+        if ref["encoding"] == "raw":
+            return data
+        return decode_counts(data, ref)
+
+    def _entry(self, name):
+        entry = self.index["files"].get(name)
+        if entry is None:
+            raise KeyError(f"{name} is not in archive {self.archive_path}")
+        return entry
+
+    def num_channels(self, name):
+        entry = self._entry(name)
+        return 1 if entry["kind"] == "single" else len(entry["blocks"]) if entry["kind"] == "wide" else 0
+
+    def read_channel(self, name, channel_index):
+        """
+        Decompress a single channel of a file.
+
+        Returns:
+            tuple: (x_values as float array, counts array).
+        """
+        entry = self._entry(name)
+        if entry["kind"] == "single":
+            if channel_index != 0:
+                raise IndexError(f"{name} holds a single channel.")
+            return self._read_block(entry["blocks"][0]).astype(np.float64), self._read_block(entry["blocks"][1])
+        if entry["kind"] != "wide":
+            raise ValueError(f"{name} is not a spectrum file.")
+        x_values = pd.to_numeric(pd.Index(entry["columns"]), errors="coerce").to_numpy(dtype=np.float64)
+        return x_values, self._read_block(entry["blocks"][channel_index])
+
+    def read_dataframe(self, name):
+        """
+        Rebuild a file as the DataFrame pd.read_csv would have produced.
+        """
+        entry = self._entry(name)
+        if entry["kind"] == "raw":
+            return pd.read_csv(io.BytesIO(self._read_block(entry["blocks"][0])))
+        blocks = [self._read_block(ref) for ref in entry["blocks"]]
+        if entry["kind"] == "single":
+            return pd.DataFrame(dict(zip(entry["columns"], blocks)))
+        return pd.DataFrame(np.vstack(blocks) if blocks else None, columns=entry["columns"])
+
+    def extract_file(self, name, dest_path):
+        """
+        Write a file back out. Raw files are byte-identical; spectrum CSVs hold identical values.
+        """
+        entry = self._entry(name)
+        os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+        if entry["kind"] == "raw":
+            with open(dest_path, "wb") as f:
+                f.write(self._read_block(entry["blocks"][0]))
+        else:
+            self.read_dataframe(name).to_csv(dest_path, index=False)
+
+    def extract_all(self, dest_folder):
+        for name in self.list_files():
+            self.extract_file(name, os.path.join(dest_folder, *name.split("/")))
@@ -0,0 +1,126 @@
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+'''
+Synthetic multi-channel gamma spectra in the toolkit's CSV layout (one row per channel, one column
+per energy bin, bin centres as the header), for benchmarks and reproducible testing:
+- Photopeaks for 241Am, 137Cs and 60Co with energy-dependent resolution.
+- A Compton continuum with an edge for every line, plus an exponential low-energy background.
+- Per-channel gain spread, so peak positions differ slightly between channels.
+- Poisson counting noise, from a seeded generator so every run produces identical files.
+'''
+
+# (energy keV, emission probability) per nuclide
+SOURCE_LINES = {
+    "241Am": [(59.54, 0.359)],
+    "137Cs": [(661.66, 0.851)],
+    "60Co": [(1173.23, 0.9985), (1332.49, 0.9998)],
+}
+ELECTRON_MASS_KEV = 510.999
+
+
+def compton_edge(energy):
+    return energy * (1.0 - 1.0 / (1.0 + 2.0 * energy / ELECTRON_MASS_KEV))
+
+
+def synthetic_spectra(num_channels=16, num_bins=2048, max_energy=2000.0, sources=("241Am", "137Cs", "60Co"),
+                      counts_per_channel=2e5, resolution=0.07, gain_spread=0.01, background_fraction=0.2,
+                      compton_fraction=2.0, seed=0):
+    """
+    Generate a DataFrame of synthetic spectra.
+
+    Parameters:
+        num_channels (int): Number of detector channels (rows).
+        num_bins (int): Number of energy bins (columns).
+        max_energy (float): Upper edge of the energy axis in keV.
+        sources (iterable): Nuclides from SOURCE_LINES present in the capture.
+        counts_per_channel (float): Expected photopeak counts per channel summed over all lines.
+        resolution (float): FWHM as a fraction of energy at 662 keV, scaling with sqrt(E).
+        gain_spread (float): Relative standard deviation of per-channel gain.
+        background_fraction (float): Exponential background counts relative to photopeak counts.
+        compton_fraction (float): Compton continuum counts relative to each line's photopeak counts.
+        seed (int): Random seed.
+
+    Returns:
+        pd.DataFrame: Integer counts with bin centres (keV, formatted as strings) as columns.
+    """
+    rng = np.random.default_rng(seed)
+    edges = np.linspace(0.0, max_energy, num_bins + 1)
+    centres = 0.5 * (edges[:-1] + edges[1:])
+    bin_width = edges[1] - edges[0]
+    lines = [line for source in sources for line in SOURCE_LINES[source]]
+    total_branching = sum(branching for _, branching in lines)
+
+    gains = 1.0 + gain_spread * rng.standard_normal(num_channels)
+    expected = np.zeros((num_channels, num_bins))
+    for energy, branching in lines:
+        peak_counts = counts_per_channel * branching / total_branching
+        # Line position in each channel's uncalibrated response
+        positions = energy * gains[:, None]
+        sigma = resolution * np.sqrt(661.66 * energy) / 2.3548
+        expected += peak_counts * bin_width * np.exp(-0.5 * ((centres - positions) / sigma) ** 2) / (
+            sigma * np.sqrt(2 * np.pi))
+
+        edge = compton_edge(energy) * gains[:, None]
+        # Flat continuum rising towards a resolution-smeared Compton edge
+        shape = (1.0 + 0.5 * (centres / edge) ** 2) * 0.5 * (1.0 - np.tanh((centres - edge) / sigma))
+        shape /= shape.sum(axis=1, keepdims=True)
+        expected += compton_fraction * peak_counts * shape
+
+    background = np.exp(-centres / (0.15 * max_energy))
+    expected += background_fraction * counts_per_channel * background / background.sum()
+
+    counts = rng.poisson(expected)
+    columns = [f"{centre:.3f}" for centre in centres]
+    return pd.DataFrame(counts, columns=columns)
+
+
+def write_dataset(folder_path, num_files=4, name_prefix="capture", **kwargs):
+    """
+    Write a folder of synthetic capture files, as loaded by GammaToolsWindow.load_folder_contents.
+
+    Parameters:
+        folder_path (str): Output folder, created if missing.
+        num_files (int): Number of capture files.
+        name_prefix (str): File name prefix; files are numbered from 1.
+        **kwargs: Passed to synthetic_spectra; the seed is offset per file.
+
+    Returns:
+        list: Paths of the written files.
+    """
+    os.makedirs(folder_path, exist_ok=True)
+    seed = kwargs.pop("seed", 0)
+    paths = []
+    for i in range(num_files):
+        df = synthetic_spectra(seed=seed + i, **kwargs)
+        path = os.path.join(folder_path, f"{name_prefix}_{i + 1}.csv")
+        df.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic gamma spectra in the toolkit CSV layout.")
+    parser.add_argument("folder", help="output folder")
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--channels", type=int, default=16)
+    parser.add_argument("--bins", type=int, default=2048)
+    parser.add_argument("--max-energy", type=float, default=2000.0)
+    parser.add_argument("--sources", default="241Am,137Cs,60Co", help="comma-separated nuclides")
+    parser.add_argument("--counts", type=float, default=2e5, help="photopeak counts per channel")
+    parser.add_argument("--gain-spread", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    paths = write_dataset(args.folder, num_files=args.files, num_channels=args.channels, num_bins=args.bins,
+                          max_energy=args.max_energy, sources=args.sources.split(","),
+                          counts_per_channel=args.counts, gain_spread=args.gain_spread, seed=args.seed)
+    print(f"Wrote {len(paths)} files to {args.folder}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+import io
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa_csv = None
+
+from Instrumentation import span
+
+'''
+Fast loading of capture CSVs in the toolkit's wide layout (a header of thousands of numeric bin
+centres, then one row of counts per channel, usually only a few dozen rows):
+- pd.read_csv spends most of its time building per-column state for the thousands of columns, so
+  the "numpy" engine parses the header once into the float axis and bulk-parses the body instead.
+- A body of plain non-negative integers (the normal case for counts) is parsed straight from its
+  bytes: ',' and '\\n' are the only bytes below '0', so one comparison over the buffer finds every
+  field end, and the values are accumulated digit by digit from the end of all fields at once.
+  Large bodies are split into row blocks parsed on threads (the numpy operations release the GIL).
+- Anything else (decimals, signs, blank fields) goes through np.loadtxt, and files it cannot parse
+  (quoted or unnamed headers, text cells, the two-column summed layout) through pandas, so every
+  engine returns the labels and values pd.read_csv would.
+- The "pyarrow" engine uses pyarrow's multithreaded CSV reader when pyarrow is installed.
+
+Engines are registered by name like the peak-detection backends, and are compared with:
+
+    python WideCSV.py capture_1.csv capture_2.csv --repeats 5
+'''
+
+DEFAULT_ENGINE = "numpy"
+# Bodies above this size are parsed in row blocks on several threads
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+# Longest integer field parsed directly (more digits could overflow int64)
+MAX_INTEGER_DIGITS = 18
+UTF8_BOM = b'\xef\xbb\xbf'
+
+_engines = {}
+
+
+def register_csv_engine(name, read):
+    """
+    Make a CSV engine selectable by its name.
+
+    Parameters:
+        name (str): Engine name shown in the GUI and accepted by read_capture.
+        read (callable): Takes a file path or binary stream and returns (column labels, values), the
+            values as a 2-D array, or as the DataFrame itself when pandas parsed the file.
+    """
+    _engines[name] = read
+
+
+def get_csv_engine(name=None):
+    """
+    Return the registered engine with this name (the default engine when name is None).
+
+    Raises:
+        ValueError: If no engine has this name.
+    """
+    name = name or DEFAULT_ENGINE
+    if name not in _engines:
+        raise ValueError(f"Unknown CSV engine '{name}'. Available: {', '.join(_engines)}")
+    return _engines[name]
+
+
+def csv_engine_names():
+    return list(_engines)
+
+
+def _read_bytes(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    return source.read()
+
+
+###### ENGINES ######
+
+def _read_pandas(source):
+    df = pd.read_csv(source)
+    return list(df.columns), df
+
+
+def parse_counts(body, num_columns):
+    """
+    Parse a CSV body of non-negative integers straight from its bytes.
+
+    Parameters:
+        body (bytes or memoryview): Rows of comma-separated digits, each ending with '\\n'.
+        num_columns (int): Fields per row.
+
+    Returns:
+        np.ndarray: Shaped (num_rows, num_columns), uint32 or int64, or None when the body is not
+            a rectangle of plain integers.
+    """
+    buffer = np.frombuffer(body, dtype=np.uint8)
+    if not buffer.size or buffer.max() > ord('9'):
+        return None
+    ends = np.flatnonzero(buffer < ord('0'))
+    if not ends.size or ends.size % num_columns or ends[-1] != buffer.size - 1:
+        return None
+    # Every field end is a ',' or a '\n', and the newlines are exactly the ends of the rows
+    num_rows = ends.size // num_columns
+    if (np.count_nonzero(buffer == ord('\n')) != num_rows or np.count_nonzero(buffer == ord(',')) != ends.size - num_rows
+            or not (buffer[ends[num_columns - 1::num_columns]] == ord('\n')).all()):
+        return None
+    lengths = np.empty(ends.size, dtype=np.int64)
+    lengths[0] = ends[0]
+    np.subtract(ends[1:], ends[:-1], out=lengths[1:])
+    lengths[1:] -= 1
+    shortest, longest = int(lengths.min()), int(lengths.max())
+    if shortest == 0 or longest > MAX_INTEGER_DIGITS:
+        return None
+
+    dtype = np.uint32 if longest <= 9 else np.int64
+    values = buffer[ends - 1].astype(dtype)
+    values -= ord('0')
+    digits = np.empty(ends.size, dtype=dtype)
+    for position in range(2, longest + 1):
+        # Digit `position` places before each field end; fields shorter than that contribute 0
+        np.subtract(buffer[ends - position], ord('0'), out=digits, casting='unsafe')
+        digits *= dtype(10 ** (position - 1))
+        if position > shortest:
+            digits *= lengths >= position
+        values += digits
+    return values.reshape(-1, num_columns)
+
+
+def _parse_body(data, start, stop, num_columns):
+    """
+    Integer fast path over data[start:stop], split into row blocks on threads for large bodies.
+
+    Returns:
+        np.ndarray: Parsed counts, or None when the fast path does not apply.
+    """
+    view = memoryview(data)
+    workers = min(os.cpu_count() or 1, (stop - start) // PARALLEL_MIN_BYTES)
+    if workers <= 1:
+        return parse_counts(view[start:stop], num_columns)
+    bounds = [start]
+    for block in range(1, workers):
+        # Blocks end just after a newline, so each holds whole rows
+        cut = data.find(b'\n', start + block * (stop - start) // workers, stop)
+        if cut < 0:
+            break
+        if cut + 1 > bounds[-1]:
+            bounds.append(cut + 1)
+    if bounds[-1] != stop:
+        bounds.append(stop)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        blocks = list(pool.map(lambda bound: parse_counts(view[bound[0]:bound[1]], num_columns),
+                               zip(bounds[:-1], bounds[1:])))
+    if any(block is None for block in blocks):
+        return None
+    dtype = np.result_type(*blocks)
+    return np.concatenate([block.astype(dtype, copy=False) for block in blocks])
+
+
+def _read_numpy(source):
+    data = _read_bytes(source)
+    # Files saved by Excel and other Windows tools start with a UTF-8 byte order mark; it is skipped
+    # by offset so the body is not copied (pandas strips it itself)
+    begin = len(UTF8_BOM) if data.startswith(UTF8_BOM) else 0
+    newline = data.find(b'\n', begin)
+    if newline < 0:
+        return _read_pandas(io.BytesIO(data))
+    header = data[begin:newline].rstrip(b'\r')
+    labels = header.decode('utf-8', errors='replace').split(',')
+    # Layouts and headers pandas treats specially are left to pandas
+    if len(labels) == 2 or b'"' in header or not all(labels) or len(set(labels)) != len(labels):
+        return _read_pandas(io.BytesIO(data))
+
+    end = len(data)
+    while end > newline + 1 and data[end - 1] in b'\r\n':
+        end -= 1
+    if end == newline + 1:
+        return _read_pandas(io.BytesIO(data))
+    if data.find(b'\r', newline + 1) < 0 and data[end:end + 1] == b'\n':
+        # The body already ends with a single newline, so it is parsed in place
+        body, start, stop = data, newline + 1, end + 1
+    else:
+        body = data[newline + 1:end].replace(b'\r', b'') + b'\n'
+        start, stop = 0, len(body)
+    with span("csv.parse_body"):
+        values = _parse_body(body, start, stop, len(labels))
+        if values is None:
+            try:
+                values = np.loadtxt(io.BytesIO(memoryview(body)[start:stop]), delimiter=',', ndmin=2)
+            except ValueError:
+                return _read_pandas(io.BytesIO(data))
+    if values.shape[1] != len(labels):
+        return _read_pandas(io.BytesIO(data))
+    return labels, values
+
+
+def _read_pyarrow(source):
+    table = pa_csv.read_csv(source, read_options=pa_csv.ReadOptions(use_threads=True))
+    return list(table.column_names), np.column_stack([column.to_numpy() for column in table.columns])
+
+
+register_csv_engine("numpy", _read_numpy)
+register_csv_engine("pandas", _read_pandas)
+if pa_csv is not None:
+    register_csv_engine("pyarrow", _read_pyarrow)
+
+
+###### CAPTURE READERS ######
+
+def parse_axis(labels):
+    """Float axis from header labels; labels that are not numbers become NaN, as with pd.to_numeric."""
+    try:
+        return np.array(labels, dtype=np.float64)
+    except ValueError:
+        return pd.to_numeric(pd.Index(labels), errors='coerce').to_numpy(dtype=np.float64)
+
+
+def read_capture(source, engine=None):
+    """
+    Read a capture CSV without building a DataFrame.
+
+    Parameters:
+        source (str or file-like): File path or binary stream.
+        engine (str): Registered engine name, or None for the default.
+
+    Returns:
+        tuple: (x_values, counts shaped (num_channels, num_bins), single_channel). A two-column
+            (Channel/Energy, Counts) file is returned as a single channel.
+    """
+    return capture_arrays(*get_csv_engine(engine)(source))
+
+
+def capture_arrays(labels, values):
+    """
+    Axis and counts of a capture from the column labels and values returned by an engine.
+
+    Returns:
+        tuple: (x_values, counts shaped (num_channels, num_bins), single_channel).
+    """
+    values = np.asarray(values)
+    if len(labels) == 2:
+        x_values = pd.to_numeric(pd.Series(values[:, 0]), errors='coerce').to_numpy(dtype=np.float64)
+        return x_values, values[:, 1][np.newaxis, :], True
+    return parse_axis(labels), values, False
+
+
+def read_dataframe(source, engine=None):
+    """
+    Read a capture CSV into a DataFrame with the labels and values pd.read_csv would produce, parsed by
+    the selected engine (when any field is a decimal or blank every column is float, where pandas only
+    converts the columns that have one).
+    """
+    labels, values = get_csv_engine(engine)(source)
+    if isinstance(values, pd.DataFrame):
+        return values
+    if values.dtype.kind == "u":
+        values = values.astype(np.int64)
+    return pd.DataFrame(values, columns=labels)
+
+
+###### BENCHMARK ######
+
+def benchmark_engines(file_paths, repeats=5):
+    """
+    Time every engine on the same files and check that they agree.
+
+    Returns:
+        dict: Engine name -> timing dict (see BenchmarkSuite.time_operation) with the parse
+            throughput in MB/s and whether its counts match the pandas engine.
+    """
+    from BenchmarkSuite import time_operation
+
+    total_bytes = sum(os.path.getsize(path) for path in file_paths)
+    reference = [read_capture(path, "pandas") for path in file_paths]
+    results = {}
+    for engine in csv_engine_names():
+        timing = time_operation(lambda: [read_capture(path, engine) for path in file_paths], repeats)
+        loaded = [read_capture(path, engine) for path in file_paths]
+        timing["mb_per_s"] = total_bytes / timing["median_s"] / 1e6 if timing["median_s"] else float("inf")
+        timing["matches_pandas"] = all(
+            np.array_equal(x_values, ref_x, equal_nan=True) and np.array_equal(counts, ref_counts, equal_nan=True)
+            for (x_values, counts, _), (ref_x, ref_counts, _) in zip(loaded, reference))
+        results[engine] = timing
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the CSV engines on capture files.")
+    parser.add_argument("files", nargs="+", help="capture CSV files")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    size = sum(os.path.getsize(path) for path in args.files) / 1e6
+    print(f"{len(args.files)} file(s), {size:.1f} MB")
+    print(f"{'engine':<10} {'median':>10} {'MB/s':>8}  matches pandas")
+    for engine, timing in benchmark_engines(args.files, args.repeats).items():
+        print(f"{engine:<10} {timing['median_s'] * 1000:8.2f}ms {timing['mb_per_s']:8.1f}  {timing['matches_pandas']}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())